@@ -0,0 +1,199 @@
+"""Materialized subject performance analytics per class, stream and term.
+
+For every exam set and subject the subject_analytics table holds the
+number of students scored, mean, median, pass rate, grade distribution
+against grading_system and the mean of boys and girls, for each stream and
+for the whole class (stream ''). A class and term is recomputed in one
+vectorized pass over its marks and the result kept until its marks or the
+grading scale change: analytics_state remembers the stream_versions total
+and grading version it was computed from, so a dashboard view after a save
+refreshes it once and every other view is a plain indexed read on a
+read-only connection.
+"""
+import json
+import warnings
+
+import numpy as np
+
+from archive import archived_table
+from grading import GradeScale, subject_totals
+from marks_long import marks_source
+from marks_schema import EXAM_SETS, MARK_COLUMNS, SUBJECT_CODES
+
+# Stream value of the rows aggregating every stream of a class
+WHOLE_CLASS = ''
+
+ANALYTICS_COLUMNS = (
+    'exam_set', 'stream', 'subject', 'students', 'mean', 'median', 'passed', 'pass_rate',
+    'grades', 'male_students', 'male_mean', 'female_students', 'female_mean',
+)
+
+
+def create_analytics_tables(conn):
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS subject_analytics (
+            class_level TEXT NOT NULL,
+            year INTEGER NOT NULL,
+            term TEXT NOT NULL,
+            exam_set TEXT NOT NULL,
+            stream TEXT NOT NULL,
+            subject TEXT NOT NULL,
+            students INTEGER NOT NULL,
+            mean REAL,
+            median REAL,
+            passed INTEGER,
+            pass_rate REAL,
+            grades TEXT,
+            male_students INTEGER,
+            male_mean REAL,
+            female_students INTEGER,
+            female_mean REAL,
+            PRIMARY KEY (class_level, year, term, exam_set, stream, subject)
+        ) WITHOUT ROWID
+    ''')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS analytics_state (
+            class_level TEXT NOT NULL,
+            year INTEGER NOT NULL,
+            term TEXT NOT NULL,
+            marks_version INTEGER NOT NULL,
+            grading_version INTEGER NOT NULL,
+            refreshed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (class_level, year, term)
+        ) WITHOUT ROWID
+    ''')
+
+
+def source_versions(conn, class_level, year, term):
+    """(marks version, grading version) the analytics of a class/term depend on"""
+    marks_version = conn.execute('''
+        SELECT COALESCE(SUM(version), 0) FROM stream_versions
+        WHERE class_level = ? AND year = ? AND term = ?
+    ''', (class_level, year, term)).fetchone()[0]
+    grading_version = conn.execute(
+        "SELECT value FROM app_meta WHERE key = 'version:grading_system'"
+    ).fetchone()
+    return int(marks_version), int(grading_version[0]) if grading_version else 0
+
+
+def is_stale(conn, class_level, year, term):
+    state = conn.execute('''
+        SELECT marks_version, grading_version FROM analytics_state
+        WHERE class_level = ? AND year = ? AND term = ?
+    ''', (class_level, year, term)).fetchone()
+    return state is None or tuple(state) != source_versions(conn, class_level, year, term)
+
+
+def needs_refresh(conn, class_level, year, term, force=False):
+    """True if a live (not archived) class and term has stale analytics, or any with force"""
+    if archived_table(conn, 'subject_analytics', year) is not None:
+        return False
+    return force or is_stale(conn, class_level, year, term)
+
+
+def _round(values, digits=1):
+    return [None if np.isnan(value) else round(float(value), digits) for value in values]
+
+
+def _aggregate(totals, genders, scale):
+    """Per-subject aggregates of one group of students, skipping unscored subjects"""
+    scored = ~np.isnan(totals)
+    counts = scored.sum(axis=0)
+    with np.errstate(invalid='ignore', divide='ignore'), warnings.catch_warnings():
+        warnings.simplefilter('ignore', RuntimeWarning)
+        means = np.nanmean(totals, axis=0)
+        medians = np.nanmedian(totals, axis=0)
+        passed = (totals >= scale.pass_mark).sum(axis=0)
+        pass_rates = passed / counts * 100
+        by_gender = {
+            gender: (scored[genders == gender].sum(axis=0), np.nanmean(totals[genders == gender], axis=0))
+            for gender in ('M', 'F')
+        }
+
+    grades = scale.lookup(totals)
+    distribution = {
+        grade: (grades == grade).sum(axis=0)
+        for grade in scale.grades[:-1]
+    }
+    means, medians, pass_rates = _round(means), _round(medians), _round(pass_rates)
+    gender_means = {gender: _round(values[1]) for gender, values in by_gender.items()}
+
+    for j, code in enumerate(SUBJECT_CODES):
+        if not counts[j]:
+            continue
+        yield (
+            code, int(counts[j]), means[j], medians[j], int(passed[j]), pass_rates[j],
+            json.dumps({grade: int(values[j]) for grade, values in distribution.items()}),
+            int(by_gender['M'][0][j]), gender_means['M'][j],
+            int(by_gender['F'][0][j]), gender_means['F'][j],
+        )
+
+
+def refresh(conn, class_level, year, term, grading):
+    """Recompute the analytics of one class and term and record its versions.
+
+    The caller commits. Returns the number of aggregate rows written.
+    """
+    marks_version, grading_version = source_versions(conn, class_level, year, term)
+    students = conn.execute(f'''
+        SELECT stream, gender, {', '.join(MARK_COLUMNS)} FROM {marks_source(conn, class_level)}
+        WHERE year = ? AND term = ? AND std_no IS NOT NULL
+    ''', (year, term)).fetchall()
+    conn.execute('''
+        DELETE FROM subject_analytics WHERE class_level = ? AND year = ? AND term = ?
+    ''', (class_level, year, term))
+
+    scale = GradeScale(grading)
+    streams = np.array([student[0] or '' for student in students], dtype=object)
+    genders = np.array([str(student[1] or '').strip().upper()[:1] for student in students], dtype=object)
+    marks = [dict(zip(MARK_COLUMNS, student[2:])) for student in students]
+    rows = []
+    for exam_set in EXAM_SETS:
+        totals = subject_totals(marks, exam_set) if marks else np.empty((0, len(SUBJECT_CODES)))
+        groups = [(WHOLE_CLASS, np.ones(len(marks), dtype=bool))]
+        groups += [(stream, streams == stream) for stream in sorted(set(streams))]
+        for stream, mask in groups:
+            for aggregate in _aggregate(totals[mask], genders[mask], scale):
+                rows.append((class_level, year, term, exam_set, stream) + aggregate)
+
+    conn.executemany(f'''
+        INSERT INTO subject_analytics (class_level, year, term, {', '.join(ANALYTICS_COLUMNS)})
+        VALUES ({', '.join('?' * (len(ANALYTICS_COLUMNS) + 3))})
+    ''', rows)
+    conn.execute('''
+        INSERT INTO analytics_state (class_level, year, term, marks_version, grading_version)
+        VALUES (?, ?, ?, ?, ?)
+        ON CONFLICT(class_level, year, term) DO UPDATE SET
+            marks_version = excluded.marks_version,
+            grading_version = excluded.grading_version,
+            refreshed_at = CURRENT_TIMESTAMP
+    ''', (class_level, year, term, marks_version, grading_version))
+    return len(rows)
+
+
+def subject_analytics(conn, class_level, year, term, stream=None, exam_set=None):
+    """Aggregates of a class and term as last refreshed.
+
+    Only reads: check needs_refresh() and refresh() on a writable
+    connection first. stream=None returns every stream and the whole-class
+    rows; exam_set=None returns every exam set. An archived year is read as
+    it was archived.
+    """
+    table = archived_table(conn, 'subject_analytics', year)
+    query = f'''
+        SELECT {', '.join(ANALYTICS_COLUMNS)} FROM {table or 'subject_analytics'}
+        WHERE class_level = ? AND year = ? AND term = ?
+    '''
+    params = [class_level, year, term]
+    if stream is not None:
+        query += ' AND stream = ?'
+        params.append(stream)
+    if exam_set is not None:
+        query += ' AND exam_set = ?'
+        params.append(exam_set)
+    rows = []
+    for row in conn.execute(query + ' ORDER BY exam_set, stream, subject', params):
+        row = dict(zip(ANALYTICS_COLUMNS, row))
+        row['grades'] = json.loads(row['grades'])
+        rows.append(row)
+    return rows
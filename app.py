@@ -1,21 +1,53 @@
-from flask import Flask, render_template, request, jsonify, session, redirect, url_for, flash, send_file
+from flask import Flask, render_template, request, jsonify, session, redirect, url_for, flash, send_file, Response, stream_with_context
 import sqlite3
 import hashlib
 import os
 from datetime import datetime, date
 import json
-import pandas as pd
-from io import BytesIO
 import base64
 import random
 
+import compression
+import analytics as analytics_store
+from archive import year_source
+import bursary as bursary_store
+from database import get_db, init_app as init_db
+import reference_cache
+from exports import XLSX_MIMETYPE, export_sheets, iter_csv, write_xlsx
+from grading import compute_results
+from imports import import_students, read_rows
+import library as library_store
+import metrics
+from marks_schema import EXAM_SETS, SUBJECT_CODES, subject_code
+from marks_store import check_class_table, load_stream, projection_columns, save_cells, save_students
+from migrations import run_migrations
+import promotion
+from rankings import stream_rankings, student_ranking
+import report_pdf
+from statements import import_statement
+from stream_versions import stream_version
+
 app = Flask(__name__)
 app.secret_key = 'your-secret-key-here-change-in-production'
+init_db(app)
+compression.init_app(app)
+metrics.init_app(app)
 
-def get_db_connection():
-    conn = sqlite3.connect('school_management.db')
-    conn.row_factory = sqlite3.Row
-    return conn
+def get_db_connection(readonly=False):
+    """Connection shared by the current request, see database.py"""
+    return get_db(readonly)
+
+def migrate_database():
+    """Apply pending schema migrations before the app serves requests"""
+    conn = get_db_connection()
+    try:
+        run_migrations(conn)
+    except sqlite3.Error as e:
+        print(f"Database migration error: {e}")
+    finally:
+        conn.close()
+
+migrate_database()
 
 def hash_password(password):
     return hashlib.sha256(password.encode()).hexdigest()
@@ -31,23 +63,36 @@ def check_role(allowed_roles):
     user_role = session.get('role')
     return user_role in allowed_roles
 
+# Seconds before the cached deadline is re-read even without an admin change
+DEADLINE_TTL = 300
+
+def load_active_deadline(conn):
+    """Date of the latest active marks entry deadline, or None"""
+    deadline = conn.execute('''
+        SELECT deadline_date FROM deadlines 
+        WHERE is_active = 1 
+        ORDER BY deadline_date DESC LIMIT 1
+    ''').fetchone()
+    if not deadline:
+        return None
+    try:
+        return datetime.strptime(deadline['deadline_date'], '%Y-%m-%d').date()
+    except (TypeError, ValueError):
+        print(f"Ignoring malformed deadline: {deadline['deadline_date']!r}")
+        return None
+
 def check_deadline():
-    conn = get_db_connection()
-    current_date = date.today()
+    """True while marks entry is still open"""
+    conn = get_db_connection(readonly=True)
     try:
-        deadline = conn.execute('''
-            SELECT deadline_date FROM deadlines 
-            WHERE is_active = 1 
-            ORDER BY deadline_date DESC LIMIT 1
-        ''').fetchone()
-        conn.close()
-        
-        if deadline and current_date > datetime.strptime(deadline['deadline_date'], '%Y-%m-%d').date():
-            return False
-        return True
-    except:
-        conn.close()
+        deadline = reference_cache.get(conn, 'deadlines', load_active_deadline, ttl=DEADLINE_TTL)
+    except sqlite3.Error as e:
+        print(f"Deadline check error: {e}")
         return True  # If no deadline table or data, allow access
+    finally:
+        conn.close()
+    
+    return deadline is None or date.today() <= deadline
 
 @app.route('/')
 def index():
@@ -112,7 +157,7 @@ def manage_streams():
         else:
             try:
                 conn.execute('INSERT INTO streams (class_level, stream_name) VALUES (?, ?)', (class_level, stream_name))
-                conn.commit()
+                reference_cache.invalidate(conn, 'streams')
                 flash('Stream added successfully!', 'success')
             except sqlite3.Error as e:
                 flash(f'Database error: {e}', 'error')
@@ -153,7 +198,7 @@ def manage_subjects():
                     'INSERT INTO subjects (subject_initial, subject_full_name) VALUES (?, ?)',
                     (subject_initial, subject_full_name)
                 )
-                conn.commit()
+                reference_cache.invalidate(conn, 'subjects')
                 flash('Subject added successfully!', 'success')
             except sqlite3.Error as e:
                 flash(f'Database error: {e}', 'error')
@@ -217,6 +262,137 @@ def admin_panel():
     
     return render_template('admin.html')
 
+@app.route('/admin/settings', methods=['POST'])
+def save_school_settings():
+    if not check_auth():
+        return jsonify({'success': False, 'message': 'Authentication required'}), 401
+    
+    if not check_admin():
+        return jsonify({'success': False, 'message': 'Access denied'}), 403
+    
+    fields = ['school_name', 'school_email', 'school_motto', 'school_address',
+              'school_box', 'school_contacts', 'school_logo']
+    values = [request.form.get(field, '').strip() for field in fields]
+    
+    conn = get_db_connection()
+    try:
+        # Reports read the latest settings row
+        conn.execute(f'''
+            INSERT INTO admin_settings ({', '.join(fields)})
+            VALUES ({', '.join('?' * len(fields))})
+        ''', values)
+        reference_cache.invalidate(conn, 'admin_settings')
+        return jsonify({'success': True, 'message': 'School settings saved successfully!'})
+    except sqlite3.Error as e:
+        return jsonify({'success': False, 'message': f'Database error: {str(e)}'}), 500
+    finally:
+        conn.close()
+
+@app.route('/admin/deadline', methods=['POST'])
+def set_deadline():
+    if not check_auth():
+        return jsonify({'success': False, 'message': 'Authentication required'}), 401
+    
+    if not check_admin():
+        return jsonify({'success': False, 'message': 'Access denied'}), 403
+    
+    deadline_date = request.form.get('deadline_date', '').strip()
+    try:
+        datetime.strptime(deadline_date, '%Y-%m-%d')
+    except ValueError:
+        return jsonify({'success': False, 'message': 'Deadline must be a date in YYYY-MM-DD format'}), 400
+    
+    conn = get_db_connection()
+    try:
+        # The new deadline replaces any active one
+        conn.execute('UPDATE deadlines SET is_active = 0 WHERE is_active = 1')
+        conn.execute('''
+            INSERT INTO deadlines (term, year, deadline_date, is_active)
+            VALUES (?, ?, ?, 1)
+        ''', (request.form.get('term'), request.form.get('year'), deadline_date))
+        reference_cache.invalidate(conn, 'deadlines')
+        return jsonify({'success': True, 'message': f'Deadline set to {deadline_date}'})
+    except sqlite3.Error as e:
+        return jsonify({'success': False, 'message': f'Database error: {str(e)}'}), 500
+    finally:
+        conn.close()
+
+@app.route('/admin/promote', methods=['POST'])
+def promote_students():
+    """Year-end promotion of every class, see promotion.py.
+
+    Form fields: year, optional repeating (student numbers staying in their
+    class, comma separated) and dry_run=1 to only preview the counts.
+    """
+    if not check_auth():
+        return jsonify({'success': False, 'message': 'Authentication required'}), 401
+    
+    if not check_admin():
+        return jsonify({'success': False, 'message': 'Access denied'}), 403
+    
+    year = request.form.get('year', type=int)
+    if not year:
+        return jsonify({'success': False, 'message': 'Year is required'}), 400
+    try:
+        repeating = [int(std_no) for std_no in request.form.get('repeating', '').replace(',', ' ').split()]
+    except ValueError:
+        return jsonify({'success': False, 'message': 'Repeating students must be student numbers'}), 400
+    
+    conn = get_db_connection()
+    try:
+        if request.form.get('dry_run') in ('1', 'true', 'on'):
+            return jsonify({'success': True, 'dry_run': True, 'plan': promotion.promotion_plan(conn, year, repeating)})
+        plan, snapshot = promotion.promote(conn, year, repeating, snapshot_dir=promotion.default_snapshot_dir(conn))
+        return jsonify({
+            'success': True, 'dry_run': False, 'plan': plan, 'snapshot': os.path.basename(snapshot),
+            'message': f'Students of {year} promoted to {year + 1}'
+        })
+    except sqlite3.Error as e:
+        return jsonify({'success': False, 'message': f'Database error: {str(e)}'}), 500
+    finally:
+        conn.close()
+
+@app.route('/admin/delete_student', methods=['POST'])
+def delete_student():
+    """Move a student's rows of a class into the LEFT table"""
+    if not check_auth():
+        return jsonify({'success': False, 'message': 'Authentication required'}), 401
+    
+    if not check_admin():
+        return jsonify({'success': False, 'message': 'Access denied'}), 403
+    
+    class_level = request.form.get('class')
+    std_no = request.form.get('std_no', type=int)
+    reason = request.form.get('reason', '').strip() or 'Deleted'
+    if not class_level or not std_no:
+        return jsonify({'success': False, 'message': 'Class and student number are required'}), 400
+    
+    conn = get_db_connection()
+    try:
+        promotion.leave_student(conn, check_class_table(class_level), std_no, reason)
+        return jsonify({'success': True, 'message': f'Student {std_no} moved to the left students'})
+    except ValueError as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
+    except LookupError as e:
+        return jsonify({'success': False, 'message': str(e)}), 404
+    except sqlite3.Error as e:
+        return jsonify({'success': False, 'message': f'Database error: {str(e)}'}), 500
+    finally:
+        conn.close()
+
+@app.route('/admin/metrics')
+def admin_metrics():
+    """Per-route latency, SQL time and slow queries of this worker process"""
+    if not check_auth():
+        return jsonify({'success': False, 'message': 'Authentication required'}), 401
+    
+    if not check_admin():
+        return jsonify({'success': False, 'message': 'Access denied'}), 403
+    
+    if request.args.get('format') == 'prometheus':
+        return Response(metrics.prometheus_text(), mimetype='text/plain; version=0.0.4')
+    return jsonify({'success': True, 'metrics': metrics.snapshot()})
+
 @app.route('/library')
 def library():
     if not check_auth():
@@ -230,6 +406,136 @@ def library():
     
     return render_template('library.html')
 
+def check_library_access():
+    return check_auth() and check_role(['admin', 'librarian', 'headteacher'])
+
+@app.route('/api/library/books')
+def list_books():
+    """Paginated catalog listing; q searches title, author, ISBN and category"""
+    if not check_library_access():
+        return jsonify({'error': 'Access denied'}), 403
+    
+    conn = get_db_connection(readonly=True)
+    try:
+        return jsonify(library_store.list_books(
+            conn, request.args.get('q'), request.args.get('category'),
+            request.args.get('page'), request.args.get('per_page')
+        ))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except sqlite3.Error as e:
+        return jsonify({'error': f'Database error: {str(e)}'}), 500
+    finally:
+        conn.close()
+
+@app.route('/api/library/books', methods=['POST'])
+def add_book():
+    if not check_library_access():
+        return jsonify({'success': False, 'message': 'Access denied'})
+    
+    conn = get_db_connection()
+    try:
+        book_id = library_store.add_book(conn, request.json)
+        return jsonify({'success': True, 'id': book_id, 'message': 'Book added successfully'})
+    except ValueError as e:
+        return jsonify({'success': False, 'message': str(e)})
+    except sqlite3.Error as e:
+        return jsonify({'success': False, 'message': f'Database error: {str(e)}'})
+    finally:
+        conn.close()
+
+@app.route('/api/library/books/<int:book_id>', methods=['PUT', 'DELETE'])
+def edit_book(book_id):
+    if not check_library_access():
+        return jsonify({'success': False, 'message': 'Access denied'})
+    
+    conn = get_db_connection()
+    try:
+        if request.method == 'DELETE':
+            library_store.delete_book(conn, book_id)
+            return jsonify({'success': True, 'message': 'Book deleted successfully'})
+        library_store.update_book(conn, book_id, request.json)
+        return jsonify({'success': True, 'message': 'Book updated successfully'})
+    except (LookupError, ValueError) as e:
+        return jsonify({'success': False, 'message': str(e)})
+    except sqlite3.Error as e:
+        return jsonify({'success': False, 'message': f'Database error: {str(e)}'})
+    finally:
+        conn.close()
+
+@app.route('/api/library/issue', methods=['POST'])
+def issue_book():
+    if not check_library_access():
+        return jsonify({'success': False, 'message': 'Access denied'})
+    
+    data = request.json
+    if not data.get('book_id') or not data.get('std_no') or not data.get('return_date'):
+        return jsonify({'success': False, 'message': 'Book, student number and return date are required'})
+    
+    conn = get_db_connection()
+    try:
+        borrowing_id = library_store.issue_book(
+            conn, data['book_id'], data['std_no'], data.get('class_level'), data['return_date'])
+        return jsonify({'success': True, 'id': borrowing_id, 'message': 'Book issued successfully'})
+    except (LookupError, ValueError) as e:
+        return jsonify({'success': False, 'message': str(e)})
+    except sqlite3.Error as e:
+        return jsonify({'success': False, 'message': f'Database error: {str(e)}'})
+    finally:
+        conn.close()
+
+@app.route('/api/library/return', methods=['POST'])
+def return_book():
+    if not check_library_access():
+        return jsonify({'success': False, 'message': 'Access denied'})
+    
+    data = request.json
+    if not data.get('borrowing_id'):
+        return jsonify({'success': False, 'message': 'Select the book to return'})
+    
+    conn = get_db_connection()
+    try:
+        fine = library_store.return_book(conn, data['borrowing_id'], data.get('fine_amount'))
+        message = f'Book returned successfully. Fine charged: UGX {fine:,.0f}' if fine else 'Book returned successfully'
+        return jsonify({'success': True, 'fine_amount': fine, 'message': message})
+    except (LookupError, ValueError) as e:
+        return jsonify({'success': False, 'message': str(e)})
+    except sqlite3.Error as e:
+        return jsonify({'success': False, 'message': f'Database error: {str(e)}'})
+    finally:
+        conn.close()
+
+@app.route('/api/library/borrowings/<int:std_no>')
+def student_borrowings(std_no):
+    if not check_library_access():
+        return jsonify({'error': 'Access denied'}), 403
+    
+    conn = get_db_connection(readonly=True)
+    try:
+        return jsonify(library_store.student_borrowings(conn, std_no))
+    except sqlite3.Error as e:
+        return jsonify({'error': f'Database error: {str(e)}'}), 500
+    finally:
+        conn.close()
+
+@app.route('/api/library/stats')
+def library_stats():
+    """Library counters as last materialized; fines_updated_on is the date
+    scripts/update_library_fines.py last accrued the overdue fines"""
+    if not check_library_access():
+        return jsonify({'error': 'Access denied'}), 403
+    
+    conn = get_db_connection(readonly=True)
+    try:
+        stats = library_store.library_stats(conn)
+        if stats is None:
+            return jsonify({'error': 'Library statistics are not set up; run the migrations'}), 500
+        return jsonify(stats)
+    except sqlite3.Error as e:
+        return jsonify({'error': f'Database error: {str(e)}'}), 500
+    finally:
+        conn.close()
+
 @app.route('/bursary')
 def bursary():
     if not check_auth():
@@ -243,42 +549,232 @@ def bursary():
     
     return render_template('bursary.html')
 
+def check_bursary_access():
+    return check_auth() and check_role(['admin', 'bursar', 'headteacher'])
+
+@app.route('/api/bursary/payments', methods=['GET', 'POST'])
+def bursary_payments():
+    """GET lists the latest payments; POST records one and returns the new balance"""
+    if not check_bursary_access():
+        if request.method == 'GET':
+            return jsonify({'error': 'Access denied'}), 403
+        return jsonify({'success': False, 'message': 'Access denied'})
+    
+    conn = get_db_connection(readonly=request.method == 'GET')
+    try:
+        if request.method == 'GET':
+            return jsonify(bursary_store.recent_payments(conn, request.args.get('limit', 20, type=int)))
+        payment_id, receipt_no, balance = bursary_store.record_payment(conn, request.json)
+        return jsonify({
+            'success': True, 'id': payment_id, 'receipt_no': receipt_no, 'balance': balance,
+            'message': f'Payment recorded successfully. Receipt Number: {receipt_no}'
+        })
+    except ValueError as e:
+        return jsonify({'success': False, 'message': str(e)})
+    except sqlite3.Error as e:
+        if request.method == 'GET':
+            return jsonify({'error': f'Database error: {str(e)}'}), 500
+        return jsonify({'success': False, 'message': f'Database error: {str(e)}'})
+    finally:
+        conn.close()
+
+@app.route('/api/bursary/receipt/<receipt_no>')
+def bursary_receipt(receipt_no):
+    if not check_bursary_access():
+        return jsonify({'error': 'Access denied'}), 403
+    
+    conn = get_db_connection(readonly=True)
+    try:
+        payment = bursary_store.find_receipt(conn, receipt_no)
+        if payment is None:
+            return jsonify({'error': 'Receipt not found'}), 404
+        return jsonify(payment)
+    except sqlite3.Error as e:
+        return jsonify({'error': f'Database error: {str(e)}'}), 500
+    finally:
+        conn.close()
+
+@app.route('/api/bursary/defaulters')
+def bursary_defaulters():
+    """Students owing at least min_balance for a term, optionally of one class"""
+    if not check_bursary_access():
+        return jsonify({'error': 'Access denied'}), 403
+    
+    year = request.args.get('year', type=int)
+    term = request.args.get('term')
+    if not year or not term:
+        return jsonify({'error': 'Year and term are required'}), 400
+    
+    conn = get_db_connection(readonly=True)
+    try:
+        return jsonify(bursary_store.defaulters(
+            conn, year, term, request.args.get('class') or None,
+            request.args.get('min_balance', 0.01, type=float), request.args.get('limit', type=int)
+        ))
+    except sqlite3.Error as e:
+        return jsonify({'error': f'Database error: {str(e)}'}), 500
+    finally:
+        conn.close()
+
+@app.route('/api/bursary/summary')
+def bursary_summary():
+    """Per-class and overall fees due, collected and outstanding for a term"""
+    if not check_bursary_access():
+        return jsonify({'error': 'Access denied'}), 403
+    
+    year = request.args.get('year', type=int)
+    term = request.args.get('term')
+    if not year or not term:
+        return jsonify({'error': 'Year and term are required'}), 400
+    
+    conn = get_db_connection(readonly=True)
+    try:
+        return jsonify(bursary_store.fees_summary(conn, year, term))
+    except sqlite3.Error as e:
+        return jsonify({'error': f'Database error: {str(e)}'}), 500
+    finally:
+        conn.close()
+
+@app.route('/api/bursary/ledger/<int:std_no>')
+def bursary_ledger(std_no):
+    if not check_bursary_access():
+        return jsonify({'error': 'Access denied'}), 403
+    
+    conn = get_db_connection(readonly=True)
+    try:
+        return jsonify(bursary_store.student_ledger(conn, std_no))
+    except sqlite3.Error as e:
+        return jsonify({'error': f'Database error: {str(e)}'}), 500
+    finally:
+        conn.close()
+
+@app.route('/api/bursary/import_statement', methods=['POST'])
+def bursary_import_statement():
+    """Record the payments of an uploaded bank or mobile-money statement.
+
+    Form fields: file (.xlsx or CSV), year, term and an optional
+    payment_method. With dry_run=1 nothing is written and the response only
+    reports what would be imported and the lines that do not match.
+    """
+    if not check_bursary_access():
+        return jsonify({'success': False, 'message': 'Access denied'})
+    
+    upload = request.files.get('file')
+    year = request.form.get('year', type=int)
+    term = request.form.get('term')
+    if not upload or not upload.filename or not year or not term:
+        return jsonify({'success': False, 'message': 'A file, year and term are required'})
+    
+    dry_run = request.form.get('dry_run') in ('1', 'true', 'on')
+    
+    conn = get_db_connection()
+    try:
+        report = import_statement(conn, read_rows(upload.stream, upload.filename), year, term,
+                                  request.form.get('payment_method') or None, dry_run)
+        return jsonify({'success': True, **report})
+    except ValueError as e:
+        return jsonify({'success': False, 'message': str(e)})
+    except sqlite3.Error as e:
+        return jsonify({'success': False, 'message': f'Database error: {str(e)}'})
+    finally:
+        conn.close()
+
 @app.route('/api/streams/<class_level>')
 def get_streams(class_level):
     if not check_auth():
         return jsonify({'error': 'Authentication required'}), 401
     
-    conn = get_db_connection()
+    conn = get_db_connection(readonly=True)
     try:
-        streams = conn.execute('''
-            SELECT DISTINCT stream_name FROM streams WHERE class_level = ?
-        ''', (class_level,)).fetchall()
-        return jsonify([stream['stream_name'] for stream in streams])
+        streams = reference_cache.get(conn, 'streams', load_streams)
+        return jsonify(streams.get(class_level, []))
     except sqlite3.Error:
         # If streams table doesn't exist, return default streams
         return jsonify(['A', 'B', 'C', 'D'])
     finally:
         conn.close()
 
-@app.route('/api/load_data', methods=['POST'])
+def permitted_subjects(conn):
+    """Subject codes a teacher's account is limited to, None if unrestricted.
+
+    A teacher whose subjects_taught names no known subject gets an empty
+    set: no subject at all rather than every one.
+    """
+    if session.get('role') != 'teacher':
+        return None
+    
+    user = conn.execute('SELECT subjects_taught FROM users WHERE user_id = ?', (session['user_id'],)).fetchone()
+    codes = {subject_code(label) for label in ((user and user['subjects_taught']) or '').split(',')}
+    codes.discard(None)
+    return codes
+
+def unknown_subjects(subjects_taught):
+    """Labels of a comma-separated subjects_taught that name no subject"""
+    labels = [label.strip() for label in (subjects_taught or '').split(',')]
+    return [label for label in labels if label and subject_code(label) is None]
+
+def load_data_request():
+    """Arguments of a marks load from the JSON body or the GET query string"""
+    if request.method == 'POST':
+        return request.json
+    args = request.args
+    data = {key: args.get(key) for key in ('class', 'stream', 'year', 'term')}
+    for key in ('subjects', 'components'):
+        values = [value for item in args.getlist(key) for value in item.split(',') if value]
+        data[key] = values or None
+    return data
+
+def marks_etag(version, data, columns):
+    """ETag of a marks load: the stream's change counter plus the projection"""
+    key = json.dumps([str(data[name]) for name in ('class', 'stream', 'year', 'term')] + list(columns))
+    return f"{version}-{hashlib.sha1(key.encode()).hexdigest()[:16]}"
+
+@app.route('/api/load_data', methods=['GET', 'POST'])
 def load_data():
     if not check_auth():
         return jsonify({'error': 'Authentication required'}), 401
     
-    data = request.json
+    data = load_data_request()
     class_level = data['class']
     stream = data['stream']
     year = data['year']
     term = data['term']
     
-    conn = get_db_connection()
+    conn = get_db_connection(readonly=True)
     try:
-        students = conn.execute(f'''
-            SELECT * FROM {class_level} 
-            WHERE stream = ? AND year = ? AND term = ?
-            ORDER BY std_no
-        ''', (stream, year, term)).fetchall()
-        return jsonify([dict(student) for student in students])
+        # Optional projection onto some subjects (codes or initials) and components
+        subjects = None
+        if data.get('subjects'):
+            subjects = []
+            for label in data['subjects']:
+                code = subject_code(label)
+                if code is None:
+                    return jsonify({'error': f'Unknown subject: {label}'}), 400
+                subjects.append(code)
+        
+        permitted = permitted_subjects(conn)
+        if permitted is not None:
+            subjects = [code for code in (subjects or SUBJECT_CODES) if code in permitted]
+        
+        columns = projection_columns(subjects, data.get('components'))
+        check_class_table(class_level)
+        
+        # Unchanged since the client's copy: answer 304 without running the query
+        version = stream_version(conn, class_level, stream, year, term)
+        etag = None if version is None else marks_etag(version, data, columns)
+        if etag and request.if_none_match.contains_weak(etag):
+            response = Response(status=304)
+        else:
+            response = jsonify(load_stream(conn, class_level, stream, year, term, columns))
+        
+        if etag:
+            response.set_etag(etag)
+            # Cached by the browser only, and revalidated before every use
+            response.headers['Cache-Control'] = 'private, no-cache'
+            response.vary.add('Cookie')
+        return response
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     except sqlite3.Error as e:
         return jsonify({'error': f'Database error: {str(e)}'}), 500
     finally:
@@ -296,332 +792,103 @@ def save_data():
     if not class_level or not students:
         return jsonify({'success': False, 'message': 'Invalid data'})
 
+    if not check_deadline() and not check_admin():
+        return jsonify({'success': False, 'message': 'Marks entry deadline has passed. Contact admin.'})
+
     conn = get_db_connection()
     try:
-        for student in students:
-            conn.execute(f'''
-                            INSERT INTO {class_level} (std_no, sdt_name, stream, year, term, gender, section, eng1, eng2, eng3, eng4, engBOT, engMOT, engEOT,
-                            mtc1, mtc2, mtc3, mtc4, mtcBOT, mtcMOT, mtcEOT,
-                            bio1, bio2, bio3, bio4, bioBOT, bioMOT, bioEOT,
-                            phy1, phy2, phy3, phy4, phyBOT, phyMOT, phyEOT,
-                            geo1, geo2, geo3, geo4, geoBOT, geoMOT, geoEOT,
-                            his1, his2, his3, his4, hisBOT, hisMOT, hisEOT,
-                            che1, che2, che3, che4, cheBOT, cheMOT, cheEOT,
-                            ict1, ict2, ict3, ict4, ictBOT, ictMOT, ictEOT,
-                            ent1, ent2, ent3, ent4, entBOT, entMOT, entEOT,
-                            cre1, cre2, cre3, cre4, creBOT, creMOT, creEOT,
-                            agr1, agr2, agr3, agr4, agrBOT, agrMOT, agrEOT,
-                            phe1, phe2, phe3, phe4, pheBOT, pheMOT, pheEOT,
-                            kis1, kis2, kis3, kis4, kisBOT, kisMOT, kisEOT,
-                            art1, art2, art3, art4, artBOT, artMOT, artEOT,
-                            ire1, ire2, ire3, ire4, ireBOT, ireMOT, ireEOT,
-                            lit1, lit2, lit3, lit4, litBOT, litMOT, litEOT,
-                            tad1, tad2, tad3, tad4, tadBOT, tadMOT, tadEOT,
-                            fsn1, fsn2, fsn3, fsn4, fsnBOT, fsnMOT, fsnEOT,
-                            lat1, lat2, lat3, lat4, latBOT, latMOT, latEOT,
-                            ate1, ate2, ate3, ate4, ateBOT, ateMOT, ateEOT,
-                            lum1, lum2, lum3, lum4, lumBOT, lumMOT, lumEOT,
-                            lug1, lug2, lug3, lug4, lugBOT, lugMOT, lugEOT,
-                            lus1, lus2, lus3, lus4, lusBOT, lusMOT, lusEOT,
-                            lba1, lba2, lba3, lba4, lbaBOT, lbaMOT, lbaEOT,
-                            lbl1, lbl2, lbl3, lbl4, lblBOT, lblMOT, lblEOT,
-                            run1, run2, run3, run4, runBOT, runMOT, runEOT,
-                            rut1, rut2, rut3, rut4, rutBOT, rutMOT, rutEOT,
-                            fre1, fre2, fre3, fre4, freBOT, freMOT, freEOT,
-                            ger1, ger2, ger3, ger4, gerBOT, gerMOT, gerEOT,
-                            dho1, dho2, dho3, dho4, dhoBOT, dhoMOT, dhoEOT)   
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?,
-                    ?, ?, ?, ?, ?, ?, ?,
-                    ?, ?, ?, ?, ?, ?, ?,
-                    ?, ?, ?, ?, ?, ?, ?,
-                    ?, ?, ?, ?, ?, ?, ?,
-                    ?, ?, ?, ?, ?, ?, ?,
-                    ?, ?, ?, ?, ?, ?, ?,
-                    ?, ?, ?, ?, ?, ?, ?,
-                    ?, ?, ?, ?, ?, ?, ?,
-                    ?, ?, ?, ?, ?, ?, ?,
-                    ?, ?, ?, ?, ?, ?, ?,
-                    ?, ?, ?, ?, ?, ?, ?,
-                    ?, ?, ?, ?, ?, ?, ?,
-                    ?, ?, ?, ?, ?, ?, ?,
-                    ?, ?, ?, ?, ?, ?, ?,
-                    ?, ?, ?, ?, ?, ?, ?,
-                    ?, ?, ?, ?, ?, ?, ?,
-                    ?, ?, ?, ?, ?, ?, ?,
-                    ?, ?, ?, ?, ?, ?, ?,
-                    ?, ?, ?, ?, ?, ?, ?,
-                    ?, ?, ?, ?, ?, ?, ?,
-                    ?, ?, ?, ?, ?, ?, ?,
-                    ?, ?, ?, ?, ?, ?, ?,
-                    ?, ?, ?, ?, ?, ?, ?,
-                    ?, ?, ?, ?, ?, ?, ?,
-                    ?, ?, ?, ?, ?, ?, ?,
-                    ?, ?, ?, ?, ?, ?, ?,
-                    ?, ?, ?, ?, ?, ?, ?,
-                    ?, ?, ?, ?, ?, ?, ?,
-                    ?, ?, ?, ?, ?, ?, ?,
-                    ?, ?, ?, ?, ?, ?, ?,
-                    ?, ?, ?, ?, ?, ?, ?,
-                    ?, ?, ?, ?, ?, ?, ?,
-                    ?, ?, ?, ?, ?, ?, ?)
-            ON CONFLICT(std_no) DO UPDATE SET
-                sdt_name = excluded.sdt_name,
-                stream = excluded.stream,
-                year = excluded.year,
-                term = excluded.term,
-                gender = excluded.gender,
-                section = excluded.section,
-                eng1 = excluded.eng1,
-                eng2 = excluded.eng2,
-                eng3 = excluded.eng3,
-                eng4 = excluded.eng4,
-                engBOT = excluded.engBOT,
-                engMOT = excluded.engMOT,
-                engEOT = excluded.engEOT,
-                mtc1 = excluded.mtc1,
-                mtc2 = excluded.mtc2,
-                mtc3 = excluded.mtc3,
-                mtc4 = excluded.mtc4,
-                mtcBOT = excluded.mtcBOT,
-                mtcMOT = excluded.mtcMOT,
-                mtcEOT = excluded.mtcEOT,
-                bio1 = excluded.bio1,
-                bio2 = excluded.bio2,
-                bio3 = excluded.bio3,
-                bio4 = excluded.bio4,
-                bioBOT = excluded.bioBOT,
-                bioMOT = excluded.bioMOT,
-                bioEOT = excluded.bioEOT,
-                phy1 = excluded.phy1,
-                phy2 = excluded.phy2,
-                phy3 = excluded.phy3,
-                phy4 = excluded.phy4,
-                phyBOT = excluded.phyBOT,
-                phyMOT = excluded.phyMOT,
-                phyEOT = excluded.phyEOT,
-                geo1 = excluded.geo1,
-                geo2 = excluded.geo2,
-                geo3 = excluded.geo3,
-                geo4 = excluded.geo4,
-                geoBOT = excluded.geoBOT,
-                geoMOT = excluded.geoMOT,
-                geoEOT = excluded.geoEOT,
-                his1 = excluded.his1,
-                his2 = excluded.his2,
-                his3 = excluded.his3,
-                his4 = excluded.his4,
-                hisBOT = excluded.hisBOT,
-                hisMOT = excluded.hisMOT,
-                hisEOT = excluded.hisEOT,
-                che1 = excluded.che1,
-                che2 = excluded.che2,
-                che3 = excluded.che3,
-                che4 = excluded.che4,
-                cheBOT = excluded.cheBOT,
-                cheMOT = excluded.cheMOT,
-                cheEOT = excluded.cheEOT,
-                ict1 = excluded.ict1,
-                ict2 = excluded.ict2,
-                ict3 = excluded.ict3,
-                ict4 = excluded.ict4,
-                ictBOT = excluded.ictBOT,
-                ictMOT = excluded.ictMOT,
-                ictEOT = excluded.ictEOT,
-                ent1 = excluded.ent1,
-                ent2 = excluded.ent2,
-                ent3 = excluded.ent3,
-                ent4 = excluded.ent4,
-                entBOT = excluded.entBOT,
-                entMOT = excluded.entMOT,
-                entEOT = excluded.entEOT,
-                cre1 = excluded.cre1,
-                cre2 = excluded.cre2,
-                cre3 = excluded.cre3,
-                cre4 = excluded.cre4,
-                creBOT = excluded.creBOT,
-                creMOT = excluded.creMOT,
-                creEOT = excluded.creEOT,
-                agr1 = excluded.agr1,
-                agr2 = excluded.agr2,
-                agr3 = excluded.agr3,
-                agr4 = excluded.agr4,
-                agrBOT = excluded.agrBOT,
-                agrMOT = excluded.agrMOT,
-                agrEOT = excluded.agrEOT,
-                phe1 = excluded.phe1,
-                phe2 = excluded.phe2,
-                phe3 = excluded.phe3,
-                phe4 = excluded.phe4,
-                pheBOT = excluded.pheBOT,
-                pheMOT = excluded.pheMOT,
-                pheEOT = excluded.pheEOT,
-                kis1 = excluded.kis1,
-                kis2 = excluded.kis2,
-                kis3 = excluded.kis3,
-                kis4 = excluded.kis4,
-                kisBOT = excluded.kisBOT,
-                kisMOT = excluded.kisMOT,
-                kisEOT = excluded.kisEOT,
-                art1 = excluded.art1,
-                art2 = excluded.art2,
-                art3 = excluded.art3,
-                art4 = excluded.art4,
-                artBOT = excluded.artBOT,
-                artMOT = excluded.artMOT,
-                artEOT = excluded.artEOT,
-                ire1 = excluded.ire1,
-                ire2 = excluded.ire2,
-                ire3 = excluded.ire3,
-                ire4 = excluded.ire4,
-                ireBOT = excluded.ireBOT,
-                ireMOT = excluded.ireMOT,
-                ireEOT = excluded.ireEOT,
-                lit1 = excluded.lit1,
-                lit2 = excluded.lit2,
-                lit3 = excluded.lit3,
-                lit4 = excluded.lit4,
-                litBOT = excluded.litBOT,
-                litMOT = excluded.litMOT,
-                litEOT = excluded.litEOT,
-                tad1 = excluded.tad1,
-                tad2 = excluded.tad2,
-                tad3 = excluded.tad3,
-                tad4 = excluded.tad4,
-                tadBOT = excluded.tadBOT,
-                tadMOT = excluded.tadMOT,
-                tadEOT = excluded.tadEOT,
-                fsn1 = excluded.fsn1,
-                fsn2 = excluded.fsn2,
-                fsn3 = excluded.fsn3,
-                fsn4 = excluded.fsn4,
-                fsnBOT = excluded.fsnBOT,
-                fsnMOT = excluded.fsnMOT,
-                fsnEOT = excluded.fsnEOT,
-                lat1 = excluded.lat1,
-                lat2 = excluded.lat2,
-                lat3 = excluded.lat3,
-                lat4 = excluded.lat4,
-                latBOT = excluded.latBOT,
-                latMOT = excluded.latMOT,
-                latEOT = excluded.latEOT,
-                ate1 = excluded.ate1,
-                ate2 = excluded.ate2,
-                ate3 = excluded.ate3,
-                ate4 = excluded.ate4,
-                ateBOT = excluded.ateBOT,
-                ateMOT = excluded.ateMOT,
-                ateEOT = excluded.ateEOT,
-                lum1 = excluded.lum1,
-                lum2 = excluded.lum2,
-                lum3 = excluded.lum3,
-                lum4 = excluded.lum4,
-                lumBOT = excluded.lumBOT,
-                lumMOT = excluded.lumMOT,
-                lumEOT = excluded.lumEOT,
-                lug1 = excluded.lug1,
-                lug2 = excluded.lug2,
-                lug3 = excluded.lug3,
-                lug4 = excluded.lug4,
-                lugBOT = excluded.lugBOT,
-                lugMOT = excluded.lugMOT,
-                lugEOT = excluded.lugEOT,
-                lus1 = excluded.lus1,
-                lus2 = excluded.lus2,
-                lus3 = excluded.lus3,
-                lus4 = excluded.lus4,
-                lusBOT = excluded.lusBOT,
-                lusMOT = excluded.lusMOT,
-                lusEOT = excluded.lusEOT,
-                lba1 = excluded.lba1,
-                lba2 = excluded.lba2,
-                lba3 = excluded.lba3,
-                lba4 = excluded.lba4,
-                lbaBOT = excluded.lbaBOT,
-                lbaMOT = excluded.lbaMOT,
-                lbaEOT = excluded.lbaEOT,
-                lbl1 = excluded.lbl1,
-                lbl2 = excluded.lbl2,
-                lbl3 = excluded.lbl3,
-                lbl4 = excluded.lbl4,
-                lblBOT = excluded.lblBOT,
-                lblMOT = excluded.lblMOT,
-                lblEOT = excluded.lblEOT,
-                run1 = excluded.run1,
-                run2 = excluded.run2,
-                run3 = excluded.run3,
-                run4 = excluded.run4,
-                runBOT = excluded.runBOT,
-                runMOT = excluded.runMOT,
-                runEOT = excluded.runEOT,
-                rut1 = excluded.rut1,
-                rut2 = excluded.rut2,
-                rut3 = excluded.rut3,
-                rut4 = excluded.rut4,
-                rutBOT = excluded.rutBOT,
-                rutMOT = excluded.rutMOT,
-                rutEOT = excluded.rutEOT,
-                fre1 = excluded.fre1,
-                fre2 = excluded.fre2,
-                fre3 = excluded.fre3,
-                fre4 = excluded.fre4,
-                freBOT = excluded.freBOT,
-                freMOT = excluded.freMOT,
-                freEOT = excluded.freEOT,
-                ger1 = excluded.ger1,
-                ger2 = excluded.ger2,
-                ger3 = excluded.ger3,
-                ger4 = excluded.ger4,
-                gerBOT = excluded.gerBOT,
-                gerMOT = excluded.gerMOT,
-                gerEOT = excluded.gerEOT,
-                dho1 = excluded.dho1,
-                dho2 = excluded.dho2,
-                dho3 = excluded.dho3,
-                dho4 = excluded.dho4,
-                dhoBOT = excluded.dhoBOT,
-                dhoMOT = excluded.dhoMOT,
-                dhoEOT = excluded.dhoEOT
-            ''', (
-                student['std_no'], student['sdt_name'], student['stream'], student['year'], student['term'],
-                student['gender'], student['section'], student['eng1'], student['eng2'], student['eng3'], student['eng4'], student['engBOT'], student['engMOT'], student['engEOT'],
-                student['mtc1'], student['mtc2'], student['mtc3'], student['mtc4'], student['mtcBOT'], student['mtcMOT'], student['mtcEOT'],
-                student['bio1'], student['bio2'], student['bio3'], student['bio4'], student['bioBOT'], student['bioMOT'], student['bioEOT'],
-                student['phy1'], student['phy2'], student['phy3'], student['phy4'], student['phyBOT'], student['phyMOT'], student['phyEOT'],
-                student['geo1'], student['geo2'], student['geo3'], student['geo4'], student['geoBOT'], student['geoMOT'], student['geoEOT'],
-                student['his1'], student['his2'], student['his3'], student['his4'], student['hisBOT'], student['hisMOT'], student['hisEOT'],
-                student['che1'], student['che2'], student['che3'], student['che4'], student['cheBOT'], student['cheMOT'], student['cheEOT'],
-                student['ict1'], student['ict2'], student['ict3'], student['ict4'], student['ictBOT'], student['ictMOT'], student['ictEOT'],
-                student['ent1'], student['ent2'], student['ent3'], student['ent4'], student['entBOT'], student['entMOT'], student['entEOT'],
-                student['cre1'], student['cre2'], student['cre3'], student['cre4'], student['creBOT'], student['creMOT'], student['creEOT'],
-                student['agr1'], student['agr2'], student['agr3'], student['agr4'], student['agrBOT'], student['agrMOT'], student['agrEOT'],
-                student['phe1'], student['phe2'], student['phe3'], student['phe4'], student['pheBOT'], student['pheMOT'], student['pheEOT'],
-                student['kis1'], student['kis2'], student['kis3'], student['kis4'], student['kisBOT'], student['kisMOT'], student['kisEOT'],
-                student['art1'], student['art2'], student['art3'], student['art4'], student['artBOT'], student['artMOT'], student['artEOT'],
-                student['ire1'], student['ire2'], student['ire3'], student['ire4'], student['ireBOT'], student['ireMOT'], student['ireEOT'],
-                student['lit1'], student['lit2'], student['lit3'], student['lit4'], student['litBOT'], student['litMOT'], student['litEOT'],
-                student['tad1'], student['tad2'], student['tad3'], student['tad4'], student['tadBOT'], student['tadMOT'], student['tadEOT'],
-                student['fsn1'], student['fsn2'], student['fsn3'], student['fsn4'], student['fsnBOT'], student['fsnMOT'], student['fsnEOT'],
-                student['lat1'], student['lat2'], student['lat3'], student['lat4'], student['latBOT'], student['latMOT'], student['latEOT'],
-                student['ate1'], student['ate2'], student['ate3'], student['ate4'], student['ateBOT'], student['ateMOT'], student['ateEOT'],
-                student['lum1'], student['lum2'], student['lum3'], student['lum4'], student['lumBOT'], student['lumMOT'], student['lumEOT'],
-                student['lug1'], student['lug2'], student['lug3'], student['lug4'], student['lugBOT'], student['lugMOT'], student['lugEOT'],
-                student['lus1'], student['lus2'], student['lus3'], student['lus4'], student['lusBOT'], student['lusMOT'], student['lusEOT'],
-                student['lba1'], student['lba2'], student['lba3'], student['lba4'], student['lbaBOT'], student['lbaMOT'], student['lbaEOT'],
-                student['lbl1'], student['lbl2'], student['lbl3'], student['lbl4'], student['lblBOT'], student['lblMOT'], student['lblEOT'],
-                student['run1'], student['run2'], student['run3'], student['run4'], student['runBOT'], student['runMOT'], student['runEOT'],
-                student['rut1'], student['rut2'], student['rut3'], student['rut4'], student['rutBOT'], student['rutMOT'], student['rutEOT'],
-                student['fre1'], student['fre2'], student['fre3'], student['fre4'], student['freBOT'], student['freMOT'], student['freEOT'],
-                student['ger1'], student['ger2'], student['ger3'], student['ger4'], student['gerBOT'], student['gerMOT'], student['gerEOT'],
-                student['dho1'], student['dho2'], student['dho3'], student['dho4'], student['dhoBOT'], student['dhoMOT'], student['dhoEOT']
-                ))
-        conn.commit()
-        return jsonify({'success': True})
+        saved = save_students(conn, class_level, students, permitted_subjects(conn))
+        return jsonify({'success': True, 'saved': saved})
+    except ValueError as e:
+        return jsonify({'success': False, 'message': str(e)})
     except sqlite3.Error as e:
-        conn.rollback()
         return jsonify({'success': False, 'message': f'Database error: {str(e)}'})
     finally:
         conn.close()
 
+@app.route('/api/save_cells', methods=['POST'])
+def save_cells_route():
+    """Delta save of the individual mark cells edited in the grid"""
+    if not check_auth():
+        return jsonify({'success': False, 'message': 'Authentication required'})
+    
+    data = request.json
+    class_level = data.get('class')
+    year = data.get('year')
+    term = data.get('term')
+    cells = data.get('cells')
+    
+    if not class_level or not year or not term or not cells:
+        return jsonify({'success': False, 'message': 'Invalid data'})
+    
+    if not check_deadline() and not check_admin():
+        return jsonify({'success': False, 'message': 'Marks entry deadline has passed. Contact admin.'})
+    
+    conn = get_db_connection()
+    try:
+        applied, conflicts = save_cells(conn, class_level, year, term, cells, permitted_subjects(conn))
+        return jsonify({'success': not conflicts, 'versions': applied, 'conflicts': conflicts})
+    except (KeyError, ValueError) as e:
+        return jsonify({'success': False, 'message': f'Invalid cell: {e}'})
+    except sqlite3.Error as e:
+        return jsonify({'success': False, 'message': f'Database error: {str(e)}'})
+    finally:
+        conn.close()
+
+def load_school_settings(conn):
+    try:
+        school = conn.execute('SELECT * FROM admin_settings ORDER BY id DESC LIMIT 1').fetchone()
+    except sqlite3.Error:
+        school = None
+    return dict(school) if school else {}
+
+def load_subjects(conn):
+    try:
+        subjects = conn.execute('SELECT * FROM subjects').fetchall()
+    except sqlite3.Error:
+        subjects = []
+    return [dict(subject) for subject in subjects]
+
+def load_grading(conn):
+    try:
+        grading = conn.execute('SELECT * FROM grading_system ORDER BY min_score DESC').fetchall()
+    except sqlite3.Error:
+        grading = []
+    return [dict(grade) for grade in grading]
+
+def load_streams(conn):
+    """Stream names of every class, keyed by class level"""
+    streams = {}
+    for row in conn.execute('SELECT DISTINCT class_level, stream_name FROM streams ORDER BY id'):
+        streams.setdefault(row['class_level'], []).append(row['stream_name'])
+    return streams
+
+def load_report_reference(conn):
+    """School settings, subjects and grading shared by every report card"""
+    return {
+        'school': reference_cache.get(conn, 'admin_settings', load_school_settings),
+        'subjects': reference_cache.get(conn, 'subjects', load_subjects),
+        'grading': reference_cache.get(conn, 'grading_system', load_grading)
+    }
+
+def stream_reports(conn, shared, class_level, stream, year, term):
+    """Report data of every student of a stream, ordered by student number"""
+    report_type = shared['report_type']
+    students = conn.execute(f'''
+        SELECT * FROM {year_source(conn, check_class_table(class_level), year)}
+        WHERE stream = ? AND year = ? AND term = ?
+        ORDER BY std_no
+    ''', (stream, year, term)).fetchall()
+    positions = stream_rankings(conn, class_level, stream, year, term, report_type)
+    balances = bursary_store.stream_balances(conn, class_level, stream, year, term)
+    
+    # Grades for the whole stream are computed in one vectorized pass
+    return [
+        {**dict(student), 'fees_balance': balances.get(student['std_no']),
+         'results': {**results, 'position': positions.get(student['std_no'])}}
+        for student, results in zip(students, compute_results(students, shared['grading'], report_type))
+    ]
+
 @app.route('/api/generate_report', methods=['POST'])
 def generate_report():
     if not check_auth():
@@ -638,94 +905,270 @@ def generate_report():
     term = data['term']
     report_type = data['report_type']  # BOT, MOT, EOT
     
-    conn = get_db_connection()
+    if report_type not in EXAM_SETS:
+        return jsonify({'success': False, 'message': f'Unknown report type: {report_type}'})
+    
+    conn = get_db_connection(readonly=True)
     
     try:
         # Get student data
         student = conn.execute(f'''
-            SELECT * FROM {class_level} 
+            SELECT * FROM {year_source(conn, check_class_table(class_level), year)}
             WHERE std_no = ? AND stream = ? AND year = ? AND term = ?
         ''', (std_no, stream, year, term)).fetchone()
         
         if not student:
             return jsonify({'success': False, 'message': 'Student not found'})
         
-        # Get school settings
-        try:
-            school = conn.execute('SELECT * FROM admin_settings ORDER BY id DESC LIMIT 1').fetchone()
-        except:
-            school = None
-        
-        # Get subjects
-        try:
-            subjects = conn.execute('SELECT * FROM subjects').fetchall()
-        except:
-            subjects = []
-        
-        # Get grading system
-        try:
-            grading = conn.execute('SELECT * FROM grading_system ORDER BY min_score DESC').fetchall()
-        except:
-            grading = []
-        
         # Calculate grades and prepare report data
+        reference = load_report_reference(conn)
         report_data = {
             'student': dict(student),
-            'school': dict(school) if school else {},
-            'subjects': [dict(subject) for subject in subjects],
-            'grading': [dict(grade) for grade in grading],
+            **reference,
+            'results': compute_results([student], reference['grading'], report_type)[0],
             'report_type': report_type
         }
+        # Positions are precomputed on save, see rankings.py
+        report_data['results']['position'] = student_ranking(
+            conn, class_level, year, term, report_type, student['std_no'])
+        report_data['fees_balance'] = bursary_store.student_balance(conn, student['std_no'], year, term)
         
         return jsonify({'success': True, 'data': report_data})
+    except ValueError as e:
+        return jsonify({'success': False, 'message': str(e)})
     except sqlite3.Error as e:
         return jsonify({'success': False, 'message': f'Database error: {str(e)}'})
     finally:
         conn.close()
 
-@app.route('/api/export_excel', methods=['POST'])
-def export_excel():
+@app.route('/api/generate_reports', methods=['POST'])
+def generate_reports():
+    """Report data for every student of a stream in one request.
+
+    The stream is read with one query and the school settings, subjects and
+    grading are sent once for all students. With format=ndjson the response
+    is streamed: a first line with the shared data, then one line per student.
+    """
     if not check_auth():
-        return jsonify({'error': 'Authentication required'}), 401
+        return jsonify({'success': False, 'message': 'Authentication required'})
     
     if not check_role(['admin', 'headteacher', 'teacher']):
-        return jsonify({'error': 'Access denied'}), 403
+        return jsonify({'success': False, 'message': 'Access denied'})
     
     data = request.json
     class_level = data['class']
     stream = data['stream']
     year = data['year']
     term = data['term']
+    report_type = data['report_type']  # BOT, MOT, EOT
     
-    conn = get_db_connection()
+    if report_type not in EXAM_SETS:
+        return jsonify({'success': False, 'message': f'Unknown report type: {report_type}'})
+    
+    conn = get_db_connection(readonly=True)
     try:
-        students = conn.execute(f'''
-            SELECT * FROM {class_level} 
-            WHERE stream = ? AND year = ? AND term = ?
-            ORDER BY std_no
-        ''', (stream, year, term)).fetchall()
+        shared = {**load_report_reference(conn), 'report_type': report_type}
+        reports = stream_reports(conn, shared, class_level, stream, year, term)
         
-        # Convert to DataFrame
-        df = pd.DataFrame([dict(student) for student in students])
+        if data.get('format') == 'ndjson':
+            def generate():
+                yield json.dumps(shared) + '\n'
+                for report in reports:
+                    yield json.dumps({'student': report}) + '\n'
+            return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
         
-        # Create Excel file in memory
-        output = BytesIO()
-        with pd.ExcelWriter(output, engine='openpyxl') as writer:
-            df.to_excel(writer, sheet_name='Marks', index=False)
+        shared['students'] = reports
+        return jsonify({'success': True, 'data': shared})
+    except ValueError as e:
+        return jsonify({'success': False, 'message': str(e)})
+    except sqlite3.Error as e:
+        return jsonify({'success': False, 'message': f'Database error: {str(e)}'})
+    finally:
+        conn.close()
+
+@app.route('/api/report_pdf', methods=['POST'])
+def report_pdf_route():
+    """PDF report cards rendered on the server, see report_pdf.py.
+
+    With std_no one student's card, with a stream every card of the stream
+    and without either every card of the class. layout=zip returns one PDF
+    per student in a zip file instead of one merged PDF.
+    """
+    if not check_auth():
+        return jsonify({'success': False, 'message': 'Authentication required'})
+    
+    if not check_role(['admin', 'headteacher', 'teacher']):
+        return jsonify({'success': False, 'message': 'Access denied'})
+    
+    data = request.json
+    class_level = data.get('class')
+    stream = data.get('stream')
+    year = data.get('year')
+    term = data.get('term')
+    report_type = data.get('report_type')
+    std_no = data.get('std_no')
+    
+    if report_type not in EXAM_SETS:
+        return jsonify({'success': False, 'message': f'Unknown report type: {report_type}'})
+    if not class_level or not year or not term:
+        return jsonify({'success': False, 'message': 'Class, year and term are required'})
+    
+    conn = get_db_connection(readonly=True)
+    try:
+        shared = {**load_report_reference(conn), 'report_type': report_type}
+        if stream:
+            streams = [stream]
+        else:
+            streams = [row[0] for row in conn.execute(f'''
+                SELECT DISTINCT stream FROM {year_source(conn, check_class_table(class_level), year)}
+                WHERE year = ? AND term = ? ORDER BY stream
+            ''', (year, term))]
+        reports = [report for name in streams
+                   for report in stream_reports(conn, shared, class_level, name, year, term)]
+        if std_no:
+            reports = [report for report in reports if str(report['std_no']) == str(std_no).strip()]
+        if not reports:
+            return jsonify({'success': False, 'message': 'No students found'})
+    except ValueError as e:
+        return jsonify({'success': False, 'message': str(e)})
+    except sqlite3.Error as e:
+        return jsonify({'success': False, 'message': f'Database error: {str(e)}'})
+    finally:
+        conn.close()
+    
+    name = '_'.join(str(part) for part in (class_level, stream or std_no, term, year, report_type) if part)
+    if data.get('layout') == 'zip':
+        return Response(report_pdf.render_zip(shared, reports), mimetype='application/zip',
+                        headers={'Content-Disposition': f'attachment; filename="reports_{name}.zip"'})
+    return Response(report_pdf.render_pdf(shared, reports), mimetype='application/pdf',
+                    headers={'Content-Disposition': f'inline; filename="reports_{name}.pdf"'})
+
+@app.route('/api/analytics')
+def analytics():
+    """Subject performance aggregates of a class and term for the dashboard"""
+    if not check_auth():
+        return jsonify({'error': 'Authentication required'}), 401
+    
+    if not check_role(['admin', 'headteacher']):
+        return jsonify({'error': 'Access denied'}), 403
+    
+    class_level = request.args.get('class')
+    year = request.args.get('year')
+    term = request.args.get('term')
+    exam_set = request.args.get('exam_set') or None
+    if not year or not term:
+        return jsonify({'error': 'Year and term are required'}), 400
+    if exam_set is not None and exam_set not in EXAM_SETS:
+        return jsonify({'error': f'Unknown exam set: {exam_set}'}), 400
+    
+    conn = get_db_connection(readonly=True)
+    writer = None
+    try:
+        check_class_table(class_level)
+        # Only a stale class and term takes the write connection, to recompute it
+        force = request.args.get('refresh') == '1'
+        if analytics_store.needs_refresh(conn, class_level, year, term, force):
+            writer = get_db_connection()
+            grading = reference_cache.get(writer, 'grading_system', load_grading)
+            with writer:
+                analytics_store.refresh(writer, class_level, year, term, grading)
+        rows = analytics_store.subject_analytics(conn, class_level, year, term,
+                                                 stream=request.args.get('stream'), exam_set=exam_set)
+        return jsonify(rows)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except sqlite3.Error as e:
+        return jsonify({'error': f'Database error: {str(e)}'}), 500
+    finally:
+        conn.close()
+        if writer is not None:
+            writer.close()
+
+@app.route('/api/export_excel', methods=['POST'])
+def export_excel():
+    if not check_auth():
+        return jsonify({'error': 'Authentication required'}), 401
+    
+    if not check_role(['admin', 'headteacher', 'teacher']):
+        return jsonify({'error': 'Access denied'}), 403
+    
+    data = request.json
+    class_level = data.get('class')
+    stream = data.get('stream')
+    year = data['year']
+    term = data['term']
+    scope = data.get('scope', 'stream')  # stream, class or school
+    export_format = data.get('format', 'xlsx')  # xlsx, csv or csv.gz
+    
+    if export_format not in ('xlsx', 'csv', 'csv.gz'):
+        return jsonify({'error': f'Unknown export format: {export_format}'}), 400
+    
+    if scope == 'stream':
+        filename = f'{class_level}_{stream}_{year}_{term}_marks'
+    elif scope == 'class':
+        filename = f'{class_level}_{year}_{term}_marks'
+    else:
+        filename = f'school_{year}_{term}_marks'
+    
+    conn = get_db_connection(readonly=True)
+    try:
+        sheets = export_sheets(conn, scope, class_level, stream, year, term)
         
-        output.seek(0)
+        if export_format == 'xlsx':
+            return send_file(
+                write_xlsx(sheets),
+                mimetype=XLSX_MIMETYPE,
+                as_attachment=True,
+                download_name=f'{filename}.xlsx'
+            )
         
-        return send_file(
-            output,
-            mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
-            as_attachment=True,
-            download_name=f'{class_level}_{stream}_{year}_{term}_marks.xlsx'
+        # CSV rows are streamed from the cursor as the client downloads them
+        compress = export_format == 'csv.gz'
+        return Response(
+            stream_with_context(iter_csv(sheets, compress=compress)),
+            mimetype='application/gzip' if compress else 'text/csv',
+            headers={'Content-Disposition': f'attachment; filename="{filename}.{export_format}"'}
         )
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     except sqlite3.Error as e:
         return jsonify({'error': f'Database error: {str(e)}'}), 500
     finally:
         conn.close()
 
+@app.route('/api/import_students', methods=['POST'])
+def import_students_route():
+    """Register or update students and marks from an uploaded .xlsx or CSV file.
+
+    Form fields: file, class, and optional stream, year and term used for
+    rows that leave them blank. With dry_run=1 nothing is written and the
+    response only reports the rows that would be rejected.
+    """
+    if not check_auth():
+        return jsonify({'success': False, 'message': 'Authentication required'})
+    
+    if not check_role(['admin', 'headteacher']):
+        return jsonify({'success': False, 'message': 'Access denied'})
+    
+    upload = request.files.get('file')
+    class_level = request.form.get('class')
+    if not upload or not upload.filename or not class_level:
+        return jsonify({'success': False, 'message': 'A file and a class are required'})
+    
+    defaults = {key: request.form.get(key) for key in ('stream', 'year', 'term')}
+    dry_run = request.form.get('dry_run') in ('1', 'true', 'on')
+    
+    conn = get_db_connection()
+    try:
+        report = import_students(conn, read_rows(upload.stream, upload.filename), class_level, defaults, dry_run)
+        return jsonify({'success': True, **report})
+    except ValueError as e:
+        return jsonify({'success': False, 'message': str(e)})
+    except sqlite3.Error as e:
+        return jsonify({'success': False, 'message': f'Database error: {str(e)}'})
+    finally:
+        conn.close()
+
 #add user route and functionality
 @app.route('/add_user', methods=['POST'])
 def add_user():
@@ -738,6 +1181,12 @@ def add_user():
         subjects_taught = request.form.get('subjects_taught', '')
         classes_taught = request.form.get('classes_taught', '')
 
+        # A teacher is limited to the subjects listed, so they must all be known
+        unknown = unknown_subjects(subjects_taught)
+        if unknown:
+            return jsonify({'success': False, 'error': f"Unknown subjects: {', '.join(unknown)}. "
+                                                       "Use subject initials such as ENG1, MATH or BIO."})
+
         # Generate user ID and temporary password
         user_id = 'USR' + str(int(datetime.now().timestamp()))[-6:]
         temp_password = 'temp' + ''.join(random.choices('abcdefghijklmnopqrstuvwxyz0123456789', k=4))
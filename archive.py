@@ -0,0 +1,184 @@
+"""Per-year archive databases for closed academic years.
+
+archive_year() copies every class-table row of a year (marks in the wide
+layout, whatever the live storage), its rankings and subject analytics
+into archive/school_<year>.db next to the database, checks the copy and
+then deletes the year from the live tables, so the hot tables only hold
+the years still in use. The archived years are recorded in app_meta under
+'archive:<year>'.
+
+Reads go through year_source() and archived_table(): a year that has been
+archived is ATTACHed read-only the first time a connection needs it and
+read from there, any other year from the live tables. Archived years are
+read-only; saves to them are refused.
+"""
+import os
+import re
+import sqlite3
+
+from database import database_path
+from marks_long import marks_source
+from marks_schema import CLASS_TABLES
+
+# Tables of a year moved to its archive, besides the class tables
+YEAR_TABLES = ('student_rankings', 'subject_analytics')
+
+# Archives kept attached to one connection; SQLite allows 10 by default
+MAX_ATTACHED = 6
+
+ARCHIVE_DIR = os.environ.get('SCHOOL_ARCHIVE_DIR')
+
+
+def archive_dir(conn):
+    """Directory of the archive files, archive/ next to the database by default"""
+    return ARCHIVE_DIR or os.path.join(os.path.dirname(os.path.abspath(database_path(conn))), 'archive')
+
+
+def archive_file(year):
+    return f'school_{int(year)}.db'
+
+
+def schema_name(year):
+    return f'archive_{int(year)}'
+
+
+def archived_years(conn):
+    """{year: archive file name} of every archived year"""
+    try:
+        rows = conn.execute("SELECT key, value FROM app_meta WHERE key LIKE 'archive:%'").fetchall()
+    except sqlite3.OperationalError:
+        # Database not migrated yet
+        return {}
+    return {int(key.split(':', 1)[1]): value for key, value in rows}
+
+
+def is_archived(conn, year):
+    try:
+        year = int(year)
+    except (TypeError, ValueError):
+        return False
+    return year in archived_years(conn)
+
+
+def check_writable(conn, years):
+    """Raise ValueError if any of the years has been archived"""
+    archived = archived_years(conn)
+    for year in years:
+        if str(year).strip().isdigit() and int(year) in archived:
+            raise ValueError(f'{year} is archived and can no longer be edited')
+
+
+def _attached(conn):
+    return {row[1] for row in conn.execute('PRAGMA database_list')}
+
+
+def attach_year(conn, year):
+    """Attach the archive of a year read-only, returning its schema name.
+
+    Returns None if the year is not archived. An archive stays attached to
+    the (pooled) connection; when MAX_ATTACHED are attached they are all
+    detached first.
+    """
+    if not is_archived(conn, year):
+        return None
+    schema = schema_name(year)
+    attached = _attached(conn)
+    if schema in attached:
+        return schema
+    archives = [name for name in attached if name.startswith('archive_')]
+    if len(archives) >= MAX_ATTACHED:
+        for name in archives:
+            conn.execute(f'DETACH DATABASE {name}')
+    path = os.path.join(archive_dir(conn), archive_file(year))
+    if not os.path.exists(path):
+        raise sqlite3.OperationalError(f'Archive of {year} is missing: {path}')
+    conn.execute(f'ATTACH DATABASE ? AS {schema}', (f'file:{path}?mode=ro',))
+    return schema
+
+
+def archived_table(conn, table, year):
+    """Schema-qualified archive table of a year, None if the year is live"""
+    schema = attach_year(conn, year)
+    return f'{schema}.{table}' if schema else None
+
+
+def year_source(conn, class_level, year):
+    """Table or view to read wide student rows of a class and year from"""
+    return archived_table(conn, class_level, year) or marks_source(conn, class_level)
+
+
+def _create_like(conn, schema, table):
+    """Create a table and its indexes in an attached schema from the live DDL"""
+    for kind, sql in conn.execute('''
+        SELECT type, sql FROM sqlite_master
+        WHERE tbl_name = ? AND type IN ('table', 'index') AND sql IS NOT NULL
+        ORDER BY type = 'index'
+    ''', (table,)).fetchall():
+        if kind == 'table':
+            sql = re.sub(r'^CREATE TABLE\s+"?\w+"?', f'CREATE TABLE IF NOT EXISTS {schema}.{table}', sql)
+        else:
+            sql = re.sub(r'^CREATE (UNIQUE )?INDEX\s+"?(\w+)"?',
+                         lambda m: f'CREATE {m.group(1) or ""}INDEX IF NOT EXISTS {schema}.{m.group(2)}', sql)
+        conn.execute(sql)
+
+
+def _columns(conn, table):
+    return [row[1] for row in conn.execute(f'PRAGMA table_info({table})')]
+
+
+def _year_counts(conn, prefix, year):
+    return {
+        table: conn.execute(f'SELECT COUNT(*) FROM {prefix}{table} WHERE year = ?', (year,)).fetchone()[0]
+        for table in CLASS_TABLES + YEAR_TABLES
+    }
+
+
+def archive_year(conn, year):
+    """Move a closed year into its archive file and return the rows moved per table.
+
+    The year must be older than the latest year in the class tables. The
+    copy is committed and counted before anything is deleted from the live
+    tables, so an interrupted run leaves the year live and can be repeated.
+    """
+    year = int(year)
+    if is_archived(conn, year):
+        raise ValueError(f'{year} is already archived')
+    latest = max(
+        conn.execute(f'SELECT MAX(year) FROM {table}').fetchone()[0] or 0
+        for table in CLASS_TABLES
+    )
+    if year >= latest:
+        raise ValueError(f'{year} is not closed yet; only years before {latest} can be archived')
+
+    os.makedirs(archive_dir(conn), exist_ok=True)
+    path = os.path.join(archive_dir(conn), archive_file(year))
+    schema = 'archive_new'
+    conn.execute(f'ATTACH DATABASE ? AS {schema}', (path,))
+    try:
+        with conn:
+            for table in CLASS_TABLES + YEAR_TABLES:
+                _create_like(conn, schema, table)
+                columns = ', '.join(_columns(conn, table))
+                source = marks_source(conn, table) if table in CLASS_TABLES else table
+                conn.execute(f'DELETE FROM {schema}.{table} WHERE year = ?', (year,))
+                conn.execute(f'''
+                    INSERT INTO {schema}.{table} ({columns})
+                    SELECT {columns} FROM {source} WHERE year = ?
+                ''', (year,))
+        live = _year_counts(conn, '', year)
+        copied = _year_counts(conn, f'{schema}.', year)
+    finally:
+        conn.execute(f'DETACH DATABASE {schema}')
+    if live != copied:
+        raise sqlite3.DatabaseError(f'Archive of {year} does not match the live tables: {copied} != {live}')
+
+    with conn:
+        conn.execute('''
+            INSERT INTO app_meta (key, value) VALUES (?, ?)
+            ON CONFLICT(key) DO UPDATE SET value = excluded.value
+        ''', (f'archive:{year}', archive_file(year)))
+        conn.execute('DELETE FROM marks WHERE year = ?', (year,))
+        conn.execute('DELETE FROM analytics_state WHERE year = ?', (year,))
+        for table in CLASS_TABLES + YEAR_TABLES:
+            conn.execute(f'DELETE FROM {table} WHERE year = ?', (year,))
+    return live
@@ -0,0 +1,325 @@
+"""Fee balances, payments and defaulters for the bursary.
+
+fee_balances holds one row per student and term with the fees due for
+their class, the amount paid and the balance. Triggers keep it current:
+a student saved into a class table for a new term gets a row owing the
+term's fees, a payment inserted into fees_payments (from any code path)
+adds to its row, and a change to fees_structure re-prices the whole class
+and term in one UPDATE: the class and term a fee line is moved away from
+or deleted from as well as the one it now belongs to. The indexes on balance make the defaulters list a
+range scan, and a student's balance on the report card a key lookup.
+"""
+import sqlite3
+from datetime import date
+
+from marks_schema import CLASS_TABLES
+
+PAYMENT_METHODS = ('Cash', 'Bank Transfer', 'Mobile Money', 'Cheque')
+
+BALANCE_COLUMNS = ('std_no', 'sdt_name', 'class_level', 'stream', 'year', 'term', 'fees_due', 'paid', 'balance')
+
+# Fees due of a class and term, the latest fees_structure entry winning
+_FEES_DUE = '''
+    COALESCE((
+        SELECT amount FROM fees_structure
+        WHERE class_level = {class_level} AND year = {year} AND term = {term}
+        ORDER BY id DESC LIMIT 1
+    ), 0)
+'''
+
+
+def create_balances_table(conn):
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS fee_balances (
+            std_no INTEGER NOT NULL,
+            year INTEGER NOT NULL,
+            term TEXT NOT NULL,
+            class_level TEXT,
+            stream TEXT,
+            sdt_name TEXT,
+            fees_due REAL NOT NULL DEFAULT 0,
+            paid REAL NOT NULL DEFAULT 0,
+            balance REAL NOT NULL DEFAULT 0,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (std_no, year, term)
+        ) WITHOUT ROWID
+    ''')
+    conn.execute('''
+        CREATE INDEX IF NOT EXISTS idx_fee_balances_class
+        ON fee_balances (year, term, class_level, balance)
+    ''')
+    conn.execute('''
+        CREATE INDEX IF NOT EXISTS idx_fee_balances_balance
+        ON fee_balances (year, term, balance)
+    ''')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_fees_payments_student ON fees_payments (std_no, year, term)')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_fees_payments_receipt ON fees_payments (receipt_no)')
+
+
+def create_receipt_index(conn):
+    """Make receipt numbers unique, renaming existing duplicates.
+
+    Later payments sharing a receipt number get '-<payment id>' appended so
+    the unique index can be built. Returns the number renamed.
+    """
+    renamed = conn.execute('''
+        UPDATE fees_payments SET receipt_no = receipt_no || '-' || id
+        WHERE receipt_no IS NOT NULL AND id NOT IN (
+            SELECT MIN(id) FROM fees_payments WHERE receipt_no IS NOT NULL GROUP BY receipt_no
+        )
+    ''').rowcount
+    conn.execute('DROP INDEX IF EXISTS idx_fees_payments_receipt')
+    conn.execute('''
+        CREATE UNIQUE INDEX IF NOT EXISTS idx_fees_payments_receipt_no
+        ON fees_payments (receipt_no) WHERE receipt_no IS NOT NULL
+    ''')
+    return renamed
+
+
+def _payment_delta(row, sign):
+    """Trigger statement adding (sign 1) or removing (-1) a payment's amount"""
+    fees_due = _FEES_DUE.format(class_level=f'{row}.class_level', year=f'{row}.year', term=f'{row}.term')
+    amount = f'{sign} * COALESCE({row}.amount_paid, 0)'
+    return f'''
+        INSERT INTO fee_balances (std_no, year, term, class_level, fees_due, paid, balance)
+        SELECT {row}.std_no, {row}.year, {row}.term, {row}.class_level, {fees_due}, {amount}, {fees_due} - {amount}
+        WHERE {row}.std_no IS NOT NULL AND {row}.year IS NOT NULL AND {row}.term IS NOT NULL
+        ON CONFLICT(std_no, year, term) DO UPDATE SET
+            paid = paid + {amount}, balance = balance - {amount}, updated_at = CURRENT_TIMESTAMP;
+    '''
+
+
+def _reprice(row):
+    """Trigger statement re-pricing the balances of a fee line's class and term"""
+    fees_due = _FEES_DUE.format(class_level=f'{row}.class_level', year=f'{row}.year', term=f'{row}.term')
+    return f'''
+        UPDATE fee_balances SET fees_due = {fees_due}, balance = {fees_due} - paid,
+            updated_at = CURRENT_TIMESTAMP
+        WHERE class_level = {row}.class_level AND year = {row}.year AND term = {row}.term;
+    '''
+
+
+def create_balance_triggers(conn):
+    """(Re)create the triggers maintaining fee_balances"""
+    triggers = {}
+    for table in CLASS_TABLES:
+        name = table.lower()
+        fees_due = _FEES_DUE.format(class_level=f"'{table}'", year='NEW.year', term='NEW.term')
+        triggers[f'trg_{name}_fees_insert'] = f'''
+            AFTER INSERT ON {table} WHEN NEW.std_no IS NOT NULL AND NEW.year IS NOT NULL AND NEW.term IS NOT NULL
+            BEGIN
+                INSERT INTO fee_balances (std_no, year, term, class_level, stream, sdt_name, fees_due, balance)
+                VALUES (NEW.std_no, NEW.year, NEW.term, '{table}', NEW.stream, NEW.sdt_name, {fees_due}, {fees_due})
+                ON CONFLICT(std_no, year, term) DO UPDATE SET
+                    class_level = excluded.class_level, stream = excluded.stream, sdt_name = excluded.sdt_name,
+                    fees_due = excluded.fees_due, balance = excluded.fees_due - paid,
+                    updated_at = CURRENT_TIMESTAMP;
+            END
+        '''
+        triggers[f'trg_{name}_fees_update'] = f'''
+            AFTER UPDATE OF sdt_name, stream ON {table}
+            WHEN OLD.sdt_name IS NOT NEW.sdt_name OR OLD.stream IS NOT NEW.stream
+            BEGIN
+                UPDATE fee_balances SET sdt_name = NEW.sdt_name, stream = NEW.stream
+                WHERE std_no = NEW.std_no AND year = NEW.year AND term = NEW.term;
+            END
+        '''
+
+    triggers['trg_fees_payments_insert'] = f'AFTER INSERT ON fees_payments BEGIN {_payment_delta("NEW", 1)} END'
+    triggers['trg_fees_payments_delete'] = f'AFTER DELETE ON fees_payments BEGIN {_payment_delta("OLD", -1)} END'
+    triggers['trg_fees_payments_update'] = f'''
+        AFTER UPDATE OF std_no, year, term, amount_paid ON fees_payments
+        BEGIN
+            {_payment_delta('OLD', -1)}
+            {_payment_delta('NEW', 1)}
+        END
+    '''
+    triggers['trg_fees_structure_insert'] = f'AFTER INSERT ON fees_structure BEGIN {_reprice("NEW")} END'
+    triggers['trg_fees_structure_update'] = f'''
+        AFTER UPDATE OF amount, class_level, year, term ON fees_structure
+        BEGIN
+            {_reprice('OLD')}
+            {_reprice('NEW')}
+        END
+    '''
+    triggers['trg_fees_structure_delete'] = f'AFTER DELETE ON fees_structure BEGIN {_reprice("OLD")} END'
+    for name, body in triggers.items():
+        conn.execute(f'DROP TRIGGER IF EXISTS {name}')
+        conn.execute(f'CREATE TRIGGER {name} {body}')
+
+
+def rebuild_balances(conn):
+    """Recompute fee_balances from the class tables, fees and payments.
+
+    Runs inside the caller's transaction; the triggers keep the table
+    current afterwards.
+    """
+    conn.execute('DELETE FROM fee_balances')
+    enrolled = ' UNION ALL '.join(
+        f"SELECT std_no, year, term, '{table}' AS class_level, stream, sdt_name FROM {table} "
+        f"WHERE std_no IS NOT NULL AND year IS NOT NULL AND term IS NOT NULL"
+        for table in CLASS_TABLES
+    )
+    conn.execute(f'''
+        INSERT OR REPLACE INTO fee_balances (std_no, year, term, class_level, stream, sdt_name, fees_due)
+        SELECT s.std_no, s.year, s.term, s.class_level, s.stream, s.sdt_name,
+            {_FEES_DUE.format(class_level='s.class_level', year='s.year', term='s.term')}
+        FROM ({enrolled}) AS s
+    ''')
+    # Payments of students not (or no longer) in a class table keep their own row
+    conn.execute(f'''
+        INSERT OR IGNORE INTO fee_balances (std_no, year, term, class_level, fees_due)
+        SELECT p.std_no, p.year, p.term, p.class_level,
+            {_FEES_DUE.format(class_level='p.class_level', year='p.year', term='p.term')}
+        FROM (
+            SELECT std_no, year, term, MAX(class_level) AS class_level FROM fees_payments
+            WHERE std_no IS NOT NULL AND year IS NOT NULL AND term IS NOT NULL
+            GROUP BY std_no, year, term
+        ) AS p
+    ''')
+    conn.execute('''
+        UPDATE fee_balances SET paid = p.paid
+        FROM (
+            SELECT std_no, year, term, SUM(amount_paid) AS paid FROM fees_payments
+            GROUP BY std_no, year, term
+        ) AS p
+        WHERE fee_balances.std_no = p.std_no AND fee_balances.year = p.year AND fee_balances.term = p.term
+    ''')
+    conn.execute('UPDATE fee_balances SET balance = fees_due - paid')
+
+
+def record_payment(conn, data):
+    """Insert a payment and return (payment id, receipt number, new balance).
+
+    The balance is updated by trigger in the same transaction. A receipt
+    number is generated from the payment id when none is given.
+    """
+    try:
+        std_no = int(data.get('std_no'))
+        year = int(data.get('year'))
+        amount = float(data.get('amount_paid'))
+    except (TypeError, ValueError):
+        raise ValueError('Student number, year and amount must be numbers')
+    if amount <= 0:
+        raise ValueError('Amount paid must be positive')
+    class_level = data.get('class_level')
+    if class_level not in CLASS_TABLES:
+        raise ValueError(f'Unknown class: {class_level}')
+    term = str(data.get('term') or '').strip()
+    if not term:
+        raise ValueError('Term is required')
+    method = data.get('payment_method') or None
+    if method is not None and method not in PAYMENT_METHODS:
+        raise ValueError(f'Unknown payment method: {method}')
+
+    with conn:
+        try:
+            cursor = conn.execute('''
+                INSERT INTO fees_payments
+                    (std_no, class_level, term, year, amount_paid, payment_date, receipt_no, payment_method)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+            ''', (std_no, class_level, term, year, amount,
+                  data.get('payment_date') or date.today().isoformat(),
+                  data.get('receipt_no') or None, method))
+        except sqlite3.IntegrityError:
+            raise ValueError(f"Receipt {data.get('receipt_no')} has already been recorded")
+        payment_id = cursor.lastrowid
+        receipt_no = data.get('receipt_no') or f'RCP{payment_id:08d}'
+        if not data.get('receipt_no'):
+            conn.execute('UPDATE fees_payments SET receipt_no = ? WHERE id = ?', (receipt_no, payment_id))
+        balance = conn.execute('''
+            SELECT balance FROM fee_balances WHERE std_no = ? AND year = ? AND term = ?
+        ''', (std_no, year, term)).fetchone()
+    return payment_id, receipt_no, balance[0] if balance else None
+
+
+def student_balance(conn, std_no, year, term):
+    """Balance of one student for a term, None if they have no fees row"""
+    row = conn.execute('''
+        SELECT balance FROM fee_balances WHERE std_no = ? AND year = ? AND term = ?
+    ''', (std_no, year, term)).fetchone()
+    return row[0] if row else None
+
+
+def stream_balances(conn, class_level, stream, year, term):
+    """Balances of a stream's students for a term keyed by student number"""
+    rows = conn.execute('''
+        SELECT std_no, balance FROM fee_balances
+        WHERE year = ? AND term = ? AND class_level = ? AND stream = ?
+    ''', (year, term, class_level, stream))
+    return {row[0]: row[1] for row in rows}
+
+
+def defaulters(conn, year, term, class_level=None, min_balance=0.01, limit=None):
+    """Students owing at least min_balance for a term, largest balance first"""
+    query = f'''
+        SELECT {', '.join(BALANCE_COLUMNS)} FROM fee_balances
+        WHERE year = ? AND term = ? {'AND class_level = ?' if class_level else ''} AND balance >= ?
+        ORDER BY balance DESC, std_no
+    '''
+    params = [year, term] + ([class_level] if class_level else []) + [min_balance]
+    if limit:
+        query += ' LIMIT ?'
+        params.append(limit)
+    return [dict(zip(BALANCE_COLUMNS, row)) for row in conn.execute(query, params)]
+
+
+def fees_summary(conn, year, term):
+    """Per-class totals of fees due, paid and outstanding for a term"""
+    rows = conn.execute('''
+        SELECT class_level, COUNT(*), SUM(fees_due), SUM(paid),
+            SUM(MAX(balance, 0)), SUM(balance > 0)
+        FROM fee_balances
+        WHERE year = ? AND term = ?
+        GROUP BY class_level
+        ORDER BY class_level
+    ''', (year, term))
+    columns = ('class_level', 'students', 'fees_due', 'paid', 'outstanding', 'defaulters')
+    classes = [dict(zip(columns, row)) for row in rows]
+    totals = {
+        column: sum(row[column] or 0 for row in classes)
+        for column in columns[1:]
+    }
+    return {'classes': classes, 'totals': totals}
+
+
+def student_ledger(conn, std_no):
+    """Every term's balance and every payment of a student, oldest first"""
+    balances = conn.execute(f'''
+        SELECT {', '.join(BALANCE_COLUMNS)} FROM fee_balances
+        WHERE std_no = ? ORDER BY year, term
+    ''', (std_no,)).fetchall()
+    payments = conn.execute('''
+        SELECT id, year, term, class_level, amount_paid, payment_date, receipt_no, payment_method
+        FROM fees_payments WHERE std_no = ?
+        ORDER BY payment_date, id
+    ''', (std_no,)).fetchall()
+    payment_columns = ('id', 'year', 'term', 'class_level', 'amount_paid', 'payment_date', 'receipt_no', 'payment_method')
+    return {
+        'balances': [dict(zip(BALANCE_COLUMNS, row)) for row in balances],
+        'payments': [dict(zip(payment_columns, row)) for row in payments],
+    }
+
+
+def recent_payments(conn, limit=20):
+    rows = conn.execute('''
+        SELECT id, std_no, class_level, term, year, amount_paid, payment_date, receipt_no, payment_method
+        FROM fees_payments ORDER BY id DESC LIMIT ?
+    ''', (limit,))
+    columns = ('id', 'std_no', 'class_level', 'term', 'year', 'amount_paid', 'payment_date', 'receipt_no', 'payment_method')
+    return [dict(zip(columns, row)) for row in rows]
+
+
+def find_receipt(conn, receipt_no):
+    """A payment by receipt number with the student's balance for its term"""
+    row = conn.execute('''
+        SELECT p.id, p.std_no, p.class_level, p.term, p.year, p.amount_paid, p.payment_date,
+            p.receipt_no, p.payment_method, b.sdt_name, b.balance
+        FROM fees_payments AS p
+        LEFT JOIN fee_balances AS b ON b.std_no = p.std_no AND b.year = p.year AND b.term = p.term
+        WHERE p.receipt_no = ?
+        ORDER BY p.id DESC LIMIT 1
+    ''', (receipt_no,)).fetchone()
+    columns = ('id', 'std_no', 'class_level', 'term', 'year', 'amount_paid', 'payment_date',
+               'receipt_no', 'payment_method', 'sdt_name', 'balance')
+    return dict(zip(columns, row)) if row else None
@@ -0,0 +1,159 @@
+"""Pooled, tuned SQLite connections for the Flask app.
+
+Each worker process keeps a small pool of open connections. A request
+checks one out the first time it calls get_db() and hands it back when the
+app context tears down, so every helper used during a request shares one
+connection and no request pays for opening the database file. Connections
+are opened in WAL mode so readers no longer block the teachers saving marks,
+and wait on busy_timeout instead of failing with "database is locked".
+
+GET-style endpoints can ask for a read-only connection, which comes from a
+separate pool opened with mode=ro and query_only.
+"""
+import os
+import queue
+import sqlite3
+
+from flask import g, has_app_context
+
+import metrics
+
+DATABASE = os.environ.get('SCHOOL_DB', 'school_management.db')
+
+# Idle connections kept open per pool
+POOL_SIZE = int(os.environ.get('DB_POOL_SIZE', '8'))
+
+BUSY_TIMEOUT_MS = 10000
+
+# Applied to every new connection
+TUNING_PRAGMAS = (
+    'PRAGMA synchronous = NORMAL',
+    f'PRAGMA busy_timeout = {BUSY_TIMEOUT_MS}',
+    'PRAGMA cache_size = -16000',          # 16 MB page cache
+    'PRAGMA mmap_size = 268435456',        # 256 MB memory-mapped reads
+    'PRAGMA temp_store = MEMORY',
+)
+
+
+class PooledConnection(sqlite3.Connection):
+    """Connection whose close() only discards uncommitted work.
+
+    Routes keep calling conn.close() in their finally blocks; the
+    connection itself is released to its pool at app context teardown.
+    """
+    pooled = True
+
+    def close(self):
+        if not self.pooled:
+            super().close()
+        elif self.in_transaction:
+            self.rollback()
+
+    def dispose(self):
+        super().close()
+
+    # Statements run through metrics.ProfiledCursor so requests see their SQL time
+    def cursor(self, factory=None):
+        if factory is None and metrics.PROFILE_SQL:
+            factory = metrics.ProfiledCursor
+        return super().cursor(factory) if factory else super().cursor()
+
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+    def executescript(self, sql_script):
+        return self.cursor().executescript(sql_script)
+
+
+def connect(database=None, readonly=False, pooled=False):
+    """Open a tuned connection to the school database"""
+    database = database or DATABASE
+    if readonly:
+        uri = f'file:{os.path.abspath(database)}?mode=ro'
+        conn = sqlite3.connect(uri, uri=True, timeout=BUSY_TIMEOUT_MS / 1000,
+                               check_same_thread=False, factory=PooledConnection)
+    else:
+        # URI filenames let archive.py ATTACH archives with mode=ro
+        conn = sqlite3.connect(f'file:{os.path.abspath(database)}', uri=True, timeout=BUSY_TIMEOUT_MS / 1000,
+                               check_same_thread=False, factory=PooledConnection)
+        # WAL is persistent, but setting it is cheap and covers fresh files
+        conn.execute('PRAGMA journal_mode = WAL')
+    conn.pooled = pooled
+    conn.row_factory = sqlite3.Row
+    for pragma in TUNING_PRAGMAS:
+        conn.execute(pragma)
+    if readonly:
+        conn.execute('PRAGMA query_only = ON')
+    return conn
+
+
+def database_path(conn):
+    """File of the main database of a connection"""
+    return conn.execute('PRAGMA database_list').fetchone()[2]
+
+
+class ConnectionPool:
+    def __init__(self, readonly=False, size=POOL_SIZE):
+        self.readonly = readonly
+        self.idle = queue.LifoQueue(maxsize=size)
+
+    def acquire(self):
+        try:
+            return self.idle.get_nowait()
+        except queue.Empty:
+            return connect(readonly=self.readonly, pooled=True)
+
+    def release(self, conn):
+        if conn.in_transaction:
+            conn.rollback()
+        try:
+            self.idle.put_nowait(conn)
+        except queue.Full:
+            conn.dispose()
+
+    def clear(self):
+        while True:
+            try:
+                self.idle.get_nowait().dispose()
+            except queue.Empty:
+                return
+
+
+_pools = {False: ConnectionPool(), True: ConnectionPool(readonly=True)}
+
+
+def clear_pools():
+    """Close the idle pooled connections, e.g. after changing DATABASE"""
+    for pool in _pools.values():
+        pool.clear()
+
+
+def get_db(readonly=False):
+    """Return the connection checked out for the current app context.
+
+    Outside an app context (startup code, scripts) a standalone connection
+    is returned and the caller's close() really closes it.
+    """
+    if not has_app_context():
+        return connect(readonly=readonly)
+
+    key = '_db_readonly' if readonly else '_db'
+    conn = g.get(key)
+    if conn is None:
+        conn = _pools[readonly].acquire()
+        setattr(g, key, conn)
+    return conn
+
+
+def release_db(exception=None):
+    for readonly, key in ((False, '_db'), (True, '_db_readonly')):
+        conn = g.pop(key, None)
+        if conn is not None:
+            _pools[readonly].release(conn)
+
+
+def init_app(app):
+    app.teardown_appcontext(release_db)
@@ -0,0 +1,127 @@
+"""Low-memory marks exports.
+
+Rows are streamed straight from the SQLite cursor: into an openpyxl
+write-only workbook that is spooled to a temporary file, or into CSV
+chunks (optionally gzip-compressed) yielded to the response as they are
+produced. No export holds more than one row of Python objects at a time.
+"""
+import csv
+import io
+import re
+import tempfile
+import zlib
+
+from openpyxl import Workbook
+
+from archive import year_source
+from marks_schema import CLASS_TABLES
+
+XLSX_MIMETYPE = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+
+# Workbooks larger than this spill from memory to a temporary file
+SPOOL_MAX_SIZE = 8 * 1024 * 1024
+
+CSV_CHUNK_ROWS = 500
+
+SCOPES = ('stream', 'class', 'school')
+
+
+def export_sheets(conn, scope, class_level, stream, year, term):
+    """Return an iterator of (sheet name, cursor) pairs for an export scope.
+
+    'stream' exports one stream, 'class' one sheet per stream of a class and
+    'school' one sheet per stream of every class. The arguments are checked
+    here so errors surface before a streamed response has started.
+    """
+    if scope not in SCOPES:
+        raise ValueError(f'Unknown export scope: {scope}')
+    if scope != 'school' and class_level not in CLASS_TABLES:
+        raise ValueError(f'Unknown class: {class_level}')
+    classes = CLASS_TABLES if scope == 'school' else (class_level,)
+
+    def sheets():
+        for table in classes:
+            source = year_source(conn, table, year)
+            if scope == 'stream':
+                streams = [stream]
+            else:
+                streams = [row[0] for row in conn.execute(f'''
+                    SELECT DISTINCT stream FROM {source}
+                    WHERE year = ? AND term = ?
+                    ORDER BY stream
+                ''', (year, term))]
+            for name in streams:
+                cursor = conn.execute(f'''
+                    SELECT * FROM {source}
+                    WHERE stream = ? AND year = ? AND term = ?
+                    ORDER BY std_no
+                ''', (name, year, term))
+                yield ('Marks' if scope == 'stream' else f'{table} {name}'), cursor
+
+    return sheets()
+
+
+def _sheet_title(name, used):
+    # Excel limits titles to 31 characters without []:*?/\ and unique per workbook
+    title = re.sub(r'[\[\]:*?/\\]', ' ', str(name or 'Marks'))[:31] or 'Marks'
+    base, suffix = title, 2
+    while title in used:
+        title = f'{base[:28]} {suffix}'
+        suffix += 1
+    used.add(title)
+    return title
+
+
+def write_xlsx(sheets):
+    """Write the sheets to a write-only workbook and return it as a file"""
+    workbook = Workbook(write_only=True)
+    used = set()
+    for name, cursor in sheets:
+        sheet = workbook.create_sheet(_sheet_title(name, used))
+        sheet.append([column[0] for column in cursor.description])
+        for row in cursor:
+            sheet.append(tuple(row))
+    if not used:
+        workbook.create_sheet('Marks')
+
+    output = tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_SIZE)
+    workbook.save(output)
+    output.seek(0)
+    return output
+
+
+def iter_csv(sheets, compress=False):
+    """Yield the rows of every sheet as CSV byte chunks.
+
+    The header is written once; rows of all sheets follow it, so the
+    class_level and stream columns tell the sheets apart.
+    """
+    compressor = zlib.compressobj(wbits=31) if compress else None
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    header_written = False
+
+    def flush():
+        data = buffer.getvalue().encode('utf-8')
+        buffer.seek(0)
+        buffer.truncate()
+        return compressor.compress(data) if compressor else data
+
+    for _, cursor in sheets:
+        if not header_written:
+            writer.writerow([column[0] for column in cursor.description])
+            header_written = True
+        while True:
+            rows = cursor.fetchmany(CSV_CHUNK_ROWS)
+            if not rows:
+                break
+            writer.writerows(rows)
+            chunk = flush()
+            if chunk:
+                yield chunk
+
+    chunk = flush()
+    if compressor:
+        chunk += compressor.flush()
+    if chunk:
+        yield chunk
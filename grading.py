@@ -0,0 +1,158 @@
+"""Vectorized report computation for a whole stream at once.
+
+The marks of a stream are loaded into a (students, subjects, components)
+NumPy array with NaN for blank cells. Continuous assessment averages, the
+20% CA / 80% EOT weighting, totals and grades are then computed for every
+student and subject in a handful of array operations, with grades looked up
+by a sorted-boundary search against the grading_system table.
+"""
+import numpy as np
+
+from marks_schema import CA_COMPONENTS, COMPONENTS, EXAM_SETS, MARK_COLUMNS, SUBJECT_CODES
+
+# Continuous assessment scores are entered out of 3
+CA_MAX_SCORE = 3.0
+CA_WEIGHT = 20
+EXAM_WEIGHT = 80
+
+_CA_COUNT = len(CA_COMPONENTS)
+_EXAM_INDEX = {exam: COMPONENTS.index(exam) for exam in EXAM_SETS}
+
+
+def marks_matrix(students):
+    """(students, subjects, components) float array of the students' marks"""
+    values = np.array(
+        [[student[column] for column in MARK_COLUMNS] for student in students],
+        dtype=float,
+    )
+    return values.reshape(len(students), len(SUBJECT_CODES), len(COMPONENTS))
+
+
+class GradeScale:
+    """Grade lookup built from grading_system rows"""
+
+    def __init__(self, grading):
+        bands = sorted(grading, key=lambda band: band['min_score'])
+        self.boundaries = np.array([band['min_score'] for band in bands], dtype=float)
+        self.grades = np.array([band['grade'] for band in bands] + [None], dtype=object)
+        # Scores in the lowest band fail
+        self.pass_mark = float(self.boundaries[1]) if len(bands) > 1 else 0.0
+
+    def lookup(self, scores):
+        """Grade of every score; None for blanks and scores below the scale"""
+        index = np.searchsorted(self.boundaries, scores, side='right') - 1
+        index[np.isnan(scores) | (index < 0)] = len(self.boundaries)
+        return self.grades[index]
+
+
+def _mean(values, axis):
+    """nanmean without the empty-slice warning, NaN where nothing is entered"""
+    present = ~np.isnan(values)
+    count = present.sum(axis=axis)
+    total = np.where(present, values, 0).sum(axis=axis)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return np.where(count > 0, total / count, np.nan)
+
+
+def _subject_scores(marks, report_type):
+    """CA average, weighted scores and total of every student and subject.
+
+    For BOT and MOT reports a subject's total is its exam score. For EOT
+    the CA average is scaled to 20% and added to 80% of the EOT score.
+    """
+    ca_average = _mean(marks[:, :, :_CA_COUNT], axis=2)
+    exam = marks[:, :, _EXAM_INDEX[report_type]]
+
+    if report_type == 'EOT':
+        ca_weighted = ca_average / CA_MAX_SCORE * CA_WEIGHT
+        exam_weighted = exam * EXAM_WEIGHT / 100
+        total = np.where(np.isnan(ca_weighted), 0, ca_weighted) + exam_weighted
+    else:
+        ca_weighted = np.full_like(exam, np.nan)
+        exam_weighted = np.full_like(exam, np.nan)
+        total = exam
+    return ca_average, exam, ca_weighted, exam_weighted, total
+
+
+def subject_totals(students, report_type):
+    """(students, subjects) array of subject totals, NaN where not scored"""
+    return _subject_scores(marks_matrix(students), report_type)[-1]
+
+
+def overall_scores(students, report_type):
+    """(total, average, subjects scored) of every student for an exam set.
+
+    The average is None for students with no score in the exam set.
+    """
+    if not students:
+        return []
+    total = subject_totals(students, report_type)
+    counts = (~np.isnan(total)).sum(axis=1)
+    totals = np.where(np.isnan(total), 0, total).sum(axis=1)
+    averages = _mean(total, axis=1)
+    return [
+        (round(float(totals[i]), 1),
+         None if np.isnan(averages[i]) else round(float(averages[i]), 1),
+         int(counts[i]))
+        for i in range(len(students))
+    ]
+
+
+def compute_results(students, grading, report_type):
+    """Per-subject scores, totals and grades for every student.
+
+    Subject totals are computed by _subject_scores. Returns one dict per
+    student, in the order given, listing only the subjects the student has
+    marks for.
+    """
+    if not students:
+        return []
+    marks = marks_matrix(students)
+    scale = GradeScale(grading)
+
+    ca = marks[:, :, :_CA_COUNT]
+    ca_average, exam, ca_weighted, exam_weighted, total = _subject_scores(marks, report_type)
+
+    grades = scale.lookup(total)
+    identifier = np.rint(ca_average)
+    taken = ~np.isnan(marks).all(axis=2)
+    overall_total = np.where(np.isnan(total), 0, total).sum(axis=1)
+    overall_average = _mean(total, axis=1)
+
+    columns = {
+        'ca_average': np.round(ca_average, 1),
+        'ca_weighted': np.round(ca_weighted, 1),
+        'exam': exam,
+        'exam_weighted': np.round(exam_weighted),
+        'total': np.round(total),
+        'identifier': identifier,
+    }
+    columns = {name: _to_python(values) for name, values in columns.items()}
+    ca_scores = _to_python(ca)
+    grades = grades.tolist()
+    taken = taken.tolist()
+
+    results = []
+    for i, student in enumerate(students):
+        subjects = []
+        for j, code in enumerate(SUBJECT_CODES):
+            if not taken[i][j]:
+                continue
+            subject = {'subject': code, 'ca': ca_scores[i][j], 'grade': grades[i][j]}
+            for name, values in columns.items():
+                subject[name] = values[i][j]
+            subjects.append(subject)
+        results.append({
+            'std_no': student['std_no'],
+            'subjects': subjects,
+            'total': round(float(overall_total[i]), 1),
+            'average': None if np.isnan(overall_average[i]) else round(float(overall_average[i]), 1),
+        })
+    return results
+
+
+def _to_python(values):
+    """Convert an array to nested lists with None in place of NaN"""
+    values = np.asarray(values, dtype=object)
+    values[np.isnan(values.astype(float))] = None
+    return values.tolist()
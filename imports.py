@@ -0,0 +1,206 @@
+"""Bulk import of students and marks from .xlsx or CSV files.
+
+The file is read as a stream (openpyxl read-only mode for workbooks) and
+its header row mapped to class-table columns: identity columns by name or
+a common alias ('Student Name', 'Sex', ...), mark columns by their table
+name (engBOT) or a subject and component ('MATH BOT', 'ENG1 1'). Rows are
+validated and written CHUNK_SIZE at a time, each chunk in one transaction
+through marks_store.save_students, so existing students are updated and
+only the columns present in the file are touched: a blank identity cell
+or a missing gender or section column keeps the stored value. Files
+exported by export_excel can be imported back unchanged.
+"""
+import codecs
+import csv
+import re
+
+from openpyxl import load_workbook
+
+from grading import CA_MAX_SCORE
+from marks_long import MARK_CELLS
+from marks_schema import CA_COMPONENTS, IDENTITY_COLUMNS, subject_code
+from marks_store import check_class_table, parse_mark, save_students
+
+CHUNK_SIZE = 500
+
+EXAM_MAX_SCORE = 100.0
+
+# Rejected rows listed in a report; the total count is always given
+MAX_REPORTED_REJECTIONS = 1000
+
+HEADER_ALIASES = {
+    'student number': 'std_no', 'student no': 'std_no', 'std no': 'std_no', 'card number': 'std_no',
+    'name': 'sdt_name', 'student name': 'sdt_name', 'student': 'sdt_name',
+    'class': 'class_level', 'sex': 'gender',
+}
+
+# Columns written by export_excel that are not imported
+SKIPPED_COLUMNS = {'id', 'created_at', 'updated_at', 'row_version'}
+
+_MARK_COLUMN_NAMES = {column.lower(): column for column, _, _ in MARK_CELLS}
+_CELL_COLUMNS = {(code, component.upper()): column for column, code, component in MARK_CELLS}
+_MAX_SCORES = {
+    column: CA_MAX_SCORE if component in CA_COMPONENTS else EXAM_MAX_SCORE
+    for column, _, component in MARK_CELLS
+}
+
+
+def map_header(label):
+    """Class-table column of a header cell, None if it is not recognised"""
+    text = re.sub(r'[\s_]+', ' ', str(label or '')).strip().lower()
+    if not text:
+        return None
+    column = HEADER_ALIASES.get(text, text.replace(' ', '_'))
+    if column in IDENTITY_COLUMNS or column in SKIPPED_COLUMNS:
+        return column
+    if text.replace(' ', '') in _MARK_COLUMN_NAMES:
+        return _MARK_COLUMN_NAMES[text.replace(' ', '')]
+    # '<subject> <component>', e.g. 'MATH BOT' or 'ENG1 1'
+    parts = text.rsplit(' ', 1)
+    if len(parts) == 2:
+        code = subject_code(parts[0])
+        return _CELL_COLUMNS.get((code, parts[1].upper()))
+    return None
+
+
+def read_rows(stream, filename):
+    """Yield the rows of the first sheet of an .xlsx file or of a CSV file"""
+    if filename.lower().endswith('.xlsx'):
+        workbook = load_workbook(stream, read_only=True, data_only=True)
+        try:
+            yield from workbook.worksheets[0].iter_rows(values_only=True)
+        finally:
+            workbook.close()
+    elif filename.lower().endswith('.csv'):
+        # utf-8-sig drops the byte order mark Excel writes at the start of CSV files
+        yield from csv.reader(codecs.iterdecode(stream, 'utf-8-sig'))
+    else:
+        raise ValueError('Only .xlsx and .csv files can be imported')
+
+
+def _validate(values, columns, defaults, class_level):
+    """Return (student dict, errors) for one data row"""
+    student = dict(defaults)
+    errors = []
+    for column, value in zip(columns, values):
+        if column is None or column in SKIPPED_COLUMNS:
+            continue
+        if isinstance(value, str):
+            value = value.strip()
+        if value is None or value == '':
+            if column not in IDENTITY_COLUMNS:
+                student[column] = None
+            continue
+        if column in IDENTITY_COLUMNS:
+            student[column] = value
+            continue
+        try:
+            mark = parse_mark(value)
+        except ValueError as e:
+            errors.append(f'{column}: {e}')
+            continue
+        limit = _MAX_SCORES[column]
+        if not 0 <= mark <= limit:
+            errors.append(f'{column}: {mark:g} is outside 0-{limit:g}')
+        student[column] = mark
+
+    for column in ('std_no', 'year'):
+        value = student.get(column)
+        if value is None or value == '':
+            errors.append(f'{column} is required')
+            continue
+        if isinstance(value, float) and value.is_integer():
+            value = int(value)
+        try:
+            student[column] = int(str(value).strip())
+        except ValueError:
+            errors.append(f'{column}: {value!r} is not a whole number')
+    if not str(student.get('term') or '').strip():
+        errors.append('term is required')
+    # Name and stream are only needed for a new student, see import_students
+    for column in ('sdt_name', 'stream', 'term'):
+        text = str(student.get(column) or '').strip()
+        if text:
+            student[column] = text
+        else:
+            student.pop(column, None)
+    if student.get('class_level') and str(student['class_level']).strip().upper() != class_level:
+        errors.append(f"class_level: {student['class_level']} is not {class_level}")
+    student['class_level'] = class_level
+    if student.get('gender'):
+        gender = str(student['gender']).strip().upper()[:1]
+        if gender not in ('M', 'F'):
+            errors.append(f"gender: {student['gender']!r} is not M or F")
+        student['gender'] = gender
+    return student, errors
+
+
+def _student_exists(conn, class_level, key):
+    return conn.execute(f'''
+        SELECT 1 FROM {class_level} WHERE std_no = ? AND year = ? AND term = ?
+    ''', key).fetchone() is not None
+
+
+def import_students(conn, rows, class_level, defaults=None, dry_run=False):
+    """Validate and import the rows of a file into a class table.
+
+    `rows` is an iterator whose first item is the header row. `defaults`
+    supplies identity values (stream, year, term, ...) missing from the
+    file. Only std_no, year and term are required on every row; a student
+    not yet in the class for that term also needs a name and a stream.
+    Valid rows are written in chunks unless dry_run is set; rejected rows
+    are reported with their line number and reasons.
+    """
+    check_class_table(class_level)
+    rows = iter(rows)
+    header = next(rows, None)
+    if header is None:
+        raise ValueError('The file is empty')
+    columns = [map_header(label) for label in header]
+    mapped = [column for column in columns if column]
+    if 'std_no' not in mapped:
+        raise ValueError('The file has no student number column')
+    duplicated = {column for column in mapped if mapped.count(column) > 1}
+    if duplicated:
+        raise ValueError(f"Columns mapped more than once: {', '.join(sorted(duplicated))}")
+
+    defaults = {key: value for key, value in (defaults or {}).items() if value not in (None, '')}
+    report = {
+        'dry_run': dry_run,
+        'columns': mapped,
+        'ignored_columns': [str(label) for label, column in zip(header, columns) if label and not column],
+        'imported': 0,
+        'rejected_count': 0,
+        'rejected': [],
+    }
+    seen = set()
+    chunk = []
+
+    def flush():
+        if chunk and not dry_run:
+            save_students(conn, class_level, chunk)
+        report['imported'] += len(chunk)
+        chunk.clear()
+
+    for line, values in enumerate(rows, start=2):
+        if not any(value not in (None, '') for value in values):
+            continue
+        student, errors = _validate(values, columns, defaults, class_level)
+        key = (student.get('std_no'), student.get('year'), student.get('term'))
+        if not errors and key in seen:
+            errors.append(f'student {key[0]} appears more than once for {key[1]} {key[2]}')
+        if not errors:
+            missing = [column for column in ('sdt_name', 'stream') if column not in student]
+            if missing and not _student_exists(conn, class_level, key):
+                errors.extend(f'{column} is required for a new student' for column in missing)
+        if errors:
+            report['rejected_count'] += 1
+            if len(report['rejected']) < MAX_REPORTED_REJECTIONS:
+                report['rejected'].append({'line': line, 'std_no': student.get('std_no'), 'errors': errors})
+            continue
+        seen.add(key)
+        chunk.append(student)
+        if len(chunk) >= CHUNK_SIZE:
+            flush()
+    flush()
+    return report
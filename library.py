@@ -0,0 +1,376 @@
+"""Library catalog, borrowing and full-text search.
+
+Catalog search goes through books_fts, an FTS5 index over the title,
+author, ISBN and category of every book, kept in sync with the books table
+by triggers. Search terms are matched as prefixes, so 'math text' finds
+'Mathematics Textbook'. On an SQLite build without FTS5 the index is not
+created and search falls back to LIKE scans.
+
+Issuing and returning a copy update the borrowing record and the book's
+available_copies in one transaction; a copy can only be issued while one
+is available.
+
+Loans past their return date are marked 'overdue' and their fines accrued
+by update_overdue(), a set-based batch run daily by
+scripts/update_library_fines.py; requests never accrue fines themselves.
+The library_stats row holds the counters shown on the library page; it is
+kept current by triggers, so reading the stats is a single-row lookup.
+"""
+import os
+import re
+import sqlite3
+from datetime import date
+
+BOOK_COLUMNS = ('book_title', 'author', 'isbn', 'category', 'total_copies')
+
+DEFAULT_PAGE_SIZE = 25
+MAX_PAGE_SIZE = 200
+
+# Fine charged for each day a loan is overdue (UGX)
+FINE_PER_DAY = float(os.environ.get('LIBRARY_FINE_PER_DAY', '500'))
+
+STATS_COLUMNS = (
+    'titles', 'copies', 'available_copies', 'open_loans', 'overdue_loans',
+    'fines_outstanding', 'fines_charged',
+)
+
+
+def create_search_index(conn):
+    """Create books_fts and its triggers; False if SQLite lacks FTS5"""
+    try:
+        conn.execute('''
+            CREATE VIRTUAL TABLE IF NOT EXISTS books_fts USING fts5(
+                book_title, author, isbn, category,
+                content='books', content_rowid='id'
+            )
+        ''')
+    except sqlite3.OperationalError as e:
+        if 'fts5' not in str(e):
+            raise
+        return False
+
+    conn.execute('''
+        CREATE TRIGGER IF NOT EXISTS trg_books_fts_insert AFTER INSERT ON books BEGIN
+            INSERT INTO books_fts (rowid, book_title, author, isbn, category)
+            VALUES (NEW.id, NEW.book_title, NEW.author, NEW.isbn, NEW.category);
+        END
+    ''')
+    conn.execute('''
+        CREATE TRIGGER IF NOT EXISTS trg_books_fts_delete AFTER DELETE ON books BEGIN
+            INSERT INTO books_fts (books_fts, rowid, book_title, author, isbn, category)
+            VALUES ('delete', OLD.id, OLD.book_title, OLD.author, OLD.isbn, OLD.category);
+        END
+    ''')
+    # Copy counts change on every issue and return; only re-index catalog edits
+    conn.execute('''
+        CREATE TRIGGER IF NOT EXISTS trg_books_fts_update
+        AFTER UPDATE OF book_title, author, isbn, category ON books BEGIN
+            INSERT INTO books_fts (books_fts, rowid, book_title, author, isbn, category)
+            VALUES ('delete', OLD.id, OLD.book_title, OLD.author, OLD.isbn, OLD.category);
+            INSERT INTO books_fts (rowid, book_title, author, isbn, category)
+            VALUES (NEW.id, NEW.book_title, NEW.author, NEW.isbn, NEW.category);
+        END
+    ''')
+    conn.execute("INSERT INTO books_fts (books_fts) VALUES ('rebuild')")
+    return True
+
+
+def create_library_indexes(conn):
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_books_title ON books (book_title, id)')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_borrowing_book ON book_borrowing (book_id, status)')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_borrowing_student ON book_borrowing (std_no, status)')
+
+
+def create_overdue_index(conn):
+    # Lets update_overdue reach the loans falling due without a table scan
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_borrowing_status_due ON book_borrowing (status, return_date)')
+
+
+def has_search_index(conn):
+    return conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'books_fts'"
+    ).fetchone() is not None
+
+
+def match_expression(text):
+    """FTS5 query matching every word of `text` as a prefix"""
+    words = re.findall(r'\w+', text or '')
+    return ' '.join(f'"{word}"*' for word in words)
+
+
+def _page(page, per_page):
+    try:
+        page = max(int(page or 1), 1)
+        per_page = min(max(int(per_page or DEFAULT_PAGE_SIZE), 1), MAX_PAGE_SIZE)
+    except (TypeError, ValueError):
+        raise ValueError('page and per_page must be whole numbers')
+    return page, per_page
+
+
+def list_books(conn, query=None, category=None, page=1, per_page=DEFAULT_PAGE_SIZE):
+    """One page of the catalog, best matches first when searching.
+
+    Returns {'books': [...], 'total': matching books, 'page', 'per_page'}.
+    """
+    page, per_page = _page(page, per_page)
+    where, params = [], []
+    order = 'b.book_title, b.id'
+    source = 'books AS b'
+
+    expression = match_expression(query)
+    if expression and has_search_index(conn):
+        source = 'books_fts JOIN books AS b ON b.id = books_fts.rowid'
+        where.append('books_fts MATCH ?')
+        params.append(expression)
+        order = 'books_fts.rank, b.id'
+    elif expression:
+        for word in re.findall(r'\w+', query):
+            where.append('(b.book_title LIKE ? OR b.author LIKE ? OR b.isbn LIKE ? OR b.category LIKE ?)')
+            params.extend([f'%{word}%'] * 4)
+    if category:
+        where.append('b.category = ?')
+        params.append(category)
+
+    where_sql = f"WHERE {' AND '.join(where)}" if where else ''
+    total = conn.execute(f'SELECT COUNT(*) FROM {source} {where_sql}', params).fetchone()[0]
+    rows = conn.execute(f'''
+        SELECT b.* FROM {source} {where_sql}
+        ORDER BY {order}
+        LIMIT ? OFFSET ?
+    ''', (*params, per_page, (page - 1) * per_page)).fetchall()
+    return {'books': [dict(row) for row in rows], 'total': total, 'page': page, 'per_page': per_page}
+
+
+def _book_values(data, partial=False):
+    values = {}
+    for column in BOOK_COLUMNS:
+        if column not in data:
+            continue
+        value = data[column]
+        if column == 'total_copies':
+            try:
+                value = int(value)
+            except (TypeError, ValueError):
+                raise ValueError('total_copies must be a whole number')
+            if value < 0:
+                raise ValueError('total_copies cannot be negative')
+        else:
+            value = str(value or '').strip() or None
+        values[column] = value
+    if not partial:
+        for column in ('book_title', 'author', 'total_copies'):
+            if values.get(column) is None:
+                raise ValueError(f'{column} is required')
+    return values
+
+
+def add_book(conn, data):
+    """Insert a book with all its copies available and return its id"""
+    values = _book_values(data)
+    with conn:
+        cursor = conn.execute('''
+            INSERT INTO books (book_title, author, isbn, category, total_copies, available_copies)
+            VALUES (?, ?, ?, ?, ?, ?)
+        ''', (values['book_title'], values['author'], values.get('isbn'), values.get('category'),
+              values['total_copies'], values['total_copies']))
+    return cursor.lastrowid
+
+
+def update_book(conn, book_id, data):
+    """Edit a book; changing total_copies moves available_copies by the same amount"""
+    values = _book_values(data, partial=True)
+    if not values:
+        raise ValueError('Nothing to update')
+    with conn:
+        book = conn.execute('SELECT total_copies, available_copies FROM books WHERE id = ?', (book_id,)).fetchone()
+        if book is None:
+            raise LookupError('Book not found')
+        if 'total_copies' in values:
+            on_loan = (book[0] or 0) - (book[1] or 0)
+            if values['total_copies'] < on_loan:
+                raise ValueError(f'{on_loan} copies are on loan; total_copies cannot be lower')
+            values['available_copies'] = values['total_copies'] - on_loan
+        assignments = ', '.join(f'{column} = ?' for column in values)
+        conn.execute(f'UPDATE books SET {assignments} WHERE id = ?', (*values.values(), book_id))
+
+
+def delete_book(conn, book_id):
+    with conn:
+        on_loan = conn.execute('''
+            SELECT COUNT(*) FROM book_borrowing WHERE book_id = ? AND status IN ('borrowed', 'overdue')
+        ''', (book_id,)).fetchone()[0]
+        if on_loan:
+            raise ValueError(f'{on_loan} copies are still on loan')
+        if conn.execute('DELETE FROM books WHERE id = ?', (book_id,)).rowcount == 0:
+            raise LookupError('Book not found')
+
+
+def issue_book(conn, book_id, std_no, class_level, return_date):
+    """Lend one copy of a book and return the borrowing id"""
+    try:
+        due = date.fromisoformat(str(return_date))
+    except ValueError:
+        raise ValueError('return_date must be a date (YYYY-MM-DD)')
+    today = date.today()
+    if due < today:
+        raise ValueError('return_date is in the past')
+    with conn:
+        taken = conn.execute('''
+            UPDATE books SET available_copies = available_copies - 1
+            WHERE id = ? AND available_copies > 0
+        ''', (book_id,)).rowcount
+        if not taken:
+            exists = conn.execute('SELECT 1 FROM books WHERE id = ?', (book_id,)).fetchone()
+            raise (ValueError('No copies available') if exists else LookupError('Book not found'))
+        cursor = conn.execute('''
+            INSERT INTO book_borrowing (book_id, std_no, class_level, borrow_date, return_date, status)
+            VALUES (?, ?, ?, ?, ?, 'borrowed')
+        ''', (book_id, std_no, class_level, today.isoformat(), due.isoformat()))
+    return cursor.lastrowid
+
+
+def return_book(conn, borrowing_id, fine_amount=None):
+    """Close a loan. Without a fine_amount the fine accrued up to today is charged."""
+    if fine_amount not in (None, ''):
+        try:
+            fine_amount = float(fine_amount)
+        except (TypeError, ValueError):
+            raise ValueError('fine_amount must be a number')
+        if fine_amount < 0:
+            raise ValueError('fine_amount cannot be negative')
+    today = date.today().isoformat()
+    with conn:
+        borrowing = conn.execute('''
+            SELECT book_id, MAX(julianday(?) - julianday(return_date), 0) * ?
+            FROM book_borrowing WHERE id = ? AND status IN ('borrowed', 'overdue')
+        ''', (today, FINE_PER_DAY, borrowing_id)).fetchone()
+        if borrowing is None or borrowing[0] is None:
+            raise LookupError('No open borrowing with that id')
+        if fine_amount in (None, ''):
+            fine_amount = borrowing[1] or 0
+        conn.execute('''
+            UPDATE book_borrowing
+            SET status = 'returned', actual_return_date = ?, fine_amount = ?
+            WHERE id = ?
+        ''', (today, fine_amount, borrowing_id))
+        conn.execute('''
+            UPDATE books SET available_copies = available_copies + 1 WHERE id = ?
+        ''', (borrowing[0],))
+    return fine_amount
+
+
+def student_borrowings(conn, std_no):
+    """Books a student has not returned yet, oldest first"""
+    rows = conn.execute('''
+        SELECT bb.id, bb.book_id, b.book_title, bb.borrow_date, bb.return_date, bb.status, bb.fine_amount
+        FROM book_borrowing AS bb JOIN books AS b ON b.id = bb.book_id
+        WHERE bb.std_no = ? AND bb.status IN ('borrowed', 'overdue')
+        ORDER BY bb.borrow_date, bb.id
+    ''', (std_no,)).fetchall()
+    return [dict(row) for row in rows]
+
+
+def create_stats_table(conn):
+    """Single-row library_stats table and the triggers keeping it current"""
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS library_stats (
+            id INTEGER PRIMARY KEY CHECK (id = 1),
+            titles INTEGER NOT NULL DEFAULT 0,
+            copies INTEGER NOT NULL DEFAULT 0,
+            available_copies INTEGER NOT NULL DEFAULT 0,
+            open_loans INTEGER NOT NULL DEFAULT 0,
+            overdue_loans INTEGER NOT NULL DEFAULT 0,
+            fines_outstanding REAL NOT NULL DEFAULT 0,
+            fines_charged REAL NOT NULL DEFAULT 0,
+            fines_updated_on DATE
+        )
+    ''')
+    conn.execute('INSERT OR IGNORE INTO library_stats (id) VALUES (1)')
+
+    book_delta = '''
+        UPDATE library_stats SET
+            titles = titles + {sign},
+            copies = copies + {sign} * COALESCE({row}.total_copies, 0),
+            available_copies = available_copies + {sign} * COALESCE({row}.available_copies, 0)
+        WHERE id = 1;
+    '''
+    # Open loans count until returned; overdue fines are outstanding until
+    # the return, when the fine charged is added to fines_charged
+    loan_delta = '''
+        UPDATE library_stats SET
+            open_loans = open_loans + {sign} * ({row}.status IN ('borrowed', 'overdue')),
+            overdue_loans = overdue_loans + {sign} * ({row}.status = 'overdue'),
+            fines_outstanding = fines_outstanding
+                + {sign} * (CASE WHEN {row}.status = 'overdue' THEN COALESCE({row}.fine_amount, 0) ELSE 0 END),
+            fines_charged = fines_charged
+                + {sign} * (CASE WHEN {row}.status = 'returned' THEN COALESCE({row}.fine_amount, 0) ELSE 0 END)
+        WHERE id = 1;
+    '''
+    triggers = {
+        'trg_books_stats_insert': ('AFTER INSERT ON books', book_delta.format(sign=1, row='NEW')),
+        'trg_books_stats_delete': ('AFTER DELETE ON books', book_delta.format(sign=-1, row='OLD')),
+        'trg_books_stats_update': (
+            'AFTER UPDATE OF total_copies, available_copies ON books',
+            book_delta.format(sign=-1, row='OLD') + book_delta.format(sign=1, row='NEW'),
+        ),
+        'trg_borrowing_stats_insert': ('AFTER INSERT ON book_borrowing', loan_delta.format(sign=1, row='NEW')),
+        'trg_borrowing_stats_delete': ('AFTER DELETE ON book_borrowing', loan_delta.format(sign=-1, row='OLD')),
+        'trg_borrowing_stats_update': (
+            'AFTER UPDATE OF status, fine_amount ON book_borrowing',
+            loan_delta.format(sign=-1, row='OLD') + loan_delta.format(sign=1, row='NEW'),
+        ),
+    }
+    for name, (event, body) in triggers.items():
+        conn.execute(f'DROP TRIGGER IF EXISTS {name}')
+        conn.execute(f'CREATE TRIGGER {name} {event} BEGIN {body} END')
+
+
+def recount_stats(conn):
+    """Recompute library_stats from the tables (the triggers keep it current)"""
+    conn.execute('''
+        UPDATE library_stats SET
+            titles = (SELECT COUNT(*) FROM books),
+            copies = (SELECT COALESCE(SUM(total_copies), 0) FROM books),
+            available_copies = (SELECT COALESCE(SUM(available_copies), 0) FROM books),
+            open_loans = (SELECT COUNT(*) FROM book_borrowing WHERE status IN ('borrowed', 'overdue')),
+            overdue_loans = (SELECT COUNT(*) FROM book_borrowing WHERE status = 'overdue'),
+            fines_outstanding = (
+                SELECT COALESCE(SUM(fine_amount), 0) FROM book_borrowing WHERE status = 'overdue'
+            ),
+            fines_charged = (
+                SELECT COALESCE(SUM(fine_amount), 0) FROM book_borrowing WHERE status = 'returned'
+            )
+        WHERE id = 1
+    ''')
+
+
+def update_overdue(conn, today=None):
+    """Mark loans past their return date overdue and accrue their fines.
+
+    Two set-based UPDATEs over the (status, return_date) index: newly
+    overdue loans, then the fines of every overdue loan up to `today`.
+    Returns (newly overdue, overdue in total).
+    """
+    today = (today or date.today()).isoformat()
+    with conn:
+        newly_overdue = conn.execute('''
+            UPDATE book_borrowing SET status = 'overdue'
+            WHERE status = 'borrowed' AND return_date < ?
+        ''', (today,)).rowcount
+        conn.execute('''
+            UPDATE book_borrowing
+            SET fine_amount = (julianday(?) - julianday(return_date)) * ?
+            WHERE status = 'overdue' AND return_date < ?
+            AND fine_amount IS NOT (julianday(?) - julianday(return_date)) * ?
+        ''', (today, FINE_PER_DAY, today, today, FINE_PER_DAY))
+        conn.execute('UPDATE library_stats SET fines_updated_on = ? WHERE id = 1', (today,))
+        overdue = conn.execute('SELECT overdue_loans FROM library_stats WHERE id = 1').fetchone()[0]
+    return newly_overdue, overdue
+
+
+def library_stats(conn):
+    """The library_stats counters, plus the date fines were last accrued"""
+    row = conn.execute(f'''
+        SELECT {', '.join(STATS_COLUMNS)}, fines_updated_on FROM library_stats WHERE id = 1
+    ''').fetchone()
+    return dict(zip(STATS_COLUMNS + ('fines_updated_on',), row)) if row else None
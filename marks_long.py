@@ -0,0 +1,173 @@
+"""Normalized long-format storage for student marks.
+
+Instead of 210 mostly-NULL REAL columns per student, every non-blank score
+is one row of the `marks` table keyed by class, student, term, subject and
+component. The S1-S6 tables keep the student identity columns, and the
+{class}_wide views pivot the marks back into the familiar wide layout so
+readers that expect SELECT * rows keep working.
+
+A database is switched to this engine with scripts/convert_marks.py, which
+records the choice under 'marks_storage' in the app_meta table.
+"""
+import sqlite3
+
+from marks_schema import (
+    CLASS_TABLES, COMPONENTS, IDENTITY_COLUMNS, MARK_COLUMNS, SUBJECT_CODES,
+)
+
+WIDE = 'wide'
+LONG = 'long'
+
+# (column, subject, component) for every mark column of the wide layout
+MARK_CELLS = tuple(
+    (code + component, code, component)
+    for code in SUBJECT_CODES for component in COMPONENTS
+)
+
+_IDENTITY_COLUMNS = ('id',) + IDENTITY_COLUMNS
+
+
+def create_marks_table(conn):
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS marks (
+            class_level TEXT NOT NULL,
+            student_id INTEGER NOT NULL,
+            year INTEGER NOT NULL,
+            term TEXT NOT NULL,
+            subject TEXT NOT NULL,
+            component TEXT NOT NULL,
+            score REAL,
+            PRIMARY KEY (class_level, year, term, student_id, subject, component)
+        ) WITHOUT ROWID
+    ''')
+    # Covers per-subject reads of a class without touching the other subjects
+    conn.execute('''
+        CREATE INDEX IF NOT EXISTS idx_marks_subject
+        ON marks (class_level, year, term, subject, student_id, component, score)
+    ''')
+
+
+def wide_view_name(class_level):
+    return f'{class_level}_wide'
+
+
+def create_wide_views(conn):
+    """(Re)create the {class}_wide views from the subject registry"""
+    pivots = ',\n                '.join(
+        f"MAX(CASE WHEN m.subject = '{subject}' AND m.component = '{component}' "
+        f"THEN m.score END) AS {column}"
+        for column, subject, component in MARK_CELLS
+    )
+    for table in CLASS_TABLES:
+        identity = ', '.join(f'c.{column}' for column in _IDENTITY_COLUMNS)
+        # row_version only exists once migration 3 has run
+        table_columns = {row[1] for row in conn.execute(f'PRAGMA table_info({table})')}
+        trailing = ['c.created_at', 'c.updated_at']
+        if 'row_version' in table_columns:
+            trailing.append('c.row_version')
+        conn.execute(f'DROP VIEW IF EXISTS {wide_view_name(table)}')
+        conn.execute(f'''
+            CREATE VIEW {wide_view_name(table)} AS
+            SELECT {identity},
+                {pivots},
+                {', '.join(trailing)}
+            FROM {table} c
+            LEFT JOIN marks m
+                ON m.class_level = '{table}' AND m.year = c.year
+                AND m.term = c.term AND m.student_id = c.std_no
+            GROUP BY {identity}, {', '.join(trailing)}
+        ''')
+
+
+def marks_storage(conn):
+    """Return the storage engine recorded for this database"""
+    try:
+        row = conn.execute(
+            "SELECT value FROM app_meta WHERE key = 'marks_storage'"
+        ).fetchone()
+    except sqlite3.OperationalError:
+        # Database not migrated yet, so it can only hold wide rows
+        return WIDE
+    return row[0] if row else WIDE
+
+
+def set_marks_storage(conn, storage):
+    conn.execute('''
+        INSERT INTO app_meta (key, value) VALUES ('marks_storage', ?)
+        ON CONFLICT(key) DO UPDATE SET value = excluded.value
+    ''', (storage,))
+
+
+def marks_source(conn, class_level):
+    """Table or view to SELECT wide student rows of a class from"""
+    if marks_storage(conn) == LONG:
+        return wide_view_name(class_level)
+    return class_level
+
+
+def copy_wide_to_long(conn, class_level):
+    """Copy every non-NULL mark of a class table into `marks`.
+
+    Runs one INSERT ... SELECT per mark column inside the caller's
+    transaction and returns the number of rows copied.
+    """
+    copied = 0
+    for column, subject, component in MARK_CELLS:
+        cursor = conn.execute(f'''
+            INSERT INTO marks (class_level, student_id, year, term, subject, component, score)
+            SELECT ?, std_no, year, term, ?, ?, {column}
+            FROM {class_level}
+            WHERE {column} IS NOT NULL AND std_no IS NOT NULL
+            ON CONFLICT (class_level, year, term, student_id, subject, component)
+            DO UPDATE SET score = excluded.score
+        ''', (class_level, subject, component))
+        copied += cursor.rowcount
+    return copied
+
+
+def copy_long_to_wide(conn, class_level):
+    """Write the `marks` rows of a class back into its wide mark columns"""
+    for column, subject, component in MARK_CELLS:
+        conn.execute(f'''
+            UPDATE {class_level} SET {column} = (
+                SELECT score FROM marks
+                WHERE class_level = ? AND year = {class_level}.year
+                AND term = {class_level}.term AND student_id = {class_level}.std_no
+                AND subject = ? AND component = ?
+            )
+        ''', (class_level, subject, component))
+
+
+def clear_wide_marks(conn, class_level):
+    """NULL the mark columns of a class table once they live in `marks`"""
+    assignments = ', '.join(f'{column} = NULL' for column in MARK_COLUMNS)
+    conn.execute(f'UPDATE {class_level} SET {assignments}')
+
+
+def replace_student_marks(conn, class_level, columns, rows):
+    """Write the `columns` marks of each (std_no, year, term, scores) row.
+
+    Blank scores delete the cell; marks of other columns are left alone.
+    """
+    cells = [(subject, component) for column, subject, component in MARK_CELLS if column in columns]
+    conn.executemany('''
+        DELETE FROM marks
+        WHERE class_level = ? AND year = ? AND term = ? AND student_id = ?
+        AND subject = ? AND component = ?
+    ''', (
+        (class_level, year, term, std_no, subject, component)
+        for std_no, year, term, scores in rows
+        for (subject, component), score in zip(cells, scores)
+        if score is None
+    ))
+    conn.executemany('''
+        INSERT INTO marks (class_level, student_id, year, term, subject, component, score)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+        ON CONFLICT (class_level, year, term, student_id, subject, component)
+        DO UPDATE SET score = excluded.score
+    ''', (
+        (class_level, std_no, year, term, subject, component, score)
+        for std_no, year, term, scores in rows
+        for (subject, component), score in zip(cells, scores)
+        if score is not None
+    ))
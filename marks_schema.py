@@ -0,0 +1,92 @@
+"""Registry of the subjects and mark components stored in the class tables.
+
+scripts/create_database.py builds the S1-S6 and LEFT tables from this module
+and the marks endpoints in app.py build their column lists from it, so adding
+a subject only means adding its code here.
+"""
+
+CLASS_TABLES = ('S1', 'S2', 'S3', 'S4', 'S5', 'S6')
+
+# Column prefixes of the subjects, in the order they appear in the tables
+SUBJECT_CODES = (
+    'eng', 'mtc', 'bio', 'phy', 'geo', 'his', 'che', 'ict', 'ent', 'cre',
+    'agr', 'phe', 'kis', 'art', 'ire', 'lit', 'tad', 'fsn', 'lat', 'ate',
+    'lum', 'lug', 'lus', 'lba', 'lbl', 'run', 'rut', 'fre', 'ger', 'dho',
+)
+
+# Initials used by the subjects table, users.subjects_taught and the marks
+# entry filter that differ from the column prefixes
+SUBJECT_ALIASES = {
+    'ENG1': 'eng', 'ENG2': 'lit', 'MATH': 'mtc', 'HIST': 'his', 'CHEM': 'che',
+    'AGRIC': 'agr', 'PE': 'phe', 'T&D': 'tad', 'F&NT': 'fsn', 'LEBA': 'lba', 'LEBL': 'lbl',
+}
+
+# Four continuous assessment scores followed by the three exam sets
+CA_COMPONENTS = ('1', '2', '3', '4')
+EXAM_SETS = ('BOT', 'MOT', 'EOT')
+COMPONENTS = CA_COMPONENTS + EXAM_SETS
+
+# Student columns that precede the marks in every class table
+IDENTITY_COLUMNS = ('std_no', 'sdt_name', 'class_level', 'stream', 'year', 'term', 'gender', 'section')
+
+
+def subject_code(label):
+    """Column prefix for a subject code or initial, None if it is unknown"""
+    label = str(label or '').strip()
+    code = SUBJECT_ALIASES.get(label.upper(), label.lower())
+    return code if code in SUBJECT_CODES else None
+
+
+def subject_columns(code):
+    """Return the mark columns of one subject, e.g. eng1 ... engEOT"""
+    return tuple(code + component for component in COMPONENTS)
+
+
+MARK_COLUMNS = tuple(column for code in SUBJECT_CODES for column in subject_columns(code))
+
+
+def _mark_columns_ddl(indent):
+    lines = []
+    for code in SUBJECT_CODES:
+        lines.append(indent + ', '.join(f'{column} REAL' for column in subject_columns(code)) + ',')
+    return '\n'.join(lines)
+
+
+def class_table_ddl(table_name):
+    """CREATE TABLE statement for one of the S1-S6 class tables"""
+    return f'''
+        CREATE TABLE IF NOT EXISTS {table_name} (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            std_no INTEGER,
+            sdt_name TEXT,
+            class_level TEXT,
+            stream TEXT,
+            year INTEGER,
+            term TEXT,
+            gender TEXT,
+            section TEXT,
+{_mark_columns_ddl(' ' * 12)}
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    '''
+
+
+def left_table_ddl():
+    """CREATE TABLE statement for the LEFT table of graduated/deleted students"""
+    return f'''
+        CREATE TABLE IF NOT EXISTS LEFT (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            std_no INTEGER,
+            sdt_name TEXT,
+            class_level TEXT,
+            stream TEXT,
+            year INTEGER,
+            term TEXT,
+            gender TEXT,
+            section TEXT,
+{_mark_columns_ddl(' ' * 12)}
+            reason TEXT,
+            moved_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    '''
@@ -0,0 +1,273 @@
+"""Reads and batched writes of student marks in the S1-S6 class tables.
+
+The upsert statement for each class table is generated once from the
+registry in marks_schema and a whole stream is written with a single
+executemany inside one transaction. Reads can be projected onto a subset of
+subjects and components, with every column name taken from the registry.
+"""
+from archive import archived_table, check_writable
+from marks_long import LONG, MARK_CELLS, marks_storage, replace_student_marks, wide_view_name
+from marks_schema import CLASS_TABLES, COMPONENTS, IDENTITY_COLUMNS, MARK_COLUMNS, SUBJECT_CODES
+from rankings import refresh_students
+
+UPSERT_COLUMNS = IDENTITY_COLUMNS + MARK_COLUMNS
+
+# Unique student-term key (see migrations.py) identifying the row a save updates
+CONFLICT_COLUMNS = ('std_no', 'year', 'term')
+
+# Identity columns written by every save: the row key and the class the server sets
+KEY_COLUMNS = ('std_no', 'class_level', 'year', 'term')
+
+# Student columns always returned by load_stream
+READ_IDENTITY_COLUMNS = ('id',) + IDENTITY_COLUMNS + ('created_at', 'updated_at', 'row_version')
+
+_upsert_statements = {}
+
+# Marker for delta cells sent without the value the client loaded
+_UNCHECKED = object()
+
+
+def check_class_table(class_level):
+    """Raise ValueError unless class_level names one of the class tables"""
+    if class_level not in CLASS_TABLES:
+        raise ValueError(f'Unknown class: {class_level}')
+    return class_level
+
+
+def upsert_sql(class_level, columns=UPSERT_COLUMNS):
+    """Return the INSERT ... ON CONFLICT statement writing `columns` of a class table"""
+    statement = _upsert_statements.get((class_level, columns))
+    if statement is None:
+        check_class_table(class_level)
+        updates = ',\n                '.join(
+            f'{column} = excluded.{column}'
+            for column in columns if column not in CONFLICT_COLUMNS
+        )
+        statement = f'''
+            INSERT INTO {class_level} ({', '.join(columns)})
+            VALUES ({', '.join('?' * len(columns))})
+            ON CONFLICT({', '.join(CONFLICT_COLUMNS)}) DO UPDATE SET
+                {updates},
+                updated_at = CURRENT_TIMESTAMP,
+                row_version = row_version + 1
+        '''
+        _upsert_statements[(class_level, columns)] = statement
+    return statement
+
+
+def parse_mark(value):
+    """Convert a mark sent by the grid to a float, treating blanks as NULL"""
+    if value is None:
+        return None
+    if isinstance(value, str):
+        value = value.strip()
+        if not value:
+            return None
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        raise ValueError(f'Invalid mark: {value!r}')
+
+
+def projection_columns(subjects=None, components=None):
+    """Mark columns of the given subject codes and components, in table order"""
+    subjects = SUBJECT_CODES if subjects is None else subjects
+    components = COMPONENTS if components is None else components
+    for code in subjects:
+        if code not in SUBJECT_CODES:
+            raise ValueError(f'Unknown subject: {code}')
+    for component in components:
+        if component not in COMPONENTS:
+            raise ValueError(f'Unknown mark component: {component}')
+    return tuple(
+        column for column, code, component in MARK_CELLS
+        if code in subjects and component in components
+    )
+
+
+def load_stream(conn, class_level, stream, year, term, columns=MARK_COLUMNS):
+    """Student rows of a stream with the identity and the given mark columns.
+
+    On the long-format store a projected read fetches only the requested
+    subjects from `marks` through its per-subject index. An archived year
+    is read from its archive file.
+    """
+    check_class_table(class_level)
+    source, selected = class_level, READ_IDENTITY_COLUMNS + columns
+    from_marks = False
+    archived = archived_table(conn, class_level, year)
+    if archived:
+        source = archived
+    elif marks_storage(conn) == LONG:
+        if columns == MARK_COLUMNS:
+            source = wide_view_name(class_level)
+        else:
+            selected, from_marks = READ_IDENTITY_COLUMNS, True
+
+    students = [dict(row) for row in conn.execute(f'''
+        SELECT {', '.join(selected)} FROM {source}
+        WHERE stream = ? AND year = ? AND term = ?
+        ORDER BY std_no
+    ''', (stream, year, term))]
+    if not from_marks:
+        return students
+
+    cells = {column: (code, component) for column, code, component in MARK_CELLS if column in columns}
+    by_cell = {cell: column for column, cell in cells.items()}
+    codes = sorted({code for code, _ in cells.values()})
+    by_student = {}
+    for student in students:
+        student.update(dict.fromkeys(columns))
+        by_student[student['std_no']] = student
+    if codes:
+        rows = conn.execute(f'''
+            SELECT student_id, subject, component, score FROM marks
+            WHERE class_level = ? AND year = ? AND term = ?
+            AND subject IN ({', '.join('?' * len(codes))})
+        ''', (class_level, year, term, *codes))
+        for student_id, subject, component, score in rows:
+            column = by_cell.get((subject, component))
+            student = by_student.get(student_id)
+            if column and student is not None:
+                student[column] = score
+    return students
+
+
+def identity_columns(student):
+    """Identity columns a posted row sets: the key columns plus those it carries"""
+    return tuple(column for column in IDENTITY_COLUMNS if column in KEY_COLUMNS or column in student)
+
+
+def student_params(student, class_level, columns=MARK_COLUMNS, identity=IDENTITY_COLUMNS):
+    """Build the parameter row for one student: `identity`, then `columns`"""
+    get = student.get
+    row = [class_level if column == 'class_level' else get(column) for column in identity]
+    row.extend(parse_mark(get(column)) for column in columns)
+    return row
+
+
+def save_students(conn, class_level, students, permitted=None):
+    """Upsert every student of a stream in one transaction.
+
+    Only the columns present in the posted rows are written, so a grid
+    loaded with a subject projection cannot blank the other subjects and a
+    file without a gender or section column keeps the stored ones. Identity
+    columns are taken per row, mark columns from all the rows together.
+    Rows without a student number (blank grid rows) are skipped. Returns
+    the number of rows written. On a database converted to the long-format
+    store only the identity columns go to the class table and the posted
+    marks are written to `marks`. The students' rankings are refreshed in
+    the same transaction. `permitted` limits the subjects written: marks of
+    the other subjects are left out of the save, as in save_cells.
+    """
+    check_class_table(class_level)
+    posted = set()
+    for student in students:
+        posted.update(student)
+    columns = tuple(
+        column for column in MARK_COLUMNS
+        if column in posted and (permitted is None or column[:3] in permitted)
+    )
+
+    # Rows grouped by the identity columns they set, one upsert per group
+    groups = {}
+    for student in students:
+        if str(student.get('std_no') or '').strip():
+            identity = identity_columns(student)
+            groups.setdefault(identity, []).append(student_params(student, class_level, columns, identity))
+    keys = [
+        (row[0], row[identity.index('year')], row[identity.index('term')])
+        for identity, rows in groups.items() for row in rows
+    ]
+    check_writable(conn, {year for _, year, _ in keys})
+    long_format = marks_storage(conn) == LONG
+    with conn:
+        for identity, rows in groups.items():
+            identity_size = len(identity)
+            if long_format:
+                conn.executemany(upsert_sql(class_level, identity), (row[:identity_size] for row in rows))
+                year_index, term_index = identity.index('year'), identity.index('term')
+                replace_student_marks(conn, class_level, columns, [
+                    (row[0], row[year_index], row[term_index], row[identity_size:])
+                    for row in rows
+                ])
+            else:
+                conn.executemany(upsert_sql(class_level, identity + columns), rows)
+        refresh_students(conn, class_level, keys)
+    return len(keys)
+
+
+def save_cells(conn, class_level, year, term, cells, permitted=None):
+    """Apply single-cell edits as column-scoped UPDATEs in one transaction.
+
+    Each cell is a dict with std_no, column and value. A cell carrying
+    'old' (the value the client loaded) is only written while the stored
+    value still equals it; one carrying 'version' only while the row's
+    row_version does. Cells failing either check are returned as conflicts
+    with the stored value and version so the client can reconcile them;
+    the other cells are applied. `permitted` limits the subjects that may
+    be edited. Returns (applied, conflicts) where applied maps each touched
+    std_no to its new row_version.
+    """
+    check_class_table(class_level)
+    check_writable(conn, (year,))
+    edits = []
+    for cell in cells:
+        column = cell.get('column')
+        if column not in MARK_COLUMNS:
+            raise ValueError(f'Unknown mark column: {column}')
+        if permitted is not None and column[:3] not in permitted:
+            raise ValueError(f'Not permitted to edit {column}')
+        old = parse_mark(cell['old']) if 'old' in cell else _UNCHECKED
+        edits.append((cell['std_no'], column, parse_mark(cell.get('value')), old, cell.get('version')))
+
+    long_format = marks_storage(conn) == LONG
+    cells_by_column = {column: (code, component) for column, code, component in MARK_CELLS}
+    loaded_versions = {}
+    conflicts = []
+    with conn:
+        for std_no, column, value, old, version in edits:
+            row = conn.execute(f'''
+                SELECT {'NULL' if long_format else column}, row_version FROM {class_level}
+                WHERE std_no = ? AND year = ? AND term = ?
+            ''', (std_no, year, term)).fetchone()
+            if row is None:
+                conflicts.append({'std_no': std_no, 'column': column, 'reason': 'missing'})
+                continue
+
+            # row_version is only bumped after the loop, so this is the
+            # version the row had before this save
+            current, row_version = row
+            if long_format:
+                code, component = cells_by_column[column]
+                found = conn.execute('''
+                    SELECT score FROM marks
+                    WHERE class_level = ? AND year = ? AND term = ? AND student_id = ?
+                    AND subject = ? AND component = ?
+                ''', (class_level, year, term, std_no, code, component)).fetchone()
+                current = found[0] if found else None
+
+            if (old is not _UNCHECKED and current != old) or (version is not None and row_version != version):
+                conflicts.append({
+                    'std_no': std_no, 'column': column, 'reason': 'conflict',
+                    'current': current, 'version': row_version,
+                })
+                continue
+
+            if long_format:
+                replace_student_marks(conn, class_level, (column,), [(std_no, year, term, (value,))])
+            else:
+                conn.execute(f'''
+                    UPDATE {class_level} SET {column} = ?
+                    WHERE std_no = ? AND year = ? AND term = ?
+                ''', (value, std_no, year, term))
+            loaded_versions[std_no] = row_version
+
+        conn.executemany(f'''
+            UPDATE {class_level}
+            SET row_version = row_version + 1, updated_at = CURRENT_TIMESTAMP
+            WHERE std_no = ? AND year = ? AND term = ?
+        ''', ((std_no, year, term) for std_no in loaded_versions))
+        refresh_students(conn, class_level, ((std_no, year, term) for std_no in loaded_versions))
+    applied = {std_no: version + 1 for std_no, version in loaded_versions.items()}
+    return applied, conflicts
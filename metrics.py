@@ -0,0 +1,276 @@
+"""Request and SQL profiling for the Flask app.
+
+Every request records its latency in a per-route histogram. With
+PROFILE_SQL=1 in the environment it also records the number of SQL
+statements it ran and the time spent in SQLite, measured by
+ProfiledCursor, the cursor class database.py then gives every
+connection: it times each statement's execute and the fetches of its
+rows. Statements of a request slower than SLOW_QUERY_MS are logged as
+warnings to the "metrics" logger and the latest ones kept for
+/admin/metrics, which app.py serves as JSON or in the Prometheus text
+format. SQL profiling is off by default because wrapping every cursor
+costs time on each statement and fetch.
+
+Metrics live in the memory of each worker process and start from zero
+when it restarts.
+"""
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import deque
+
+from flask import g, has_request_context, request
+
+PROFILE_SQL = os.environ.get('PROFILE_SQL', '0') == '1'
+
+SLOW_QUERY_MS = float(os.environ.get('SLOW_QUERY_MS', '100'))
+
+# Slow statements kept for /admin/metrics
+SLOW_QUERY_LOG_SIZE = 100
+
+# Upper bounds of the latency histogram buckets, in seconds
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+logger = logging.getLogger(__name__)
+
+_lock = threading.Lock()
+_routes = {}
+_slow_queries = deque(maxlen=SLOW_QUERY_LOG_SIZE)
+_started = time.time()
+
+
+def _statement_done(sql, elapsed):
+    # Scripts and migrations run long statements on purpose; only requests are logged
+    if elapsed * 1000 < SLOW_QUERY_MS or not has_request_context():
+        return
+    route = request.endpoint
+    entry = {
+        'sql': ' '.join(sql.split())[:500],
+        'ms': round(elapsed * 1000, 1),
+        'route': route,
+        'at': time.strftime('%Y-%m-%dT%H:%M:%S'),
+    }
+    with _lock:
+        _slow_queries.append(entry)
+    logger.warning('Slow query (%s ms, %s): %s', entry['ms'], route, entry['sql'])
+
+
+def _add_sql_time(elapsed, statements=0):
+    if has_request_context():
+        g.sql_time = g.get('sql_time', 0.0) + elapsed
+        g.sql_queries = g.get('sql_queries', 0) + statements
+
+
+class ProfiledCursor(sqlite3.Cursor):
+    """Cursor timing every statement, including fetching its rows"""
+
+    _sql = None
+    _elapsed = 0.0
+
+    def _finish(self):
+        if self._sql is not None:
+            _statement_done(self._sql, self._elapsed)
+            self._sql = None
+
+    def _timed(self, method, *args):
+        started = time.perf_counter()
+        try:
+            return method(*args)
+        finally:
+            elapsed = time.perf_counter() - started
+            self._elapsed += elapsed
+            _add_sql_time(elapsed)
+
+    def execute(self, sql, parameters=()):
+        self._finish()
+        self._sql, self._elapsed = sql, 0.0
+        _add_sql_time(0.0, 1)
+        self._timed(super().execute, sql, parameters)
+        if self.description is None:
+            self._finish()
+        return self
+
+    def executemany(self, sql, seq_of_parameters):
+        self._finish()
+        self._sql, self._elapsed = sql, 0.0
+        _add_sql_time(0.0, 1)
+        self._timed(super().executemany, sql, seq_of_parameters)
+        self._finish()
+        return self
+
+    def executescript(self, sql_script):
+        self._finish()
+        self._sql, self._elapsed = sql_script, 0.0
+        _add_sql_time(0.0, 1)
+        self._timed(super().executescript, sql_script)
+        self._finish()
+        return self
+
+    def fetchone(self):
+        row = self._timed(super().fetchone)
+        if row is None:
+            self._finish()
+        return row
+
+    def fetchmany(self, size=None):
+        rows = self._timed(super().fetchmany, self.arraysize if size is None else size)
+        if not rows:
+            self._finish()
+        return rows
+
+    def fetchall(self):
+        rows = self._timed(super().fetchall)
+        self._finish()
+        return rows
+
+    def __next__(self):
+        try:
+            return self._timed(super().__next__)
+        except StopIteration:
+            self._finish()
+            raise
+
+    def close(self):
+        self._finish()
+        super().close()
+
+
+def _start_request():
+    g.request_started = time.perf_counter()
+    g.sql_time = 0.0
+    g.sql_queries = 0
+
+
+def _server_timing(response):
+    """Server-Timing header, shown by the browser's network panel"""
+    if 'request_started' in g:
+        g.response_status = response.status_code
+        elapsed = (time.perf_counter() - g.request_started) * 1000
+        timing = f'app;dur={elapsed:.1f}'
+        if PROFILE_SQL:
+            timing += f', db;dur={g.sql_time * 1000:.1f};desc="{g.sql_queries} queries"'
+        response.headers['Server-Timing'] = timing
+    return response
+
+
+def _end_request(exception=None):
+    """Record the request once it is over, streamed responses included"""
+    started = g.pop('request_started', None)
+    if started is None:
+        return
+    elapsed = time.perf_counter() - started
+    rule = request.url_rule.rule if request.url_rule else '<unmatched>'
+    status = 500 if exception is not None else g.get('response_status', 500)
+    key = (request.method, rule)
+    with _lock:
+        route = _routes.get(key)
+        if route is None:
+            route = _routes[key] = {
+                'count': 0, 'errors': 0, 'seconds': 0.0, 'max_seconds': 0.0,
+                'buckets': [0] * len(LATENCY_BUCKETS),
+                'sql_queries': 0, 'sql_seconds': 0.0,
+            }
+        route['count'] += 1
+        route['errors'] += status >= 500
+        route['seconds'] += elapsed
+        route['max_seconds'] = max(route['max_seconds'], elapsed)
+        for i, bound in enumerate(LATENCY_BUCKETS):
+            if elapsed <= bound:
+                route['buckets'][i] += 1
+                break
+        route['sql_queries'] += g.get('sql_queries', 0)
+        route['sql_seconds'] += g.get('sql_time', 0.0)
+
+
+def _quantile(route, q):
+    """Upper bucket bound below which a fraction q of the requests fell"""
+    target, seen = q * route['count'], 0
+    for bound, count in zip(LATENCY_BUCKETS, route['buckets']):
+        seen += count
+        if seen >= target:
+            return bound
+    return route['max_seconds']
+
+
+def snapshot():
+    """Every route's metrics and the slow query log as plain data"""
+    with _lock:
+        routes = {key: {**route, 'buckets': list(route['buckets'])} for key, route in _routes.items()}
+        slow = list(_slow_queries)
+    report = []
+    for (method, rule), route in sorted(routes.items(), key=lambda item: -item[1]['seconds']):
+        count = route['count']
+        report.append({
+            'method': method,
+            'route': rule,
+            'count': count,
+            'errors': route['errors'],
+            'mean_ms': round(route['seconds'] / count * 1000, 1),
+            'p50_ms': round(_quantile(route, 0.5) * 1000, 1),
+            'p95_ms': round(_quantile(route, 0.95) * 1000, 1),
+            'max_ms': round(route['max_seconds'] * 1000, 1),
+            'sql_queries_per_request': round(route['sql_queries'] / count, 1),
+            'sql_ms_per_request': round(route['sql_seconds'] / count * 1000, 1),
+            'sql_share': round(route['sql_seconds'] / route['seconds'], 3) if route['seconds'] else 0,
+            'buckets': dict(zip([str(bound) for bound in LATENCY_BUCKETS], route['buckets'])),
+        })
+    return {
+        'uptime_seconds': round(time.time() - _started),
+        'profile_sql': PROFILE_SQL,
+        'slow_query_ms': SLOW_QUERY_MS,
+        'routes': report,
+        'slow_queries': slow[::-1],
+    }
+
+
+def _label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"')
+
+
+def prometheus_text():
+    """The metrics in the Prometheus text exposition format"""
+    with _lock:
+        routes = {key: {**route, 'buckets': list(route['buckets'])} for key, route in _routes.items()}
+        slow_total = len(_slow_queries)
+    lines = [
+        '# HELP school_http_request_duration_seconds Request latency by route.',
+        '# TYPE school_http_request_duration_seconds histogram',
+    ]
+    for (method, rule), route in sorted(routes.items()):
+        labels = f'method="{_label(method)}",route="{_label(rule)}"'
+        cumulative = 0
+        for bound, count in zip(LATENCY_BUCKETS, route['buckets']):
+            cumulative += count
+            lines.append(f'school_http_request_duration_seconds_bucket{{{labels},le="{bound}"}} {cumulative}')
+        lines.append(f'school_http_request_duration_seconds_bucket{{{labels},le="+Inf"}} {route["count"]}')
+        lines.append(f'school_http_request_duration_seconds_sum{{{labels}}} {route["seconds"]:.6f}')
+        lines.append(f'school_http_request_duration_seconds_count{{{labels}}} {route["count"]}')
+
+    for name, kind, help_text, field, fmt in (
+        ('school_http_request_errors_total', 'counter', 'Requests answered with a 5xx status.', 'errors', '{}'),
+        ('school_sql_queries_total', 'counter', 'SQL statements run by requests.', 'sql_queries', '{}'),
+        ('school_sql_duration_seconds_total', 'counter', 'Time requests spent in SQLite.', 'sql_seconds', '{:.6f}'),
+    ):
+        lines.append(f'# HELP {name} {help_text}')
+        lines.append(f'# TYPE {name} {kind}')
+        for (method, rule), route in sorted(routes.items()):
+            lines.append(f'{name}{{method="{_label(method)}",route="{_label(rule)}"}} {fmt.format(route[field])}')
+
+    lines.append('# HELP school_slow_queries_recent Slow statements in the in-memory log.')
+    lines.append('# TYPE school_slow_queries_recent gauge')
+    lines.append(f'school_slow_queries_recent {slow_total}')
+    return '\n'.join(lines) + '\n'
+
+
+def reset():
+    with _lock:
+        _routes.clear()
+        _slow_queries.clear()
+
+
+def init_app(app):
+    app.before_request(_start_request)
+    app.after_request(_server_timing)
+    app.teardown_request(_end_request)
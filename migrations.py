@@ -0,0 +1,220 @@
+"""Versioned schema migrations for school_management.db.
+
+Each migration is registered with the @migration decorator under an
+increasing version number. The version an existing database has reached is
+kept in SQLite's user_version header, so run_migrations only applies the
+ones it has not seen yet, each in its own transaction.
+
+A migration listing `requires` tables is refused while any of them is
+missing rather than recorded as applied with its work skipped; it runs
+once the tables exist. Applied migrations and anything they changed in
+the data are logged to the "migrations" logger.
+"""
+import logging
+import sqlite3
+
+from marks_schema import CLASS_TABLES
+
+logger = logging.getLogger(__name__)
+
+MIGRATIONS = []
+
+# Tables each migration version works on, checked before it runs
+REQUIRED_TABLES = {}
+
+
+def migration(version, description, requires=()):
+    """Register a function taking a connection as schema migration `version`"""
+    def register(func):
+        MIGRATIONS.append((version, description, func))
+        REQUIRED_TABLES[version] = tuple(requires)
+        MIGRATIONS.sort(key=lambda entry: entry[0])
+        return func
+    return register
+
+
+def current_version(conn):
+    return conn.execute('PRAGMA user_version').fetchone()[0]
+
+
+def latest_version():
+    return MIGRATIONS[-1][0] if MIGRATIONS else 0
+
+
+def pending_migrations(conn):
+    version = current_version(conn)
+    return [entry for entry in MIGRATIONS if entry[0] > version]
+
+
+def table_exists(conn, table_name):
+    return conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (table_name,)
+    ).fetchone() is not None
+
+
+def missing_tables(conn, version):
+    """Tables migration `version` needs that the database does not have"""
+    return [table for table in REQUIRED_TABLES.get(version, ()) if not table_exists(conn, table)]
+
+
+def run_migrations(conn):
+    """Apply every pending migration and return the versions applied"""
+    applied = []
+    for version, description, func in pending_migrations(conn):
+        missing = missing_tables(conn, version)
+        if missing:
+            # Later versions may depend on this one, so stop here
+            raise sqlite3.OperationalError(
+                f"Migration {version} needs tables the database does not have: {', '.join(missing)}"
+            )
+        conn.execute('BEGIN')
+        try:
+            func(conn)
+            conn.execute(f'PRAGMA user_version = {int(version)}')
+            conn.commit()
+        except sqlite3.Error:
+            conn.rollback()
+            raise
+        applied.append(version)
+        logger.info('Applied migration %s: %s', version, description)
+    return applied
+
+
+def _superseded_rows(conn, table):
+    """(id, std_no, year, term) of rows saved again later for the same student-term"""
+    return conn.execute(f'''
+        SELECT id, std_no, year, term FROM {table}
+        WHERE std_no IS NOT NULL AND id NOT IN (
+            SELECT MAX(id) FROM {table}
+            WHERE std_no IS NOT NULL
+            GROUP BY std_no, year, term
+        )
+        ORDER BY id
+    ''').fetchall()
+
+
+@migration(1, 'Unique student-term key and stream indexes on the class tables', requires=CLASS_TABLES)
+def _index_class_tables(conn):
+    from promotion import default_snapshot_dir, take_snapshot
+
+    # Keep only the latest row of any student saved twice for the same term,
+    # after backing up the database with the rows about to be removed
+    superseded = {table: _superseded_rows(conn, table) for table in CLASS_TABLES}
+    if any(superseded.values()):
+        path = take_snapshot(conn, default_snapshot_dir(conn), 'before-migration-1')
+        logger.warning('Removing %s duplicate student-term rows; the database was backed up to %s',
+                       sum(len(rows) for rows in superseded.values()), path)
+    for table, rows in superseded.items():
+        for row_id, std_no, year, term in rows:
+            logger.warning('%s: removed row %s of student %s, %s term %s', table, row_id, std_no, year, term)
+        conn.executemany(f'DELETE FROM {table} WHERE id = ?', [(row[0],) for row in rows])
+
+    for table in CLASS_TABLES:
+        conn.execute(f'''
+            CREATE UNIQUE INDEX IF NOT EXISTS ux_{table.lower()}_student_term
+            ON {table} (std_no, year, term)
+        ''')
+        conn.execute(f'''
+            CREATE INDEX IF NOT EXISTS idx_{table.lower()}_stream_term
+            ON {table} (year, term, stream, std_no)
+        ''')
+
+    if table_exists(conn, 'LEFT'):
+        conn.execute('CREATE INDEX IF NOT EXISTS idx_left_std_no ON LEFT (std_no)')
+        conn.execute('''
+            CREATE INDEX IF NOT EXISTS idx_left_stream_term
+            ON LEFT (year, term, stream, std_no)
+        ''')
+
+
+@migration(2, 'Key/value app_meta table and long-format marks store with wide views', requires=CLASS_TABLES)
+def _create_marks_store(conn):
+    from marks_long import create_marks_table, create_wide_views
+
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS app_meta (
+            key TEXT PRIMARY KEY,
+            value TEXT
+        )
+    ''')
+    create_marks_table(conn)
+    create_wide_views(conn)
+
+
+@migration(3, 'Per-row version counter on the class tables for delta saves', requires=CLASS_TABLES)
+def _add_row_versions(conn):
+    from marks_long import create_wide_views
+
+    for table in CLASS_TABLES:
+        columns = {row[1] for row in conn.execute(f'PRAGMA table_info({table})')}
+        if 'row_version' not in columns:
+            conn.execute(f'ALTER TABLE {table} ADD COLUMN row_version INTEGER NOT NULL DEFAULT 0')
+    create_wide_views(conn)
+
+
+@migration(4, 'Per-stream change counters for conditional marks loads', requires=CLASS_TABLES)
+def _add_stream_versions(conn):
+    from stream_versions import create_version_table, create_version_triggers
+
+    create_version_table(conn)
+    create_version_triggers(conn)
+
+
+@migration(5, 'Summary table of student totals and stream/class positions', requires=CLASS_TABLES)
+def _create_rankings(conn):
+    from rankings import create_rankings_table, rebuild_rows
+
+    create_rankings_table(conn)
+    rebuild_rows(conn)
+
+
+@migration(6, 'Materialized subject analytics per class, stream and term')
+def _create_analytics(conn):
+    from analytics import create_analytics_tables
+
+    create_analytics_tables(conn)
+
+
+@migration(7, 'Library indexes and FTS5 catalog search', requires=('books', 'book_borrowing'))
+def _index_library(conn):
+    from library import create_library_indexes, create_search_index
+
+    create_library_indexes(conn)
+    create_search_index(conn)
+
+
+@migration(8, 'Overdue loan index and library summary counters', requires=('books', 'book_borrowing'))
+def _create_library_stats(conn):
+    from library import create_overdue_index, create_stats_table, recount_stats
+
+    create_overdue_index(conn)
+    create_stats_table(conn)
+    recount_stats(conn)
+
+
+@migration(9, 'Materialized per-student fee balances', requires=CLASS_TABLES + ('fees_structure', 'fees_payments'))
+def _create_fee_balances(conn):
+    from bursary import create_balance_triggers, create_balances_table, rebuild_balances
+
+    create_balances_table(conn)
+    create_balance_triggers(conn)
+    rebuild_balances(conn)
+
+
+@migration(10, 'Unique payment receipt numbers', requires=('fees_payments',))
+def _unique_receipt_numbers(conn):
+    from bursary import create_receipt_index
+
+    renamed = create_receipt_index(conn)
+    if renamed:
+        logger.warning('Renamed %s duplicate receipt numbers', renamed)
+
+
+@migration(11, 'Re-price fee balances when fee lines are moved or deleted',
+           requires=CLASS_TABLES + ('fees_structure', 'fees_payments'))
+def _reprice_fee_balances(conn):
+    from bursary import create_balance_triggers, rebuild_balances
+
+    create_balance_triggers(conn)
+    # Balances left stale by fee lines deleted or moved before these triggers
+    rebuild_balances(conn)
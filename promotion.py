@@ -0,0 +1,202 @@
+"""Year-end promotion of whole classes and archiving of leavers.
+
+promote() moves every student of a year up one class with set-based SQL:
+one INSERT ... SELECT per class creates their term I row of the next year
+in the next class, carrying over name, stream, gender and section, and S6
+students are archived into the LEFT table (every S6 row with its marks,
+the reason and moved_at) and deleted from S6. Each class is moved in its
+own transaction, S6 first, so a class is either fully promoted or not at
+all. Students listed as repeating get their new row in the same class.
+
+Earlier terms stay in the class tables, so past report cards and rankings
+keep working. Promoting the same year twice changes nothing: rows that
+already exist are skipped. Before writing, a copy of the whole database is
+saved with SQLite's backup API so the promotion can be rolled back with
+restore_snapshot().
+"""
+import json
+import os
+import sqlite3
+from datetime import datetime
+
+from database import database_path
+from marks_long import marks_source
+from marks_schema import CLASS_TABLES, IDENTITY_COLUMNS, MARK_COLUMNS
+
+GRADUATED = 'Graduated'
+
+NEW_YEAR_TERM = 'I'
+
+# Columns copied into the new class row; the marks start empty
+_CARRIED_COLUMNS = ('std_no', 'sdt_name', 'stream', 'gender', 'section')
+
+_LEFT_COLUMNS = IDENTITY_COLUMNS + MARK_COLUMNS
+
+
+def next_class(class_level):
+    """Class a student of class_level is promoted to, None for S6"""
+    index = CLASS_TABLES.index(class_level)
+    return CLASS_TABLES[index + 1] if index + 1 < len(CLASS_TABLES) else None
+
+
+def _latest_rows(table):
+    """Latest row of the year of every student of a class table"""
+    return f'''
+        SELECT * FROM (
+            SELECT {', '.join(_CARRIED_COLUMNS)},
+                ROW_NUMBER() OVER (PARTITION BY std_no ORDER BY term DESC, id DESC) AS latest
+            FROM {table}
+            WHERE year = ? AND std_no IS NOT NULL
+        ) WHERE latest = 1
+    '''
+
+
+# Student numbers of a JSON array parameter
+_REPEATING = 'SELECT value FROM json_each(?)'
+
+
+def _leavers(table):
+    """S6 students of the year, except repeaters already given a new-year row"""
+    return f'''
+        SELECT DISTINCT std_no FROM {table}
+        WHERE year = ? AND std_no IS NOT NULL AND std_no NOT IN ({_REPEATING})
+        AND std_no NOT IN (SELECT std_no FROM {table} WHERE year = ? AND term = ?)
+    '''
+
+
+def _move_rows(table, year, repeating):
+    """INSERT ... SELECT of the new-year rows of one class: (sql, params) pairs.
+
+    A student who already has a new-year row in the other class (promoted
+    before being listed as repeating, or the reverse) is left where they are.
+    """
+    target = next_class(table)
+    new_year = year + 1
+    statements = []
+    insert = f'''
+        INSERT INTO {{target}} ({', '.join(_CARRIED_COLUMNS)}, class_level, year, term)
+        SELECT {', '.join(_CARRIED_COLUMNS)}, ?, ?, ?
+        FROM ({_latest_rows(table)})
+        WHERE std_no {{membership}} ({_REPEATING})
+        AND std_no NOT IN (SELECT std_no FROM {{other}} WHERE year = ? AND term = ?)
+        ON CONFLICT (std_no, year, term) DO NOTHING
+    '''
+    if target:
+        statements.append((insert.format(target=target, membership='NOT IN', other=table),
+                           (target, new_year, NEW_YEAR_TERM, year, repeating, new_year, NEW_YEAR_TERM)))
+    statements.append((insert.format(target=table, membership='IN', other=target or table),
+                       (table, new_year, NEW_YEAR_TERM, year, repeating, new_year, NEW_YEAR_TERM)))
+    return statements
+
+
+def archive_students(conn, class_level, students, params, reason):
+    """Move every row of the students selected by `students` into LEFT.
+
+    `students` is a subquery of student numbers. Their marks are copied
+    with the rows and their marks and rankings of this class deleted. Runs
+    inside the caller's transaction; returns the number of rows archived.
+    """
+    columns = ', '.join(_LEFT_COLUMNS)
+    archived = conn.execute(f'''
+        INSERT INTO LEFT ({columns}, reason)
+        SELECT {columns}, ? FROM {marks_source(conn, class_level)}
+        WHERE std_no IN ({students})
+    ''', (reason, *params)).rowcount
+    conn.execute(f'''
+        DELETE FROM marks WHERE class_level = ? AND student_id IN ({students})
+    ''', (class_level, *params))
+    conn.execute(f'''
+        DELETE FROM student_rankings WHERE class_level = ? AND std_no IN ({students})
+    ''', (class_level, *params))
+    conn.execute(f'DELETE FROM {class_level} WHERE std_no IN ({students})', params)
+    return archived
+
+
+def promotion_plan(conn, year, repeating=()):
+    """Per-class counts of what promote() would do, without writing anything"""
+    repeating = json.dumps(sorted({int(std_no) for std_no in repeating}))
+    plan = []
+    for table in CLASS_TABLES:
+        target = next_class(table)
+        promoted, repeats = conn.execute(f'''
+            SELECT COALESCE(SUM(std_no NOT IN ({_REPEATING})), 0), COALESCE(SUM(std_no IN ({_REPEATING})), 0)
+            FROM ({_latest_rows(table)})
+        ''', (repeating, repeating, year)).fetchone()
+        plan.append({
+            'class_level': table,
+            'to': target or 'LEFT',
+            'students': promoted + repeats,
+            'promoted': promoted if target else 0,
+            'graduating': 0 if target else promoted,
+            'repeating': repeats,
+        })
+    return plan
+
+
+def promote(conn, year, repeating=(), reason=GRADUATED, snapshot_dir=None):
+    """Promote every class of `year` into year + 1, term I.
+
+    `repeating` lists student numbers that stay in their class. A snapshot
+    of the database is written to snapshot_dir first (skipped if None).
+    Returns (plan, snapshot path) where each plan entry also holds the rows
+    actually inserted and archived.
+    """
+    repeating = sorted({int(std_no) for std_no in repeating})
+    plan = promotion_plan(conn, year, repeating)
+    snapshot = take_snapshot(conn, snapshot_dir, f'before-promotion-{year}') if snapshot_dir else None
+    params = json.dumps(repeating)
+
+    # S6 first, so its leavers are archived before the S5 students arrive
+    for entry in reversed(plan):
+        table = entry['class_level']
+        with conn:
+            entry['archived'] = 0
+            if next_class(table) is None:
+                entry['archived'] = archive_students(
+                    conn, table, _leavers(table), (year, params, year + 1, NEW_YEAR_TERM), reason)
+            entry['inserted'] = sum(
+                conn.execute(sql, statement_params).rowcount
+                for sql, statement_params in _move_rows(table, year, params)
+            )
+    return plan, snapshot
+
+
+def leave_student(conn, class_level, std_no, reason):
+    """Archive one student's rows of a class into LEFT and delete them"""
+    with conn:
+        archived = archive_students(conn, class_level, '?', (std_no,), reason)
+    if not archived:
+        raise LookupError(f'Student {std_no} is not in {class_level}')
+    return archived
+
+
+def take_snapshot(conn, directory, label):
+    """Copy the whole database into directory with the backup API"""
+    os.makedirs(directory, exist_ok=True)
+    stem = os.path.join(directory, f"{label}-{datetime.now().strftime('%Y%m%d-%H%M%S')}")
+    path, copy = f'{stem}.db', 1
+    while os.path.exists(path):
+        copy += 1
+        path = f'{stem}-{copy}.db'
+    target = sqlite3.connect(path)
+    try:
+        conn.backup(target)
+    finally:
+        target.close()
+    return path
+
+
+def restore_snapshot(conn, path):
+    """Overwrite the database with a snapshot taken by take_snapshot()"""
+    if not os.path.exists(path):
+        raise FileNotFoundError(path)
+    source = sqlite3.connect(f'file:{os.path.abspath(path)}?mode=ro', uri=True)
+    try:
+        source.backup(conn)
+    finally:
+        source.close()
+
+
+def default_snapshot_dir(conn):
+    """backups/ next to the database file"""
+    return os.path.join(os.path.dirname(os.path.abspath(database_path(conn))), 'backups')
@@ -0,0 +1,195 @@
+"""Stream and class positions kept in the student_rankings summary table.
+
+Every student has one row per exam set (BOT, MOT, EOT) with their overall
+total, average and number of subjects scored, computed the same way as on
+the report card, plus their position in the stream and in the class.
+Positions go by average, not total, so a student sitting more subjects
+does not outrank a stronger one sitting fewer (S5/S6 combinations differ).
+
+Saves refresh the totals of the students they wrote in the same
+transaction and, when a total changed, re-rank that one class and term
+with window functions. rebuild() recomputes everything in bulk, so a report
+only has to read its student's row.
+"""
+import sqlite3
+
+from archive import archived_table
+from grading import overall_scores
+from marks_long import marks_source
+from marks_schema import CLASS_TABLES, EXAM_SETS, MARK_COLUMNS
+
+RANKING_COLUMNS = (
+    'total', 'average', 'subjects',
+    'stream_position', 'stream_size', 'class_position', 'class_size',
+)
+
+# Students read per query when refreshing a batch of saved rows
+REFRESH_CHUNK_SIZE = 500
+
+
+def create_rankings_table(conn):
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS student_rankings (
+            class_level TEXT NOT NULL,
+            year INTEGER NOT NULL,
+            term TEXT NOT NULL,
+            exam_set TEXT NOT NULL,
+            std_no INTEGER NOT NULL,
+            stream TEXT,
+            total REAL,
+            average REAL,
+            subjects INTEGER NOT NULL DEFAULT 0,
+            stream_position INTEGER,
+            stream_size INTEGER,
+            class_position INTEGER,
+            class_size INTEGER,
+            PRIMARY KEY (class_level, year, term, exam_set, std_no)
+        ) WITHOUT ROWID
+    ''')
+    conn.execute('''
+        CREATE INDEX IF NOT EXISTS idx_rankings_stream
+        ON student_rankings (class_level, year, term, exam_set, stream, std_no)
+    ''')
+
+
+_STUDENT_COLUMNS = ', '.join(('std_no', 'stream', 'year', 'term') + MARK_COLUMNS)
+
+
+def _fetch_students(conn, source, where, params):
+    # Row access by name whatever the connection's row_factory
+    cursor = conn.cursor()
+    cursor.row_factory = sqlite3.Row
+    return cursor.execute(f'SELECT {_STUDENT_COLUMNS} FROM {source} WHERE {where}', params).fetchall()
+
+
+def _score_rows(class_level, students):
+    """student_rankings rows of every exam set for the given students"""
+    for exam_set in EXAM_SETS:
+        for student, (total, average, subjects) in zip(students, overall_scores(students, exam_set)):
+            yield (class_level, student['year'], student['term'], exam_set,
+                   student['std_no'], student['stream'], total, average, subjects)
+
+
+_UPSERT = '''
+    INSERT INTO student_rankings
+        (class_level, year, term, exam_set, std_no, stream, total, average, subjects)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+    ON CONFLICT(class_level, year, term, exam_set, std_no) DO UPDATE SET
+        stream = excluded.stream, total = excluded.total,
+        average = excluded.average, subjects = excluded.subjects
+    WHERE stream IS NOT excluded.stream OR total IS NOT excluded.total
+        OR subjects IS NOT excluded.subjects
+'''
+
+
+def rank(conn, class_level, year, term):
+    """Recompute the positions of one class and term with window functions.
+
+    Students are ordered by their average over the subjects they sat;
+    those with no score in an exam set are left unranked. Ties share a
+    position and the next one is skipped (1, 2, 2, 4).
+    """
+    conn.execute('''
+        UPDATE student_rankings AS r
+        SET stream_position = p.stream_position, stream_size = p.stream_size,
+            class_position = p.class_position, class_size = p.class_size
+        FROM (
+            SELECT exam_set, std_no,
+                CASE WHEN subjects > 0 THEN RANK() OVER (
+                    PARTITION BY exam_set, subjects > 0, stream ORDER BY average DESC
+                ) END AS stream_position,
+                SUM(subjects > 0) OVER (PARTITION BY exam_set, stream) AS stream_size,
+                CASE WHEN subjects > 0 THEN RANK() OVER (
+                    PARTITION BY exam_set, subjects > 0 ORDER BY average DESC
+                ) END AS class_position,
+                SUM(subjects > 0) OVER (PARTITION BY exam_set) AS class_size
+            FROM student_rankings
+            WHERE class_level = ? AND year = ? AND term = ?
+        ) AS p
+        WHERE r.class_level = ? AND r.year = ? AND r.term = ?
+        AND r.exam_set = p.exam_set AND r.std_no = p.std_no
+        AND (r.stream_position IS NOT p.stream_position OR r.stream_size IS NOT p.stream_size
+             OR r.class_position IS NOT p.class_position OR r.class_size IS NOT p.class_size)
+    ''', (class_level, year, term) * 2)
+
+
+def refresh_students(conn, class_level, keys):
+    """Update the rankings after the students in `keys` were saved.
+
+    keys are (std_no, year, term) tuples. Call inside the transaction that
+    wrote the marks. Each class and term whose totals changed is re-ranked
+    once, however many of its students were saved.
+    """
+    by_term = {}
+    for std_no, year, term in keys:
+        by_term.setdefault((year, term), set()).add(std_no)
+
+    source = marks_source(conn, class_level)
+    for (year, term), std_nos in by_term.items():
+        std_nos = sorted(std_nos)
+        before = conn.total_changes
+        for start in range(0, len(std_nos), REFRESH_CHUNK_SIZE):
+            chunk = std_nos[start:start + REFRESH_CHUNK_SIZE]
+            students = _fetch_students(
+                conn, source, f"year = ? AND term = ? AND std_no IN ({', '.join('?' * len(chunk))})",
+                (year, term, *chunk)
+            )
+            conn.executemany(_UPSERT, _score_rows(class_level, students))
+        if conn.total_changes != before:
+            rank(conn, class_level, year, term)
+
+
+def rebuild(conn, class_level=None, year=None, term=None):
+    """Recompute the rankings of a class (default all) and optionally one term.
+
+    Returns the number of student rows ranked. Runs in its own transaction.
+    """
+    with conn:
+        return rebuild_rows(conn, class_level, year, term)
+
+
+def rebuild_rows(conn, class_level=None, year=None, term=None):
+    """rebuild() inside the caller's transaction, e.g. a migration"""
+    classes = CLASS_TABLES if class_level is None else (class_level,)
+    count = 0
+    for table in classes:
+        source = marks_source(conn, table)
+        if year is None:
+            terms = conn.execute(f'''
+                SELECT DISTINCT year, term FROM {table}
+                WHERE std_no IS NOT NULL AND year IS NOT NULL AND term IS NOT NULL
+            ''').fetchall()
+            conn.execute('DELETE FROM student_rankings WHERE class_level = ?', (table,))
+        else:
+            terms = [(year, term)]
+            conn.execute('''
+                DELETE FROM student_rankings WHERE class_level = ? AND year = ? AND term = ?
+            ''', (table, year, term))
+        for term_year, term_name in terms:
+            students = _fetch_students(
+                conn, source, 'year = ? AND term = ? AND std_no IS NOT NULL', (term_year, term_name)
+            )
+            conn.executemany(_UPSERT, _score_rows(table, students))
+            rank(conn, table, term_year, term_name)
+            count += len(students)
+    return count
+
+
+def student_ranking(conn, class_level, year, term, exam_set, std_no):
+    """Summary row of one student for an exam set, None if not ranked yet"""
+    table = archived_table(conn, 'student_rankings', year) or 'student_rankings'
+    row = conn.execute(f'''
+        SELECT {', '.join(RANKING_COLUMNS)} FROM {table}
+        WHERE class_level = ? AND year = ? AND term = ? AND exam_set = ? AND std_no = ?
+    ''', (class_level, year, term, exam_set, std_no)).fetchone()
+    return dict(zip(RANKING_COLUMNS, row)) if row else None
+
+
+def stream_rankings(conn, class_level, stream, year, term, exam_set):
+    """Summary rows of a stream for an exam set keyed by student number"""
+    table = archived_table(conn, 'student_rankings', year) or 'student_rankings'
+    rows = conn.execute(f'''
+        SELECT std_no, {', '.join(RANKING_COLUMNS)} FROM {table}
+        WHERE class_level = ? AND year = ? AND term = ? AND exam_set = ? AND stream = ?
+    ''', (class_level, year, term, exam_set, stream))
+    return {row[0]: dict(zip(RANKING_COLUMNS, row[1:])) for row in rows}
@@ -0,0 +1,81 @@
+"""In-process cache for the small reference tables read on hot requests.
+
+admin_settings, subjects, grading_system and streams change a few times per
+term but are read by every report and every class dropdown change. Each
+cached entry remembers the version it was loaded at; versions are counters
+kept in the app_meta table under 'version:<name>'. A write bumps the counter
+through invalidate(), which also drops the local copy at once, and other
+workers notice the new version the next time they re-read the counters (at
+most every VERSION_CHECK_INTERVAL seconds, in a single query).
+"""
+import sqlite3
+import threading
+import time
+
+VERSION_CHECK_INTERVAL = 2.0
+
+_lock = threading.Lock()
+_entries = {}
+_versions = {}
+_checked_at = 0.0
+
+
+def _refresh_versions(conn):
+    global _checked_at
+    now = time.monotonic()
+    if now - _checked_at < VERSION_CHECK_INTERVAL:
+        return
+    try:
+        rows = conn.execute("SELECT key, value FROM app_meta WHERE key LIKE 'version:%'").fetchall()
+    except sqlite3.OperationalError:
+        rows = []
+    with _lock:
+        _versions.clear()
+        _versions.update((key[len('version:'):], value) for key, value in rows)
+        _checked_at = now
+
+
+def get(conn, name, loader, ttl=None):
+    """Return the cached value of `name`, calling loader(conn) when stale.
+
+    With a ttl (seconds) the value is also reloaded once it is that old,
+    which catches changes made to the table outside the app.
+    """
+    _refresh_versions(conn)
+    version = _versions.get(name)
+    entry = _entries.get(name)
+    now = time.monotonic()
+    if entry is not None and entry[0] == version and (ttl is None or now - entry[2] < ttl):
+        return entry[1]
+
+    value = loader(conn)
+    with _lock:
+        _entries[name] = (version, value, now)
+    return value
+
+
+def invalidate(conn, *names):
+    """Bump the versions of `names` so every worker reloads them.
+
+    Call in place of commit() after writing the underlying table: the write
+    and the version bump are committed together, or both rolled back.
+    """
+    global _checked_at
+    with conn:
+        conn.executemany('''
+            INSERT INTO app_meta (key, value) VALUES (?, 1)
+            ON CONFLICT(key) DO UPDATE SET value = value + 1
+        ''', ((f'version:{name}',) for name in names))
+    with _lock:
+        for name in names:
+            _entries.pop(name, None)
+        _checked_at = 0.0
+
+
+def clear():
+    """Forget every cached value, e.g. after switching to another database"""
+    global _checked_at
+    with _lock:
+        _entries.clear()
+        _versions.clear()
+        _checked_at = 0.0
@@ -0,0 +1,271 @@
+"""Server-side PDF report cards.
+
+The report data is the same as /api/generate_report(s) returns: the shared
+school settings, subjects, grading and report type, and one dict per
+student with their results, position and fees balance. Cards are drawn
+with reportlab, one A4 page per student.
+
+Everything that does not depend on the student (column layout, table
+styles, subject names, the school header and grading key) is compiled
+once per worker process into a CardLayout, and the static parts are drawn
+once per PDF as a form that every page reuses. Large batches are split
+into chunks rendered across a ProcessPoolExecutor, one worker per core by
+default; the chunks are then merged into one PDF or zipped as one PDF per
+student. The workers are started with 'spawn': the pool is created from a
+request thread, and forking the threaded server could copy a lock held by
+another thread into the child.
+"""
+import hashlib
+import io
+import json
+import multiprocessing
+import os
+import threading
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date
+
+from pypdf import PdfWriter
+from reportlab.lib import colors
+from reportlab.lib.pagesizes import A4
+from reportlab.lib.units import mm
+from reportlab.pdfgen import canvas
+from reportlab.platypus import Table, TableStyle
+
+from marks_schema import subject_code
+
+# Students rendered per task sent to a worker
+CHUNK_SIZE = 50
+
+# Batches up to this size are rendered in the calling process
+INLINE_LIMIT = CHUNK_SIZE
+
+WORKERS = int(os.environ.get('REPORT_WORKERS', '0')) or os.cpu_count() or 1
+
+REPORT_TITLES = {
+    'BOT': 'BEGINNING OF TERM REPORT',
+    'MOT': 'MID TERM REPORT',
+    'EOT': 'END OF TERM REPORT',
+}
+
+PAGE_WIDTH, PAGE_HEIGHT = A4
+MARGIN = 15 * mm
+
+_STATIC_FORM = 'card_static'
+
+
+def _show(value):
+    return '' if value is None else f'{value:g}' if isinstance(value, float) else str(value)
+
+
+class CardLayout:
+    """The student-independent parts of a report card, built once per process"""
+
+    def __init__(self, shared):
+        self.school = shared.get('school') or {}
+        self.report_type = shared['report_type']
+        self.grading = shared.get('grading') or []
+        self.subject_names = {}
+        for subject in shared.get('subjects') or []:
+            code = subject_code(subject.get('subject_initial'))
+            if code:
+                self.subject_names[code] = str(subject.get('subject_full_name') or code).upper()
+
+        self.eot = self.report_type == 'EOT'
+        self.header_row = ['SUBJECTS'] + (
+            ['C1', 'C2', 'C3', 'C4', 'AV', '20%', '80%', '100%', 'Ident'] if self.eot else ['Score']
+        ) + ['Grd', 'Tr']
+        width = PAGE_WIDTH - 2 * MARGIN
+        self.col_widths = [width * 0.28] + [width * 0.72 / (len(self.header_row) - 1)] * (len(self.header_row) - 1)
+        self.table_style = TableStyle([
+            ('FONT', (0, 0), (-1, -1), 'Helvetica', 8),
+            ('FONT', (0, 0), (-1, 0), 'Helvetica-Bold', 8),
+            ('BACKGROUND', (0, 0), (-1, 0), colors.lightgrey),
+            ('GRID', (0, 0), (-1, -1), 0.5, colors.black),
+            ('ALIGN', (1, 0), (-1, -1), 'CENTER'),
+            ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
+        ])
+
+    def subject_row(self, subject):
+        name = self.subject_names.get(subject['subject'], subject['subject'].upper())
+        if self.eot:
+            scores = [_show(score) for score in subject['ca']] + [
+                _show(subject['ca_average']), _show(subject['ca_weighted']),
+                _show(subject['exam_weighted']), _show(subject['total']), _show(subject['identifier']),
+            ]
+        else:
+            scores = [_show(subject['total'])]
+        return [name] + scores + [_show(subject['grade']), '']
+
+    def draw_static(self, pdf):
+        """School header, grading key and footer, shared by every page of a PDF"""
+        pdf.beginForm(_STATIC_FORM)
+        school = self.school
+        lines = [
+            ('Helvetica-Bold', 14, school.get('school_name') or ''),
+            ('Helvetica-Oblique', 9, f"\"{school['school_motto']}\"" if school.get('school_motto') else ''),
+            ('Helvetica', 9, school.get('school_box') or ''),
+            ('Helvetica', 9, f"Tel: {school['school_contacts']}" if school.get('school_contacts') else ''),
+            ('Helvetica', 9, school.get('school_email') or ''),
+            ('Helvetica-Bold', 11, REPORT_TITLES.get(self.report_type, self.report_type)),
+        ]
+        y = PAGE_HEIGHT - MARGIN
+        for font, size, text in lines:
+            if text:
+                pdf.setFont(font, size)
+                pdf.drawCentredString(PAGE_WIDTH / 2, y, text)
+                y -= size + 4
+        pdf.line(MARGIN, y, PAGE_WIDTH - MARGIN, y)
+
+        y = MARGIN + 14 + 11 * (len(self.grading) + 1)
+        pdf.setFont('Helvetica-Bold', 9)
+        pdf.drawString(MARGIN, y, 'GRADING')
+        pdf.setFont('Helvetica', 8)
+        for grade in self.grading:
+            y -= 11
+            pdf.drawString(MARGIN, y, f"{grade.get('grade') or ''}  {grade.get('min_score')}-{grade.get('max_score')}")
+            pdf.drawString(MARGIN + 30 * mm, y, str(grade.get('descriptor') or ''))
+            pdf.drawString(MARGIN + 60 * mm, y, str(grade.get('comment') or ''))
+        pdf.setFont('Helvetica-Oblique', 7)
+        pdf.drawString(MARGIN, MARGIN, 'Developed by ICT department')
+        pdf.endForm()
+
+    def draw_card(self, pdf, student, printed):
+        pdf.doForm(_STATIC_FORM)
+        results = student.get('results') or {}
+        y = PAGE_HEIGHT - MARGIN - 100
+        info = [
+            ('CARD NUMBER', student.get('std_no'), 'SEX', student.get('gender')),
+            ('STUDENT NAME', student.get('sdt_name'), 'TERM', student.get('term')),
+            ('CLASS', f"{student.get('class_level') or ''}{student.get('stream') or ''}", 'YEAR', student.get('year')),
+        ]
+        for left, left_value, right, right_value in info:
+            pdf.setFont('Helvetica-Bold', 9)
+            pdf.drawString(MARGIN, y, f'{left}:')
+            pdf.drawString(PAGE_WIDTH / 2, y, f'{right}:')
+            pdf.setFont('Helvetica', 9)
+            pdf.drawString(MARGIN + 30 * mm, y, _show(left_value))
+            pdf.drawString(PAGE_WIDTH / 2 + 15 * mm, y, _show(right_value))
+            y -= 13
+
+        rows = [self.header_row] + [self.subject_row(subject) for subject in results.get('subjects', [])]
+        table = Table(rows, colWidths=self.col_widths, style=self.table_style)
+        _, height = table.wrapOn(pdf, PAGE_WIDTH - 2 * MARGIN, y)
+        y -= height + 4
+        table.drawOn(pdf, MARGIN, y)
+
+        position = results.get('position') or {}
+
+        def ranked(place, size):
+            return f'{place} out of {size}' if place else '-'
+
+        y -= 16
+        summary = [
+            ('TOTAL', _show(results.get('total')), 'POSITION IN STREAM',
+             ranked(position.get('stream_position'), position.get('stream_size'))),
+            ('AVERAGE', _show(results.get('average')) or '-', 'POSITION IN CLASS',
+             ranked(position.get('class_position'), position.get('class_size'))),
+        ]
+        for left, left_value, right, right_value in summary:
+            pdf.setFont('Helvetica-Bold', 9)
+            pdf.drawString(MARGIN, y, f'{left}: ')
+            pdf.drawString(PAGE_WIDTH / 2, y, f'{right}: ')
+            pdf.setFont('Helvetica', 9)
+            pdf.drawString(MARGIN + 20 * mm, y, left_value)
+            pdf.drawString(PAGE_WIDTH / 2 + 38 * mm, y, right_value)
+            y -= 13
+
+        y -= 8
+        for label in ("Class Teacher's comment:", "Head Teacher's comment:"):
+            pdf.setFont('Helvetica-Bold', 9)
+            pdf.drawString(MARGIN, y, label)
+            pdf.line(MARGIN + 42 * mm, y - 2, PAGE_WIDTH - MARGIN, y - 2)
+            y -= 18
+
+        pdf.setFont('Helvetica-Bold', 9)
+        pdf.drawString(MARGIN, y, 'FEES BALANCE:')
+        pdf.drawString(PAGE_WIDTH / 2, y, 'Print date:')
+        pdf.setFont('Helvetica', 9)
+        pdf.drawString(MARGIN + 28 * mm, y, f"UGX {student.get('fees_balance') or 0:,.0f}")
+        pdf.drawString(PAGE_WIDTH / 2 + 20 * mm, y, printed)
+        pdf.showPage()
+
+    def render(self, students):
+        """One PDF with a page per student"""
+        buffer = io.BytesIO()
+        pdf = canvas.Canvas(buffer, pagesize=A4, pageCompression=1)
+        pdf.setTitle(REPORT_TITLES.get(self.report_type, 'Report cards'))
+        self.draw_static(pdf)
+        printed = date.today().isoformat()
+        for student in students:
+            self.draw_card(pdf, student, printed)
+        pdf.save()
+        return buffer.getvalue()
+
+
+# Layouts compiled in this process, keyed by a digest of the shared data
+_layouts = {}
+
+
+def _layout(shared):
+    key = hashlib.sha1(json.dumps(shared, sort_keys=True, default=str).encode()).hexdigest()
+    layout = _layouts.get(key)
+    if layout is None:
+        _layouts.clear()
+        layout = _layouts[key] = CardLayout(shared)
+    return layout
+
+
+def _render_chunk(shared, students, separate):
+    layout = _layout(shared)
+    if separate:
+        return [(student.get('std_no'), layout.render([student])) for student in students]
+    return layout.render(students)
+
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def executor():
+    """Process pool shared by every request of this process"""
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ProcessPoolExecutor(max_workers=WORKERS, mp_context=multiprocessing.get_context('spawn'))
+    return _executor
+
+
+def _chunks(students):
+    return [students[start:start + CHUNK_SIZE] for start in range(0, len(students), CHUNK_SIZE)]
+
+
+def _rendered(shared, students, separate):
+    """Results of _render_chunk in order, across the pool for large batches"""
+    chunks = _chunks(students)
+    if len(students) <= INLINE_LIMIT or WORKERS == 1:
+        return [_render_chunk(shared, chunk, separate) for chunk in chunks]
+    return list(executor().map(_render_chunk, [shared] * len(chunks), chunks, [separate] * len(chunks)))
+
+
+def render_pdf(shared, students):
+    """One merged PDF of every student's card, in the order given"""
+    parts = _rendered(shared, students, separate=False)
+    if len(parts) == 1:
+        return parts[0]
+    writer = PdfWriter()
+    for part in parts:
+        writer.append(io.BytesIO(part))
+    buffer = io.BytesIO()
+    writer.write(buffer)
+    return buffer.getvalue()
+
+
+def render_zip(shared, students):
+    """A zip file with one PDF per student, named by student number"""
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, 'w', zipfile.ZIP_STORED) as archive:
+        for part in _rendered(shared, students, separate=True):
+            for std_no, pdf in part:
+                archive.writestr(f'{std_no}.pdf', pdf)
+    return buffer.getvalue()
@@ -0,0 +1,48 @@
+import os
+import sys
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from archive import archive_dir, archive_year, archived_years
+from database import connect
+from migrations import run_migrations
+
+def archive(database, years, vacuum=False):
+    conn = connect(database)
+    try:
+        run_migrations(conn)
+        for year in years:
+            moved = archive_year(conn, year)
+            print(f"Archived {year}: " + ', '.join(f'{table} {count}' for table, count in moved.items()))
+        if vacuum:
+            # Give the deleted pages back to the file system
+            conn.execute('VACUUM')
+            print("Vacuumed the live database.")
+    finally:
+        conn.close()
+
+def list_archives(database):
+    conn = connect(database)
+    try:
+        for year, name in sorted(archived_years(conn).items()):
+            print(f"{year}: {os.path.join(archive_dir(conn), name)}")
+    finally:
+        conn.close()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Move closed school years into per-year archive databases')
+    parser.add_argument('years', type=int, nargs='*', help='years to archive')
+    parser.add_argument('--database', default='school_management.db')
+    parser.add_argument('--vacuum', action='store_true', help='shrink the live database afterwards')
+    parser.add_argument('--list', action='store_true', help='list the archived years')
+    args = parser.parse_args()
+    if args.list:
+        list_archives(args.database)
+    elif not args.years:
+        parser.error('give the years to archive or --list')
+    else:
+        try:
+            archive(args.database, args.years, args.vacuum)
+        except ValueError as e:
+            sys.exit(f"Archive failed: {e}")
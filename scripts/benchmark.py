@@ -0,0 +1,240 @@
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import platform
+import tempfile
+import tracemalloc
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import database as db_module
+from database import connect
+import metrics
+from synthetic import ADMIN_PASSWORD, STREAMS, TEACHER_PASSWORD, generate
+
+BENCHMARKS = ('login', 'load_data', 'save_data', 'export_excel', 'generate_report')
+
+# Slower than the baseline by more than this fraction counts as a regression
+DEFAULT_TOLERANCE = 0.20
+
+# ...unless it is only this much slower; sub-millisecond timings are noisy
+MIN_REGRESSION_MS = 2.0
+
+def percentile(samples, fraction):
+    """Nearest-rank percentile of a list of timings"""
+    ordered = sorted(samples)
+    index = max(int(round(fraction * len(ordered) + 0.5)) - 1, 0)
+    return ordered[min(index, len(ordered) - 1)]
+
+def prepare_database(students, years, seed, data_dir):
+    """Copy of the synthetic database for these settings, generated once and cached"""
+    os.makedirs(data_dir, exist_ok=True)
+    cached = os.path.join(data_dir, f'school-{students}x{years}-seed{seed}.db')
+    if not os.path.exists(cached):
+        print(f"Generating {students} students x {years} years into {cached} ...")
+        # create_database.py builds school_management.db in the working directory
+        build_dir = tempfile.mkdtemp(prefix='school-bench-build-', dir=data_dir)
+        current = os.getcwd()
+        os.chdir(build_dir)
+        try:
+            from create_database import create_database
+            create_database()
+        finally:
+            os.chdir(current)
+        building = os.path.join(build_dir, 'school_management.db')
+        conn = connect(building)
+        try:
+            generate(conn, students, years, seed=seed)
+            conn.execute('PRAGMA wal_checkpoint(TRUNCATE)')
+        finally:
+            conn.close()
+        os.replace(building, cached)
+        shutil.rmtree(build_dir, ignore_errors=True)
+
+    run_dir = tempfile.mkdtemp(prefix='school-bench-')
+    database = os.path.join(run_dir, 'school_management.db')
+    shutil.copyfile(cached, database)
+    return database, run_dir
+
+def latest_term(conn):
+    year = conn.execute('SELECT MAX(year) FROM S1').fetchone()[0]
+    term = conn.execute('SELECT MAX(term) FROM S1 WHERE year = ?', (year,)).fetchone()[0]
+    return year, term
+
+def make_cases(client, conn):
+    """{name: callable} running one request of each benchmark and checking its answer"""
+    year, term = latest_term(conn)
+    stream = STREAMS[0]
+    student = conn.execute('SELECT std_no FROM S3 WHERE year = ? AND term = ? AND stream = ? LIMIT 1',
+                           (year, term, stream)).fetchone()[0]
+    query = {'class': 'S3', 'stream': stream, 'year': year, 'term': term}
+    loaded = client.get('/api/load_data', query_string=query).get_json()
+    edits = {'count': 0}
+
+    def check(response, status=200):
+        if response.status_code != status:
+            raise RuntimeError(f'{response.request.path} answered {response.status_code}')
+        return response
+
+    def login():
+        check(client.post('/login', data={'user_id': 'teacher3', 'password': TEACHER_PASSWORD}), 302)
+        # Back to the admin session the other benchmarks use
+        check(client.post('/login', data={'user_id': 'admin', 'password': ADMIN_PASSWORD}), 302)
+
+    def load_data():
+        check(client.get('/api/load_data', query_string=query))
+
+    def save_data():
+        # A teacher re-saving the stream after changing one mark
+        edits['count'] += 1
+        row = loaded[edits['count'] % len(loaded)]
+        row['engEOT'] = (row.get('engEOT') or 0) % 100 + 1
+        result = check(client.post('/api/save_data', json={'class': 'S3', 'students': loaded})).get_json()
+        if not result.get('success'):
+            raise RuntimeError(f"save_data failed: {result.get('message')}")
+
+    def export_excel():
+        check(client.post('/api/export_excel', json=query)).get_data()
+
+    def generate_report():
+        result = check(client.post('/api/generate_report', json={
+            **query, 'std_no': student, 'report_type': 'EOT'})).get_json()
+        if not result.get('success'):
+            raise RuntimeError(f"generate_report failed: {result.get('message')}")
+
+    return {
+        'login': login,
+        'load_data': load_data,
+        'save_data': save_data,
+        'export_excel': export_excel,
+        'generate_report': generate_report,
+    }
+
+def measure(case, iterations, warmup):
+    """Latency samples in ms, then the peak Python allocation of one more run"""
+    for _ in range(warmup):
+        case()
+    samples = []
+    for _ in range(iterations):
+        started = time.perf_counter()
+        case()
+        samples.append((time.perf_counter() - started) * 1000)
+    tracemalloc.start()
+    case()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {
+        'iterations': iterations,
+        'p50_ms': round(percentile(samples, 0.50), 2),
+        'p95_ms': round(percentile(samples, 0.95), 2),
+        'mean_ms': round(sum(samples) / len(samples), 2),
+        'max_ms': round(max(samples), 2),
+        'peak_kb': round(peak / 1024, 1),
+    }
+
+def max_rss_mb():
+    try:
+        import resource
+    except ImportError:  # Windows
+        return None
+    # kilobytes on Linux
+    return round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+
+def compare(results, baseline, tolerance):
+    """Print the change from a baseline run; returns the names that regressed"""
+    regressed = []
+    print(f"\n{'vs baseline':<16}{'p50':>16}{'p95':>16}{'peak KB':>16}")
+    for name, result in results.items():
+        base = baseline.get('results', {}).get(name)
+        if not base:
+            print(f"{name:<16}{'(not in baseline)':>16}")
+            continue
+        changes = []
+        for key in ('p50_ms', 'p95_ms', 'peak_kb'):
+            change = (result[key] - base[key]) / base[key] if base[key] else 0.0
+            changes.append(f'{change:+.0%}')
+        slower = result['p95_ms'] - base['p95_ms']
+        flag = ''
+        if slower > MIN_REGRESSION_MS and slower > tolerance * base['p95_ms']:
+            regressed.append(name)
+            flag = '  REGRESSION'
+        print(f"{name:<16}{changes[0]:>16}{changes[1]:>16}{changes[2]:>16}{flag}")
+    return regressed
+
+def run(args):
+    database, run_dir = prepare_database(args.students, args.years, args.seed, args.data_dir)
+    # The app's connections open database.DATABASE
+    db_module.DATABASE = database
+    # Keep the slow query log from drowning the results table
+    metrics.SLOW_QUERY_MS = float('inf')
+    try:
+        import app as school_app
+        client = school_app.app.test_client()
+        if client.post('/login', data={'user_id': 'admin', 'password': ADMIN_PASSWORD}).status_code != 302:
+            raise RuntimeError('Could not log in as admin')
+
+        conn = connect(database, readonly=True)
+        try:
+            cases = make_cases(client, conn)
+        finally:
+            conn.close()
+
+        results = {}
+        print(f"\n{'benchmark':<16}{'p50 ms':>10}{'p95 ms':>10}{'mean ms':>10}{'max ms':>10}{'peak KB':>12}")
+        for name in args.only or BENCHMARKS:
+            result = results[name] = measure(cases[name], args.iterations, args.warmup)
+            print(f"{name:<16}{result['p50_ms']:>10}{result['p95_ms']:>10}{result['mean_ms']:>10}"
+                  f"{result['max_ms']:>10}{result['peak_kb']:>12}")
+        print(f"Max RSS: {max_rss_mb()} MB")
+    finally:
+        shutil.rmtree(run_dir, ignore_errors=True)
+
+    report = {
+        'meta': {
+            'date': datetime.now().isoformat(timespec='seconds'),
+            'students': args.students,
+            'years': args.years,
+            'seed': args.seed,
+            'iterations': args.iterations,
+            'python': platform.python_version(),
+            'machine': platform.machine(),
+            'max_rss_mb': max_rss_mb(),
+        },
+        'results': results,
+    }
+    if args.save_baseline:
+        with open(args.save_baseline, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"Saved baseline to {args.save_baseline}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        if (baseline['meta']['students'], baseline['meta']['years']) != (args.students, args.years):
+            print("Warning: the baseline was measured on a different data volume")
+        regressed = compare(results, baseline, args.tolerance)
+        if regressed:
+            print(f"p95 more than {args.tolerance:.0%} slower than the baseline: {', '.join(regressed)}")
+            return False
+    return True
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Benchmark the hot endpoints on synthetic data with the Flask test client')
+    parser.add_argument('--students', type=int, default=2000, help='students per year')
+    parser.add_argument('--years', type=int, default=5)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--iterations', type=int, default=50)
+    parser.add_argument('--warmup', type=int, default=3)
+    parser.add_argument('--only', nargs='+', choices=BENCHMARKS, help='run only these benchmarks')
+    parser.add_argument('--data-dir', default=os.path.join(tempfile.gettempdir(), 'school-bench-data'),
+                        help='where generated databases are cached between runs')
+    parser.add_argument('--baseline', help='JSON results of an earlier run to compare against')
+    parser.add_argument('--save-baseline', help='write the results to this JSON file')
+    parser.add_argument('--tolerance', type=float, default=DEFAULT_TOLERANCE,
+                        help='allowed p95 slowdown against the baseline (default 0.2)')
+    args = parser.parse_args()
+    sys.exit(0 if run(args) else 1)
@@ -0,0 +1,55 @@
+import sqlite3
+import os
+import sys
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from marks_schema import CLASS_TABLES
+from marks_long import (
+    LONG, WIDE, clear_wide_marks, copy_long_to_wide, copy_wide_to_long,
+    create_wide_views, marks_storage, set_marks_storage,
+)
+from migrations import run_migrations
+
+def convert(database, target, keep_wide=False):
+    conn = sqlite3.connect(database)
+    try:
+        run_migrations(conn)
+        if marks_storage(conn) == target:
+            print(f"Marks are already stored in {target} format.")
+            return
+        
+        # One transaction, so a failed conversion leaves the old layout intact
+        conn.execute('BEGIN')
+        for class_level in CLASS_TABLES:
+            if target == LONG:
+                copied = copy_wide_to_long(conn, class_level)
+                if not keep_wide:
+                    clear_wide_marks(conn, class_level)
+                print(f"{class_level}: copied {copied} marks into the marks table")
+            else:
+                copy_long_to_wide(conn, class_level)
+                conn.execute('DELETE FROM marks WHERE class_level = ?', (class_level,))
+                print(f"{class_level}: restored marks into the wide columns")
+        create_wide_views(conn)
+        set_marks_storage(conn, target)
+        conn.commit()
+        print(f"Marks storage switched to {target} format.")
+    except sqlite3.Error:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description='Move student marks between the wide class tables and the long-format marks table. '
+                    'Stop the app before converting.'
+    )
+    parser.add_argument('target', choices=[LONG, WIDE])
+    parser.add_argument('--database', default='school_management.db')
+    parser.add_argument('--keep-wide', action='store_true',
+                        help='leave the copied marks in the wide columns as well')
+    args = parser.parse_args()
+    convert(args.database, args.target, args.keep_wide)
@@ -1,5 +1,11 @@
 import sqlite3
 import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from marks_schema import CLASS_TABLES, class_table_ddl, left_table_ddl
+from migrations import run_migrations
 
 def create_database():
     # Create database connection
@@ -82,101 +88,16 @@ def create_database():
     ''')
     
     # Create class tables (S1, S2, S3, S4, S5, S6)
-    classes = ['S1', 'S2', 'S3', 'S4', 'S5', 'S6']
-    
-    for class_name in classes:
+    for class_name in CLASS_TABLES:
+        cursor.execute(class_table_ddl(class_name))
+        # save_data upserts on the student-term key
         cursor.execute(f'''
-            CREATE TABLE IF NOT EXISTS {class_name} (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                std_no INTEGER,
-                sdt_name TEXT,
-                class_level TEXT,
-                stream TEXT,
-                year INTEGER,
-                term TEXT,
-                gender TEXT,
-                section TEXT,
-                eng1 REAL, eng2 REAL, eng3 REAL, eng4 REAL, engBOT REAL, engMOT REAL, engEOT REAL,
-                mtc1 REAL, mtc2 REAL, mtc3 REAL, mtc4 REAL, mtcBOT REAL, mtcMOT REAL, mtcEOT REAL,
-                bio1 REAL, bio2 REAL, bio3 REAL, bio4 REAL, bioBOT REAL, bioMOT REAL, bioEOT REAL,
-                phy1 REAL, phy2 REAL, phy3 REAL, phy4 REAL, phyBOT REAL, phyMOT REAL, phyEOT REAL,
-                geo1 REAL, geo2 REAL, geo3 REAL, geo4 REAL, geoBOT REAL, geoMOT REAL, geoEOT REAL,
-                his1 REAL, his2 REAL, his3 REAL, his4 REAL, hisBOT REAL, hisMOT REAL, hisEOT REAL,
-                che1 REAL, che2 REAL, che3 REAL, che4 REAL, cheBOT REAL, cheMOT REAL, cheEOT REAL,
-                ict1 REAL, ict2 REAL, ict3 REAL, ict4 REAL, ictBOT REAL, ictMOT REAL, ictEOT REAL,
-                ent1 REAL, ent2 REAL, ent3 REAL, ent4 REAL, entBOT REAL, entMOT REAL, entEOT REAL,
-                cre1 REAL, cre2 REAL, cre3 REAL, cre4 REAL, creBOT REAL, creMOT REAL, creEOT REAL,
-                agr1 REAL, agr2 REAL, agr3 REAL, agr4 REAL, agrBOT REAL, agrMOT REAL, agrEOT REAL,
-                phe1 REAL, phe2 REAL, phe3 REAL, phe4 REAL, pheBOT REAL, pheMOT REAL, pheEOT REAL,
-                kis1 REAL, kis2 REAL, kis3 REAL, kis4 REAL, kisBOT REAL, kisMOT REAL, kisEOT REAL,
-                art1 REAL, art2 REAL, art3 REAL, art4 REAL, artBOT REAL, artMOT REAL, artEOT REAL,
-                ire1 REAL, ire2 REAL, ire3 REAL, ire4 REAL, ireBOT REAL, ireMOT REAL, ireEOT REAL,
-                lit1 REAL, lit2 REAL, lit3 REAL, lit4 REAL, litBOT REAL, litMOT REAL, litEOT REAL,
-                tad1 REAL, tad2 REAL, tad3 REAL, tad4 REAL, tadBOT REAL, tadMOT REAL, tadEOT REAL,
-                fsn1 REAL, fsn2 REAL, fsn3 REAL, fsn4 REAL, fsnBOT REAL, fsnMOT REAL, fsnEOT REAL,
-                lat1 REAL, lat2 REAL, lat3 REAL, lat4 REAL, latBOT REAL, latMOT REAL, latEOT REAL,
-                ate1 REAL, ate2 REAL, ate3 REAL, ate4 REAL, ateBOT REAL, ateMOT REAL, ateEOT REAL,
-                lum1 REAL, lum2 REAL, lum3 REAL, lum4 REAL, lumBOT REAL, lumMOT REAL, lumEOT REAL,
-                lug1 REAL, lug2 REAL, lug3 REAL, lug4 REAL, lugBOT REAL, lugMOT REAL, lugEOT REAL,
-                lus1 REAL, lus2 REAL, lus3 REAL, lus4 REAL, lusBOT REAL, lusMOT REAL, lusEOT REAL,
-                lba1 REAL, lba2 REAL, lba3 REAL, lba4 REAL, lbaBOT REAL, lbaMOT REAL, lbaEOT REAL,
-                lbl1 REAL, lbl2 REAL, lbl3 REAL, lbl4 REAL, lblBOT REAL, lblMOT REAL, lblEOT REAL,
-                run1 REAL, run2 REAL, run3 REAL, run4 REAL, runBOT REAL, runMOT REAL, runEOT REAL,
-                rut1 REAL, rut2 REAL, rut3 REAL, rut4 REAL, rutBOT REAL, rutMOT REAL, rutEOT REAL,
-                fre1 REAL, fre2 REAL, fre3 REAL, fre4 REAL, freBOT REAL, freMOT REAL, freEOT REAL,
-                ger1 REAL, ger2 REAL, ger3 REAL, ger4 REAL, gerBOT REAL, gerMOT REAL, gerEOT REAL,
-                dho1 REAL, dho2 REAL, dho3 REAL, dho4 REAL, dhoBOT REAL, dhoMOT REAL, dhoEOT REAL,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
+            CREATE UNIQUE INDEX IF NOT EXISTS ux_{class_name.lower()}_student_term
+            ON {class_name} (std_no, year, term)
         ''')
     
     # Create LEFT table for graduated/deleted students
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS LEFT (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            std_no INTEGER,
-            sdt_name TEXT,
-            class_level TEXT,
-            stream TEXT,
-            year INTEGER,
-            term TEXT,
-            gender TEXT,
-            section TEXT,
-            eng1 REAL, eng2 REAL, eng3 REAL, eng4 REAL, engBOT REAL, engMOT REAL, engEOT REAL,
-            mtc1 REAL, mtc2 REAL, mtc3 REAL, mtc4 REAL, mtcBOT REAL, mtcMOT REAL, mtcEOT REAL,
-            bio1 REAL, bio2 REAL, bio3 REAL, bio4 REAL, bioBOT REAL, bioMOT REAL, bioEOT REAL,
-            phy1 REAL, phy2 REAL, phy3 REAL, phy4 REAL, phyBOT REAL, phyMOT REAL, phyEOT REAL,
-            geo1 REAL, geo2 REAL, geo3 REAL, geo4 REAL, geoBOT REAL, geoMOT REAL, geoEOT REAL,
-            his1 REAL, his2 REAL, his3 REAL, his4 REAL, hisBOT REAL, hisMOT REAL, hisEOT REAL,
-            che1 REAL, che2 REAL, che3 REAL, che4 REAL, cheBOT REAL, cheMOT REAL, cheEOT REAL,
-            ict1 REAL, ict2 REAL, ict3 REAL, ict4 REAL, ictBOT REAL, ictMOT REAL, ictEOT REAL,
-            ent1 REAL, ent2 REAL, ent3 REAL, ent4 REAL, entBOT REAL, entMOT REAL, entEOT REAL,
-            cre1 REAL, cre2 REAL, cre3 REAL, cre4 REAL, creBOT REAL, creMOT REAL, creEOT REAL,
-            agr1 REAL, agr2 REAL, agr3 REAL, agr4 REAL, agrBOT REAL, agrMOT REAL, agrEOT REAL,
-            phe1 REAL, phe2 REAL, phe3 REAL, phe4 REAL, pheBOT REAL, pheMOT REAL, pheEOT REAL,
-            kis1 REAL, kis2 REAL, kis3 REAL, kis4 REAL, kisBOT REAL, kisMOT REAL, kisEOT REAL,
-            art1 REAL, art2 REAL, art3 REAL, art4 REAL, artBOT REAL, artMOT REAL, artEOT REAL,
-            ire1 REAL, ire2 REAL, ire3 REAL, ire4 REAL, ireBOT REAL, ireMOT REAL, ireEOT REAL,
-            lit1 REAL, lit2 REAL, lit3 REAL, lit4 REAL, litBOT REAL, litMOT REAL, litEOT REAL,
-            tad1 REAL, tad2 REAL, tad3 REAL, tad4 REAL, tadBOT REAL, tadMOT REAL, tadEOT REAL,
-            fsn1 REAL, fsn2 REAL, fsn3 REAL, fsn4 REAL, fsnBOT REAL, fsnMOT REAL, fsnEOT REAL,
-            lat1 REAL, lat2 REAL, lat3 REAL, lat4 REAL, latBOT REAL, latMOT REAL, latEOT REAL,
-            ate1 REAL, ate2 REAL, ate3 REAL, ate4 REAL, ateBOT REAL, ateMOT REAL, ateEOT REAL,
-            lum1 REAL, lum2 REAL, lum3 REAL, lum4 REAL, lumBOT REAL, lumMOT REAL, lumEOT REAL,
-            lug1 REAL, lug2 REAL, lug3 REAL, lug4 REAL, lugBOT REAL, lugMOT REAL, lugEOT REAL,
-            lus1 REAL, lus2 REAL, lus3 REAL, lus4 REAL, lusBOT REAL, lusMOT REAL, lusEOT REAL,
-            lba1 REAL, lba2 REAL, lba3 REAL, lba4 REAL, lbaBOT REAL, lbaMOT REAL, lbaEOT REAL,
-            lbl1 REAL, lbl2 REAL, lbl3 REAL, lbl4 REAL, lblBOT REAL, lblMOT REAL, lblEOT REAL,
-            run1 REAL, run2 REAL, run3 REAL, run4 REAL, runBOT REAL, runMOT REAL, runEOT REAL,
-            rut1 REAL, rut2 REAL, rut3 REAL, rut4 REAL, rutBOT REAL, rutMOT REAL, rutEOT REAL,
-            fre1 REAL, fre2 REAL, fre3 REAL, fre4 REAL, freBOT REAL, freMOT REAL, freEOT REAL,
-            ger1 REAL, ger2 REAL, ger3 REAL, ger4 REAL, gerBOT REAL, gerMOT REAL, gerEOT REAL,
-            dho1 REAL, dho2 REAL, dho3 REAL, dho4 REAL, dhoBOT REAL, dhoMOT REAL, dhoEOT REAL,
-            reason TEXT,
-            moved_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-        )
-    ''')
+    cursor.execute(left_table_ddl())
     
     # Create contacts table
     cursor.execute('''
@@ -293,6 +214,9 @@ def create_database():
     ''', subjects_data)
     
     conn.commit()
+    
+    # Add the indexes and later schema changes
+    run_migrations(conn)
     conn.close()
     print("Database created successfully!")
 
@@ -0,0 +1,44 @@
+import os
+import sys
+import time
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database import connect
+from migrations import run_migrations
+from synthetic import TERMS, generate
+
+def generate_data(database, students, years, terms, last_year, teachers, books, seed):
+    if not os.path.exists(database):
+        print(f"{database} does not exist; create it with scripts/create_database.py first")
+        return False
+    conn = connect(database)
+    try:
+        run_migrations(conn)
+        started = time.perf_counter()
+        counts = generate(conn, students, years, terms, last_year, teachers, books, seed)
+        print(f"Generated {counts['students']} student rows, {counts['payments']} payments and "
+              f"{counts['loans']} loans in {time.perf_counter() - started:.1f}s.")
+        return True
+    except ValueError as e:
+        print(f"Cannot generate data: {e}")
+        return False
+    finally:
+        conn.close()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Fill an empty database with synthetic students, marks, fees and loans')
+    parser.add_argument('--database', default='school_management.db')
+    parser.add_argument('--students', type=int, default=2000, help='students per year, spread over S1-S6')
+    parser.add_argument('--years', type=int, default=5)
+    parser.add_argument('--terms', default=','.join(TERMS), help='comma-separated terms (default I,II,III)')
+    parser.add_argument('--last-year', type=int, help='latest year generated (default this year)')
+    parser.add_argument('--teachers', type=int, default=24, help='teacher accounts teacher1..N')
+    parser.add_argument('--books', type=int, default=500)
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+    terms = tuple(term.strip() for term in args.terms.split(',') if term.strip())
+    ok = generate_data(args.database, args.students, args.years, terms, args.last_year,
+                       args.teachers, args.books, args.seed)
+    sys.exit(0 if ok else 1)
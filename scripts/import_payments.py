@@ -0,0 +1,43 @@
+import os
+import sys
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bursary import PAYMENT_METHODS
+from database import connect
+from imports import read_rows
+from migrations import run_migrations
+from statements import import_statement
+
+def import_file(database, path, year, term, payment_method=None, dry_run=False):
+    conn = connect(database)
+    try:
+        run_migrations(conn)
+        with open(path, 'rb') as stream:
+            report = import_statement(conn, read_rows(stream, path), year, term, payment_method, dry_run)
+    finally:
+        conn.close()
+    
+    for kind in ('unmatched', 'rejected'):
+        for line in report[kind]:
+            print(f"Line {line['line']} {kind}: {line['receipt_no']} {line['amount']} "
+                  f"{line['std_no'] or line['reference'] or ''} ({line['reason']})")
+    verb = 'Would import' if dry_run else 'Imported'
+    print(f"{verb} {report['imported']} payments totalling {report['amount']:,.2f}; "
+          f"{report['duplicates']} duplicates skipped, {report['unmatched_count']} unmatched, "
+          f"{report['rejected_count']} rejected.")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Record the payments of a bank or mobile-money statement')
+    parser.add_argument('file')
+    parser.add_argument('--year', type=int, required=True)
+    parser.add_argument('--term', required=True)
+    parser.add_argument('--method', choices=PAYMENT_METHODS, help='payment method recorded for every line')
+    parser.add_argument('--database', default='school_management.db')
+    parser.add_argument('--dry-run', action='store_true', help='match only and report unmatched lines')
+    args = parser.parse_args()
+    try:
+        import_file(args.database, args.file, args.year, args.term, args.method, args.dry_run)
+    except ValueError as e:
+        sys.exit(f"Import failed: {e}")
@@ -0,0 +1,42 @@
+import os
+import sys
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database import connect
+from imports import import_students, read_rows
+from marks_schema import CLASS_TABLES
+from migrations import run_migrations
+
+def import_file(database, path, class_level, defaults, dry_run=False):
+    conn = connect(database)
+    try:
+        run_migrations(conn)
+        with open(path, 'rb') as stream:
+            report = import_students(conn, read_rows(stream, path), class_level, defaults, dry_run)
+    finally:
+        conn.close()
+    
+    for rejected in report['rejected']:
+        print(f"Line {rejected['line']}: {'; '.join(rejected['errors'])}")
+    if report['ignored_columns']:
+        print(f"Ignored columns: {', '.join(report['ignored_columns'])}")
+    verb = 'Would import' if dry_run else 'Imported'
+    print(f"{verb} {report['imported']} students into {class_level}, rejected {report['rejected_count']} rows.")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Import students and marks from an .xlsx or CSV file')
+    parser.add_argument('file')
+    parser.add_argument('--class', dest='class_level', required=True, choices=CLASS_TABLES)
+    parser.add_argument('--stream', help='stream for rows that leave it blank')
+    parser.add_argument('--year', help='year for rows that leave it blank')
+    parser.add_argument('--term', help='term for rows that leave it blank')
+    parser.add_argument('--database', default='school_management.db')
+    parser.add_argument('--dry-run', action='store_true', help='validate only and report rejected rows')
+    args = parser.parse_args()
+    try:
+        import_file(args.database, args.file, args.class_level,
+                    {'stream': args.stream, 'year': args.year, 'term': args.term}, args.dry_run)
+    except ValueError as e:
+        sys.exit(f"Import failed: {e}")
@@ -0,0 +1,406 @@
+import os
+import sys
+import json
+import time
+import random
+import hashlib
+import shutil
+import socket
+import sqlite3
+import argparse
+import tempfile
+import threading
+import subprocess
+import urllib.error
+import urllib.parse
+import urllib.request
+from http.cookiejar import CookieJar
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from benchmark import percentile, prepare_database
+from database import connect
+from marks_long import marks_source
+from marks_schema import CA_COMPONENTS, CLASS_TABLES, EXAM_SETS, SUBJECT_CODES
+from rankings import rebuild_rows
+from synthetic import ADMIN_PASSWORD, STREAMS
+
+# Subjects handed to the load-test teachers, one (class, stream, subject) each
+RUSH_SUBJECTS = SUBJECT_CODES[:12]
+RUSH_PASSWORD = 'rush123'
+
+OPERATIONS = ('login', 'load_data', 'save_data')
+
+# Routes whose server-side timings are shown after the run
+SERVER_ROUTES = {('POST', '/login'), ('GET', '/api/load_data'), ('POST', '/api/save_data')}
+
+# Chance that a teacher reloads the grid before the next save
+RELOAD_CHANCE = 0.2
+
+class NoRedirect(urllib.request.HTTPRedirectHandler):
+    """Report the login redirect instead of following it to the dashboard"""
+    def redirect_request(self, req, fp, code, msg, headers, newurl):
+        return None
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+def start_server(database, run_dir):
+    """Run the app with run.py on a free port; returns (process, base URL)"""
+    port = free_port()
+    # SQL profiling on so /admin/metrics has the per-route SQL figures for the report
+    env = dict(os.environ, PORT=str(port), SCHOOL_DB=database, PROFILE_SQL='1')
+    log = open(os.path.join(run_dir, 'server.log'), 'w')
+    process = subprocess.Popen([sys.executable, 'run.py'], cwd=ROOT, env=env, stdout=log, stderr=subprocess.STDOUT)
+    url = f'http://127.0.0.1:{port}'
+    deadline = time.time() + 60
+    while time.time() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"The server exited; see {log.name}")
+        try:
+            urllib.request.urlopen(f'{url}/login', timeout=2).read()
+            return process, url
+        except OSError:
+            time.sleep(0.2)
+    process.terminate()
+    raise RuntimeError('The server did not start within 60s')
+
+def create_accounts(database, sessions):
+    """One teacher account per session, each owning a (class, stream, subject).
+
+    Owning distinct cells means the final marks of every acknowledged save
+    can be checked exactly afterwards.
+    """
+    combos = [(class_level, stream, subject)
+              for subject in RUSH_SUBJECTS for stream in STREAMS for class_level in CLASS_TABLES]
+    if sessions > len(combos):
+        raise ValueError(f'At most {len(combos)} sessions are supported')
+    conn = connect(database)
+    try:
+        year, term = conn.execute('''
+            SELECT year, term FROM S1 ORDER BY year DESC, term DESC LIMIT 1
+        ''').fetchone()
+        password = hashlib.sha256(RUSH_PASSWORD.encode()).hexdigest()
+        accounts = []
+        with conn:
+            for n, (class_level, stream, subject) in enumerate(combos[:sessions], start=1):
+                user_id = f'rush{n}'
+                conn.execute('''
+                    INSERT INTO users (user_id, full_name, role, subjects_taught, classes_taught, password, is_active)
+                    VALUES (?, ?, 'teacher', ?, ?, ?, 1)
+                    ON CONFLICT(user_id) DO UPDATE SET subjects_taught = excluded.subjects_taught,
+                        classes_taught = excluded.classes_taught, password = excluded.password, is_active = 1
+                ''', (user_id, f'Rush Teacher {n}', subject.upper(), class_level, password))
+                accounts.append({'user_id': user_id, 'class': class_level, 'stream': stream,
+                                 'subject': subject, 'year': year, 'term': term})
+    finally:
+        conn.close()
+    return accounts
+
+class Stats:
+    """Latencies and outcomes of every request, shared by the session threads"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latencies = {operation: [] for operation in OPERATIONS}
+        self.lock_errors = {operation: 0 for operation in OPERATIONS}
+        self.errors = {operation: 0 for operation in OPERATIONS}
+        self.messages = {}
+
+    def record(self, operation, elapsed, outcome, message=None):
+        with self.lock:
+            self.latencies[operation].append(elapsed * 1000)
+            if outcome == 'locked':
+                self.lock_errors[operation] += 1
+            elif outcome == 'error':
+                self.errors[operation] += 1
+                key = f'{operation}: {str(message)[:120]}'
+                self.messages[key] = self.messages.get(key, 0) + 1
+
+def _is_lock_error(message):
+    message = str(message or '').lower()
+    return 'locked' in message or 'busy' in message
+
+class TeacherSession:
+    """One teacher: log in, load the grid, then edit and save until time is up"""
+
+    def __init__(self, url, account, stats, think, stop_at, seed):
+        self.url = url
+        self.account = account
+        self.stats = stats
+        self.think = think
+        self.stop_at = stop_at
+        self.rng = random.Random(seed)
+        self.opener = urllib.request.build_opener(urllib.request.HTTPCookieProcessor(CookieJar()), NoRedirect())
+        self.rows = []
+        # Marks of the last save the server acknowledged
+        self.acknowledged = None
+        self.saves = 0
+
+    def request(self, path, data=None, form=None):
+        """(status, parsed JSON or None, seconds) of one request; status None if it never got an answer"""
+        headers = {}
+        body = None
+        if data is not None:
+            body = json.dumps(data).encode()
+            headers['Content-Type'] = 'application/json'
+        elif form is not None:
+            body = urllib.parse.urlencode(form).encode()
+        started = time.perf_counter()
+        try:
+            with self.opener.open(urllib.request.Request(self.url + path, body, headers), timeout=60) as response:
+                status, payload = response.status, response.read()
+        except urllib.error.HTTPError as e:
+            status, payload = e.code, e.read()
+        except OSError as e:
+            return None, {'error': str(e), 'message': str(e)}, time.perf_counter() - started
+        elapsed = time.perf_counter() - started
+        try:
+            result = json.loads(payload) if payload[:1] in (b'{', b'[') else None
+        except ValueError:
+            result = None
+        return status, result, elapsed
+
+    def login(self):
+        status, _, elapsed = self.request('/login', form={
+            'user_id': self.account['user_id'], 'password': RUSH_PASSWORD})
+        ok = status == 302
+        self.stats.record('login', elapsed, 'ok' if ok else 'error', f'status {status}')
+        return ok
+
+    def load(self):
+        account = self.account
+        query = urllib.parse.urlencode({key: account[key] for key in ('class', 'stream', 'year', 'term')})
+        status, result, elapsed = self.request(f'/api/load_data?{query}')
+        if status == 200 and isinstance(result, list):
+            self.stats.record('load_data', elapsed, 'ok')
+            self.rows = result
+            return True
+        message = result.get('error') if isinstance(result, dict) else f'status {status}'
+        self.stats.record('load_data', elapsed, 'locked' if _is_lock_error(message) else 'error', message)
+        return False
+
+    def edit(self):
+        """Change a few of this teacher's marks, as typed into the grid"""
+        subject = self.account['subject']
+        for row in self.rng.sample(self.rows, min(len(self.rows), self.rng.randint(1, 8))):
+            for component in self.rng.sample(CA_COMPONENTS + EXAM_SETS, 2):
+                column = subject + component
+                if component in CA_COMPONENTS:
+                    row[column] = round(self.rng.uniform(0.5, 3.0), 1)
+                else:
+                    row[column] = self.rng.randint(20, 100)
+
+    def save(self):
+        subject = self.account['subject']
+        columns = [subject + component for component in CA_COMPONENTS + EXAM_SETS]
+        payload = [dict(row) for row in self.rows]
+        status, result, elapsed = self.request('/api/save_data', data={
+            'class': self.account['class'], 'students': payload})
+        if status == 200 and isinstance(result, dict) and result.get('success'):
+            self.stats.record('save_data', elapsed, 'ok')
+            self.acknowledged = {row['std_no']: {column: row.get(column) for column in columns} for row in payload}
+            self.saves += 1
+            return True
+        message = result.get('message') if isinstance(result, dict) else f'status {status}'
+        self.stats.record('save_data', elapsed, 'locked' if _is_lock_error(message) else 'error', message)
+        return False
+
+    def pause(self):
+        time.sleep(max(min(self.rng.uniform(*self.think), self.stop_at - time.time()), 0))
+
+    def run(self):
+        if not self.login() or not self.load():
+            return
+        while time.time() < self.stop_at:
+            self.pause()
+            if time.time() >= self.stop_at:
+                break
+            self.edit()
+            self.save()
+            if self.rng.random() < RELOAD_CHANCE:
+                # Reloading shows the server's copy; unsaved edits are kept locally only until then
+                self.load()
+
+def check_integrity(database, sessions):
+    """Problems found in the database after the run, empty when all is well"""
+    problems = []
+    conn = connect(database, readonly=True)
+    try:
+        result = conn.execute('PRAGMA quick_check').fetchone()[0]
+        if result != 'ok':
+            problems.append(f'quick_check: {result}')
+
+        lost = 0
+        for session in sessions:
+            if not session.acknowledged:
+                continue
+            account = session.account
+            columns = list(next(iter(session.acknowledged.values())))
+            stored = {row['std_no']: row for row in conn.execute(f'''
+                SELECT std_no, {', '.join(columns)} FROM {marks_source(conn, account['class'])}
+                WHERE stream = ? AND year = ? AND term = ?
+            ''', (account['stream'], account['year'], account['term']))}
+            for std_no, marks in session.acknowledged.items():
+                row = stored.get(std_no)
+                for column, value in marks.items():
+                    saved = None if value in (None, '') else float(value)
+                    if row is None or row[column] != saved:
+                        lost += 1
+        if lost:
+            problems.append(f'{lost} acknowledged marks are not in the database')
+
+        for class_level in CLASS_TABLES:
+            duplicates = conn.execute(f'''
+                SELECT COUNT(*) FROM (
+                    SELECT 1 FROM {class_level} WHERE std_no IS NOT NULL
+                    GROUP BY std_no, year, term HAVING COUNT(*) > 1
+                )
+            ''').fetchone()[0]
+            if duplicates:
+                problems.append(f'{class_level}: {duplicates} students have duplicate rows')
+
+        # The rankings kept up to date by the saves must equal a full rebuild
+        touched = {(session.account['class'], session.account['year'], session.account['term'])
+                   for session in sessions if session.saves}
+        rebuilt = sqlite3.connect(':memory:')
+        rebuilt.row_factory = sqlite3.Row
+        try:
+            conn.backup(rebuilt)
+            with rebuilt:
+                for class_level, year, term in touched:
+                    rebuild_rows(rebuilt, class_level, year, term)
+            rebuilt.execute('ATTACH DATABASE ? AS live', (f'file:{os.path.abspath(database)}?mode=ro',))
+            # Rows of the rebuild missing or different in the live table, then live rows it lacks
+            differing = sum(rebuilt.execute(f'''
+                SELECT COUNT(*) FROM (
+                    SELECT * FROM {first}.student_rankings EXCEPT SELECT * FROM {second}.student_rankings
+                )
+            ''').fetchone()[0] for first, second in (('main', 'live'), ('live', 'main')))
+        finally:
+            rebuilt.close()
+        if differing:
+            problems.append(f'student_rankings differs from a full rebuild in {differing} rows')
+    finally:
+        conn.close()
+    return problems
+
+def server_metrics(url):
+    """The server's per-route SQL figures from /admin/metrics, None if unavailable"""
+    opener = urllib.request.build_opener(urllib.request.HTTPCookieProcessor(CookieJar()), NoRedirect())
+    try:
+        opener.open(url + '/login', urllib.parse.urlencode(
+            {'user_id': 'admin', 'password': ADMIN_PASSWORD}).encode(), timeout=10)
+    except urllib.error.HTTPError:
+        pass  # the 302 of a successful login
+    try:
+        with opener.open(url + '/admin/metrics', timeout=10) as response:
+            return json.loads(response.read())['metrics']
+    except (OSError, ValueError, KeyError):
+        return None
+
+def report(stats, duration, sessions, metrics):
+    total = sum(len(samples) for samples in stats.latencies.values())
+    saves = len(stats.latencies['save_data']) - stats.lock_errors['save_data'] - stats.errors['save_data']
+    print(f"\n{len(sessions)} sessions for {duration:.0f}s: {total} requests, "
+          f"{total / duration:.1f} req/s, {saves / duration:.2f} acknowledged saves/s")
+    print(f"\n{'operation':<12}{'count':>8}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'max ms':>10}"
+          f"{'locked':>9}{'errors':>9}")
+    for operation in OPERATIONS:
+        samples = stats.latencies[operation]
+        if not samples:
+            continue
+        count = len(samples)
+        print(f"{operation:<12}{count:>8}{percentile(samples, 0.5):>10.1f}{percentile(samples, 0.95):>10.1f}"
+              f"{percentile(samples, 0.99):>10.1f}{max(samples):>10.1f}"
+              f"{stats.lock_errors[operation] / count:>9.1%}{stats.errors[operation] / count:>9.1%}")
+    for message, count in sorted(stats.messages.items(), key=lambda item: -item[1])[:10]:
+        print(f"  {count} x {message}")
+    if metrics:
+        print(f"\n{'server side':<24}{'p95 ms':>10}{'SQL ms/req':>12}{'SQL share':>11}")
+        for route in metrics['routes']:
+            if (route['method'], route['route']) in SERVER_ROUTES:
+                print(f"{route['method'] + ' ' + route['route']:<24}{route['p95_ms']:>10}"
+                      f"{route['sql_ms_per_request']:>12}{route['sql_share']:>11.0%}")
+
+def run(args):
+    run_dir = None
+    if args.database:
+        database = args.database
+        print(f"Writing load-test accounts and marks into {database}")
+    else:
+        database, run_dir = prepare_database(args.students, args.years, args.seed, args.data_dir)
+    process = None
+    try:
+        accounts = create_accounts(database, args.sessions)
+        if args.url:
+            url = args.url.rstrip('/')
+        else:
+            process, url = start_server(database, run_dir or os.path.dirname(os.path.abspath(database)))
+
+        stats = Stats()
+        started = time.time()
+        stop_at = started + args.ramp_up + args.duration
+        sessions = [
+            TeacherSession(url, account, stats, (args.think_min, args.think_max), stop_at, args.seed * 1000 + n)
+            for n, account in enumerate(accounts)
+        ]
+        threads = []
+        for n, session in enumerate(sessions):
+            # Teachers arrive spread over the ramp-up
+            delay = started + args.ramp_up * n / len(sessions) - time.time()
+            if delay > 0:
+                time.sleep(delay)
+            thread = threading.Thread(target=session.run, daemon=True)
+            thread.start()
+            threads.append(thread)
+        for thread in threads:
+            thread.join()
+        elapsed = time.time() - started
+
+        report(stats, elapsed, sessions, server_metrics(url))
+    finally:
+        if process is not None:
+            process.terminate()
+            process.wait(timeout=30)
+
+    try:
+        problems = check_integrity(database, sessions)
+    finally:
+        if run_dir and not args.keep:
+            shutil.rmtree(run_dir, ignore_errors=True)
+        elif run_dir:
+            print(f"Database kept in {run_dir}")
+
+    print()
+    if problems:
+        for problem in problems:
+            print(f"INTEGRITY: {problem}")
+        return False
+    print("Integrity checks passed: every acknowledged save is stored and the rankings match a rebuild.")
+    return True
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Simulate teachers saving marks concurrently right before the deadline')
+    parser.add_argument('--sessions', type=int, default=30, help='concurrent teacher sessions')
+    parser.add_argument('--duration', type=float, default=60, help='seconds of editing after the ramp-up')
+    parser.add_argument('--ramp-up', type=float, default=5, help='seconds over which the sessions log in')
+    parser.add_argument('--think-min', type=float, default=1.0, help='shortest pause between saves, seconds')
+    parser.add_argument('--think-max', type=float, default=5.0, help='longest pause between saves, seconds')
+    parser.add_argument('--students', type=int, default=2000, help='students per year of the generated data')
+    parser.add_argument('--years', type=int, default=1)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--data-dir', default=os.path.join(tempfile.gettempdir(), 'school-bench-data'),
+                        help='where generated databases are cached between runs')
+    parser.add_argument('--database', help='use this database in place instead of a generated copy')
+    parser.add_argument('--url', help='test an already running server using --database (default: start run.py)')
+    parser.add_argument('--keep', action='store_true', help='keep the generated copy and server log')
+    args = parser.parse_args()
+    if args.url and not args.database:
+        parser.error('--url needs the --database the server uses, for the accounts and integrity checks')
+    if args.think_min > args.think_max:
+        parser.error('--think-min is larger than --think-max')
+    sys.exit(0 if run(args) else 1)
@@ -0,0 +1,43 @@
+import sqlite3
+import logging
+import os
+import sys
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from migrations import current_version, latest_version, missing_tables, pending_migrations, run_migrations
+
+def migrate(database, status_only=False):
+    conn = sqlite3.connect(database)
+    try:
+        if status_only:
+            print(f"Schema version {current_version(conn)} of {latest_version()}")
+            for version, description, _ in pending_migrations(conn):
+                print(f"Pending migration {version}: {description}")
+                missing = missing_tables(conn, version)
+                if missing:
+                    print(f"  waiting for tables: {', '.join(missing)}")
+            return True
+        
+        try:
+            applied = run_migrations(conn)
+        except sqlite3.Error as e:
+            print(f"Migration stopped at version {current_version(conn)}: {e}")
+            return False
+        if not applied:
+            print("Database is already up to date.")
+        else:
+            print(f"Database migrated to version {current_version(conn)}")
+        return True
+    finally:
+        conn.close()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Bring school_management.db up to the latest schema version')
+    parser.add_argument('--database', default='school_management.db')
+    parser.add_argument('--status', action='store_true', help='only list pending migrations')
+    args = parser.parse_args()
+    # Show the migrations as they are applied and what they changed
+    logging.basicConfig(level=logging.INFO, format='%(message)s')
+    sys.exit(0 if migrate(args.database, args.status) else 1)
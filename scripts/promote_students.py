@@ -0,0 +1,54 @@
+import os
+import sys
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database import connect
+from migrations import run_migrations
+from promotion import GRADUATED, default_snapshot_dir, promote, promotion_plan, restore_snapshot
+
+def print_plan(plan):
+    for entry in plan:
+        line = (f"{entry['class_level']} -> {entry['to']}: {entry['students']} students, "
+                f"{entry['repeating']} repeating")
+        if 'inserted' in entry:
+            line += f", {entry['inserted']} rows created, {entry['archived']} rows archived"
+        print(line)
+
+def run(database, year, repeating, reason, dry_run=False):
+    conn = connect(database)
+    try:
+        run_migrations(conn)
+        if dry_run:
+            print_plan(promotion_plan(conn, year, repeating))
+            return
+        plan, snapshot = promote(conn, year, repeating, reason, default_snapshot_dir(conn))
+        print_plan(plan)
+        print(f"Promoted {year} to {year + 1}. Undo with: --restore {snapshot}")
+    finally:
+        conn.close()
+
+def restore(database, path):
+    conn = connect(database)
+    try:
+        restore_snapshot(conn, path)
+        print(f"Restored {database} from {path}")
+    finally:
+        conn.close()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Promote every class to the next one at the end of a year')
+    parser.add_argument('--year', type=int, help='school year being closed')
+    parser.add_argument('--repeat', type=int, nargs='*', default=[], help='student numbers staying in their class')
+    parser.add_argument('--reason', default=GRADUATED, help='reason recorded for S6 leavers')
+    parser.add_argument('--database', default='school_management.db')
+    parser.add_argument('--dry-run', action='store_true', help='only print what would be moved')
+    parser.add_argument('--restore', metavar='SNAPSHOT', help='roll back to a snapshot taken before a promotion')
+    args = parser.parse_args()
+    if args.restore:
+        restore(args.database, args.restore)
+    elif args.year is None:
+        parser.error('--year is required')
+    else:
+        run(args.database, args.year, args.repeat, args.reason, args.dry_run)
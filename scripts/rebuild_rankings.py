@@ -0,0 +1,30 @@
+import sqlite3
+import os
+import sys
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from marks_schema import CLASS_TABLES
+from migrations import run_migrations
+from rankings import rebuild
+
+def rebuild_rankings(database, class_level=None, year=None, term=None):
+    conn = sqlite3.connect(database)
+    try:
+        run_migrations(conn)
+        count = rebuild(conn, class_level, year, term)
+        print(f"Ranked {count} student rows.")
+    finally:
+        conn.close()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Recompute student totals and stream/class positions')
+    parser.add_argument('--database', default='school_management.db')
+    parser.add_argument('--class', dest='class_level', choices=CLASS_TABLES, help='only this class')
+    parser.add_argument('--year', type=int, help='only this year (requires --term)')
+    parser.add_argument('--term', help='only this term (requires --year)')
+    args = parser.parse_args()
+    if (args.year is None) != (args.term is None):
+        parser.error('--year and --term must be given together')
+    rebuild_rankings(args.database, args.class_level, args.year, args.term)
@@ -0,0 +1,35 @@
+"""Mark overdue library loans and accrue their fines.
+
+Run once a day, e.g. from cron:
+    0 1 * * * cd /path/to/app && python scripts/update_library_fines.py
+"""
+import os
+import sys
+import argparse
+from datetime import date
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database import connect
+from library import recount_stats, update_overdue
+from migrations import run_migrations
+
+def update_fines(database, today=None, recount=False):
+    conn = connect(database)
+    try:
+        run_migrations(conn)
+        if recount:
+            with conn:
+                recount_stats(conn)
+        newly_overdue, overdue = update_overdue(conn, today)
+        print(f"{newly_overdue} loans became overdue; {overdue} overdue loans in total.")
+    finally:
+        conn.close()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Mark overdue library loans and accrue their fines')
+    parser.add_argument('--database', default='school_management.db')
+    parser.add_argument('--date', type=date.fromisoformat, help='compute as of this date (YYYY-MM-DD)')
+    parser.add_argument('--recount', action='store_true', help='recompute the library counters from the tables first')
+    args = parser.parse_args()
+    update_fines(args.database, args.date, args.recount)
@@ -0,0 +1,203 @@
+"""Bulk payment ingestion from bank and mobile-money statements.
+
+A statement (.xlsx or CSV) is streamed row by row. Each credit line is
+matched to a student of the term through a dict of student numbers built
+once from fee_balances: by its student number column when the statement
+has one, otherwise by a student number found in the reference/narration
+text. Lines are deduplicated on their transaction ID, which becomes the
+payment's receipt_no (unique in fees_payments), so a line repeated in the
+statement, or importing the same or an overlapping statement again,
+records nothing twice. Matched payments are inserted CHUNK_SIZE at a time,
+each chunk in one transaction, and only the rows actually inserted are
+counted in the report; the balance triggers update fee_balances as they
+go. The report lists every line that could not be matched or was
+rejected, for reconciliation by hand.
+"""
+import re
+from datetime import date, datetime
+
+from bursary import PAYMENT_METHODS
+from imports import MAX_REPORTED_REJECTIONS
+
+CHUNK_SIZE = 500
+
+STATEMENT_ALIASES = {
+    'std_no': ('std no', 'student no', 'student number', 'card number', 'account', 'account no'),
+    'receipt_no': ('receipt no', 'receipt', 'transaction id', 'txn id', 'transaction no',
+                   'transaction ref', 'reference no', 'ref no'),
+    'reference': ('reference', 'narration', 'description', 'details', 'particulars', 'memo'),
+    'amount_paid': ('amount', 'amount paid', 'credit', 'credit amount', 'paid in', 'deposit'),
+    'payment_date': ('date', 'payment date', 'transaction date', 'value date', 'posting date'),
+}
+
+_HEADER_COLUMNS = {alias: column for column, aliases in STATEMENT_ALIASES.items() for alias in aliases}
+
+_DATE_FORMATS = ('%Y-%m-%d', '%d/%m/%Y', '%d-%m-%Y', '%d.%m.%Y', '%d %b %Y', '%d-%b-%Y', '%Y/%m/%d')
+
+
+def map_statement_header(label):
+    """Payment field of a statement header cell, None if it is not recognised"""
+    text = re.sub(r'[\s_.#]+', ' ', str(label or '')).strip().lower()
+    return _HEADER_COLUMNS.get(text)
+
+
+def parse_amount(value):
+    """Amount of a statement cell: numbers, '1,200,000.00' or 'UGX 50,000'"""
+    if isinstance(value, (int, float)):
+        return float(value)
+    text = re.sub(r'[^\d.\-]', '', str(value or ''))
+    if not text:
+        raise ValueError(f'{value!r} is not an amount')
+    return float(text)
+
+
+def parse_date(value):
+    """ISO date of a statement cell"""
+    if isinstance(value, datetime):
+        return value.date().isoformat()
+    if isinstance(value, date):
+        return value.isoformat()
+    text = str(value or '').strip()
+    # Timestamps such as '2025-02-03 10:15:00' keep only the date
+    for candidate in (text, text.split(' ')[0], text.split('T')[0]):
+        for fmt in _DATE_FORMATS:
+            try:
+                return datetime.strptime(candidate, fmt).date().isoformat()
+            except ValueError:
+                continue
+    raise ValueError(f'{value!r} is not a date')
+
+
+def load_students(conn, year, term):
+    """{student number: class} of every student with fees for a term"""
+    rows = conn.execute('''
+        SELECT std_no, class_level FROM fee_balances WHERE year = ? AND term = ?
+    ''', (year, term))
+    return {row[0]: row[1] for row in rows}
+
+
+def match_student(fields, students):
+    """Student number of a statement line, None if no unique student matches"""
+    std_no = str(fields.get('std_no') or '').strip()
+    if std_no:
+        try:
+            std_no = int(float(std_no))
+        except ValueError:
+            return None
+        return std_no if std_no in students else None
+    candidates = {int(token) for token in re.findall(r'\d+', str(fields.get('reference') or ''))}
+    candidates &= students.keys()
+    return candidates.pop() if len(candidates) == 1 else None
+
+
+def _existing_receipts(conn, receipts):
+    receipts = list(receipts)
+    if not receipts:
+        return set()
+    rows = conn.execute(f'''
+        SELECT receipt_no FROM fees_payments WHERE receipt_no IN ({', '.join('?' * len(receipts))})
+    ''', receipts)
+    return {row[0] for row in rows}
+
+
+def import_statement(conn, rows, year, term, payment_method=None, dry_run=False):
+    """Match, deduplicate and record the payments of a statement for a term.
+
+    `rows` is an iterator whose first item is the header row. Returns a
+    reconciliation report: payments imported and their total, duplicates
+    skipped, and the unmatched and rejected lines with their reasons.
+    """
+    if payment_method is not None and payment_method not in PAYMENT_METHODS:
+        raise ValueError(f'Unknown payment method: {payment_method}')
+    rows = iter(rows)
+    header = next(rows, None)
+    if header is None:
+        raise ValueError('The statement is empty')
+    columns = [map_statement_header(label) for label in header]
+    for required in ('receipt_no', 'amount_paid'):
+        if required not in columns:
+            raise ValueError(f'The statement has no {required} column')
+    if 'std_no' not in columns and 'reference' not in columns:
+        raise ValueError('The statement has no student number or reference column')
+
+    students = load_students(conn, year, term)
+    report = {
+        'dry_run': dry_run,
+        'imported': 0,
+        'amount': 0.0,
+        'duplicates': 0,
+        'unmatched_count': 0,
+        'unmatched': [],
+        'rejected_count': 0,
+        'rejected': [],
+    }
+    seen = set()
+    chunk = []
+
+    def note(kind, line, fields, reason):
+        report[f'{kind}_count'] += 1
+        if len(report[kind]) < MAX_REPORTED_REJECTIONS:
+            report[kind].append({
+                'line': line, 'receipt_no': fields.get('receipt_no'), 'std_no': fields.get('std_no'),
+                'reference': fields.get('reference'), 'amount': fields.get('amount_paid'), 'reason': reason,
+            })
+
+    def flush():
+        existing = _existing_receipts(conn, (payment[6] for payment in chunk))
+        payments = [payment for payment in chunk if payment[6] not in existing]
+        if payments and not dry_run:
+            with conn:
+                inserted = conn.executemany('''
+                    INSERT OR IGNORE INTO fees_payments
+                        (std_no, class_level, term, year, amount_paid, payment_date, receipt_no, payment_method)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                ''', payments).rowcount
+                if inserted < len(payments):
+                    # Receipts saved since the check above were ignored. The
+                    # insert holds the write lock, so the rows it added are the
+                    # newest ids of the table
+                    recorded = {row[0] for row in conn.execute('''
+                        SELECT receipt_no FROM fees_payments ORDER BY id DESC LIMIT ?
+                    ''', (inserted,))}
+                    payments = [payment for payment in payments if payment[6] in recorded]
+        report['duplicates'] += len(chunk) - len(payments)
+        report['imported'] += len(payments)
+        report['amount'] += sum(payment[4] for payment in payments)
+        chunk.clear()
+
+    for line, values in enumerate(rows, start=2):
+        if not any(value not in (None, '') for value in values):
+            continue
+        fields = {
+            column: value.strip() if isinstance(value, str) else value
+            for column, value in zip(columns, values) if column
+        }
+        receipt_no = str(fields.get('receipt_no') or '').strip()
+        if isinstance(fields.get('receipt_no'), float) and fields['receipt_no'].is_integer():
+            receipt_no = str(int(fields['receipt_no']))
+        if not receipt_no:
+            note('rejected', line, fields, 'no transaction ID')
+            continue
+        try:
+            amount = parse_amount(fields.get('amount_paid'))
+            payment_date = parse_date(fields['payment_date']) if fields.get('payment_date') else date.today().isoformat()
+        except ValueError as e:
+            note('rejected', line, fields, str(e))
+            continue
+        if amount <= 0:
+            note('rejected', line, fields, 'not a credit')
+            continue
+        if receipt_no in seen:
+            report['duplicates'] += 1
+            continue
+        std_no = match_student(fields, students)
+        if std_no is None:
+            note('unmatched', line, fields, 'no student of this term matches')
+            continue
+        seen.add(receipt_no)
+        chunk.append((std_no, students[std_no], term, year, amount, payment_date, receipt_no, payment_method))
+        if len(chunk) >= CHUNK_SIZE:
+            flush()
+    flush()
+    report['amount'] = round(report['amount'], 2)
+    return report
@@ -0,0 +1,72 @@
+"""Change counters for every (class, stream, year, term) of marks.
+
+Triggers on the S1-S6 tables bump the counter of a stream whenever one of
+its rows is inserted, updated or deleted, whichever code path made the
+write. Every marks save touches the student's class table row (long-format
+saves bump its row_version), so the counter also moves in long storage
+mode. load_data turns the counter into an ETag and answers 304 Not Modified
+without running the marks query while it is unchanged.
+"""
+import sqlite3
+
+from marks_schema import CLASS_TABLES
+
+_BUMP = '''
+    INSERT INTO stream_versions (class_level, stream, year, term, version)
+    VALUES ('{table}', COALESCE({row}.stream, ''), COALESCE({row}.year, 0), COALESCE({row}.term, ''), 1)
+    ON CONFLICT(class_level, stream, year, term) DO UPDATE SET version = version + 1;
+'''
+
+
+def create_version_table(conn):
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS stream_versions (
+            class_level TEXT NOT NULL,
+            stream TEXT NOT NULL,
+            year INTEGER NOT NULL,
+            term TEXT NOT NULL,
+            version INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (class_level, stream, year, term)
+        ) WITHOUT ROWID
+    ''')
+
+
+def create_version_triggers(conn):
+    """(Re)create the triggers bumping stream_versions on the class tables"""
+    for table in CLASS_TABLES:
+        name = table.lower()
+        conn.execute(f'DROP TRIGGER IF EXISTS trg_{name}_version_insert')
+        conn.execute(f'DROP TRIGGER IF EXISTS trg_{name}_version_update')
+        conn.execute(f'DROP TRIGGER IF EXISTS trg_{name}_version_delete')
+        conn.execute(f'''
+            CREATE TRIGGER trg_{name}_version_insert AFTER INSERT ON {table}
+            BEGIN {_BUMP.format(table=table, row='NEW')} END
+        ''')
+        # A row moved to another stream or term changes both streams
+        conn.execute(f'''
+            CREATE TRIGGER trg_{name}_version_update AFTER UPDATE ON {table}
+            BEGIN
+                {_BUMP.format(table=table, row='NEW')}
+                INSERT INTO stream_versions (class_level, stream, year, term, version)
+                SELECT '{table}', COALESCE(OLD.stream, ''), COALESCE(OLD.year, 0), COALESCE(OLD.term, ''), 1
+                WHERE OLD.stream IS NOT NEW.stream OR OLD.year IS NOT NEW.year OR OLD.term IS NOT NEW.term
+                ON CONFLICT(class_level, stream, year, term) DO UPDATE SET version = version + 1;
+            END
+        ''')
+        conn.execute(f'''
+            CREATE TRIGGER trg_{name}_version_delete AFTER DELETE ON {table}
+            BEGIN {_BUMP.format(table=table, row='OLD')} END
+        ''')
+
+
+def stream_version(conn, class_level, stream, year, term):
+    """Current change counter of a stream's marks, 0 if never written"""
+    try:
+        row = conn.execute('''
+            SELECT version FROM stream_versions
+            WHERE class_level = ? AND stream = ? AND year = ? AND term = ?
+        ''', (class_level, stream or '', year or 0, term or '')).fetchone()
+    except sqlite3.OperationalError:
+        # Database not migrated yet: no counter, so never answer 304
+        return None
+    return row[0] if row else 0
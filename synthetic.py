@@ -0,0 +1,255 @@
+"""Synthetic school data at production scale, for benchmarks and load tests.
+
+generate() fills a migrated database with a configurable number of
+students per year over several years and terms: every class table row
+with CA and exam marks in a realistic subject mix, streams, teachers, the
+fees structure and payments, books and loans, contacts and an open marks
+entry deadline. Students move up one class a year, so a student number
+keeps its history across years the way promote() leaves it.
+
+Rows are written with executemany, one transaction per class, year and
+term; the rankings, fee balances and library counters are rebuilt once at
+the end. The same seed always produces the same data.
+"""
+import hashlib
+import random
+from datetime import date, timedelta
+
+from bursary import PAYMENT_METHODS, rebuild_balances
+from library import recount_stats
+from marks_long import LONG, clear_wide_marks, copy_wide_to_long, marks_storage
+from marks_schema import CA_COMPONENTS, CLASS_TABLES, EXAM_SETS, IDENTITY_COLUMNS, SUBJECT_CODES
+from marks_store import upsert_sql
+from rankings import rebuild_rows
+
+TERMS = ('I', 'II', 'III')
+
+STREAMS = ('A', 'B', 'C', 'D')
+
+# Subjects every O-level student takes, plus a few electives each
+CORE_SUBJECTS = ('eng', 'mtc', 'bio', 'phy', 'che', 'geo', 'his')
+ELECTIVES = tuple(code for code in SUBJECT_CODES if code not in CORE_SUBJECTS)
+ELECTIVES_PER_STUDENT = 3
+
+# A-level students (S5, S6) take this many principal subjects
+A_LEVEL_SUBJECTS = 4
+
+TERM_FEES = {'S1': 950000, 'S2': 950000, 'S3': 1000000, 'S4': 1100000, 'S5': 1200000, 'S6': 1250000}
+
+# Login of every generated teacher (teacher1, teacher2, ...) and of the admin
+TEACHER_PASSWORD = 'teacher123'
+ADMIN_PASSWORD = 'admin123'
+
+_FIRST_NAMES = (
+    'Okello', 'Nakato', 'Mukasa', 'Achieng', 'Opio', 'Namubiru', 'Kato', 'Atim', 'Ssemanda',
+    'Nabirye', 'Odongo', 'Akello', 'Wasswa', 'Babirye', 'Mugisha', 'Auma', 'Tumusiime', 'Nansubuga',
+)
+_LAST_NAMES = (
+    'Moses', 'Grace', 'Joseph', 'Sarah', 'Peter', 'Ruth', 'David', 'Esther', 'Brian',
+    'Mercy', 'Allan', 'Prossy', 'Ivan', 'Doreen', 'Samuel', 'Joan', 'Collins', 'Patience',
+)
+
+_BOOK_CATEGORIES = ('Textbook', 'Novel', 'Reference', 'Science', 'History', 'Languages')
+
+
+def _hash_password(password):
+    # Same scheme as app.hash_password
+    return hashlib.sha256(password.encode()).hexdigest()
+
+
+def check_empty(conn):
+    """Raise ValueError if the class tables already hold students"""
+    for table in CLASS_TABLES:
+        if conn.execute(f'SELECT 1 FROM {table} LIMIT 1').fetchone():
+            raise ValueError(f'{table} already has students; generate into an empty database')
+
+
+def _student_subjects(rng, class_level):
+    if class_level in ('S5', 'S6'):
+        return rng.sample(SUBJECT_CODES[:12], A_LEVEL_SUBJECTS)
+    return list(CORE_SUBJECTS) + rng.sample(ELECTIVES, ELECTIVES_PER_STUDENT)
+
+
+def _marks(rng, ability, subjects, columns):
+    """Mark values of the `columns` for one student-term"""
+    scores = dict.fromkeys(columns)
+    for code in subjects:
+        level = min(max(rng.gauss(ability, 10), 5), 99)
+        for component in CA_COMPONENTS:
+            scores[code + component] = round(min(max(rng.gauss(level, 8) / 100 * 3, 0.5), 3.0), 1)
+        for component in EXAM_SETS:
+            scores[code + component] = round(min(max(rng.gauss(level, 6), 0), 100))
+    return [scores[column] for column in columns]
+
+
+def _students(per_class, class_index, year, first_year):
+    """(std_no, name, gender, section, stream, ability) of one class in a year.
+
+    The cohort that entered S1 in a given year keeps the same student
+    numbers as it moves up, so std_no = cohort * 100000 + place.
+    """
+    cohort = year - class_index - first_year + len(CLASS_TABLES)
+    students = []
+    for place in range(1, per_class + 1):
+        student_rng = random.Random(cohort * 100003 + place)
+        students.append((
+            cohort * 100000 + place,
+            f'{student_rng.choice(_FIRST_NAMES)} {student_rng.choice(_LAST_NAMES)}'.upper(),
+            student_rng.choice(('M', 'F')),
+            student_rng.choice(('Day', 'Boarding')),
+            STREAMS[place % len(STREAMS)],
+            student_rng.gauss(60, 12),
+        ))
+    return students
+
+
+def _write_class_term(conn, rng, class_level, year, term, students, columns):
+    rows = []
+    for std_no, name, gender, section, stream, ability in students:
+        subjects = _student_subjects(random.Random(std_no), class_level)
+        identity = [std_no, name, class_level, stream, year, term, gender, section]
+        rows.append(identity + _marks(rng, ability, subjects, columns))
+    conn.executemany(upsert_sql(class_level, IDENTITY_COLUMNS + columns), rows)
+    return len(rows)
+
+
+def _write_payments(conn, rng, year, term, class_level, students, receipt):
+    fees = TERM_FEES[class_level]
+    start = date(year, {'I': 2, 'II': 5, 'III': 9}[term], 1)
+    payments = []
+    for std_no, *_ in students:
+        remaining = fees * rng.choice((1, 1, 1, 0.8, 0.5, 0.3))
+        for _ in range(rng.randint(1, 3)):
+            amount = round(remaining / rng.choice((1, 2)), -3)
+            if amount <= 0:
+                break
+            receipt += 1
+            payments.append((
+                std_no, class_level, term, year, amount,
+                (start + timedelta(days=rng.randint(0, 60))).isoformat(),
+                f'RCT{receipt:08d}', rng.choice(PAYMENT_METHODS),
+            ))
+            remaining -= amount
+    conn.executemany('''
+        INSERT INTO fees_payments
+            (std_no, class_level, term, year, amount_paid, payment_date, receipt_no, payment_method)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+    ''', payments)
+    return receipt, len(payments)
+
+
+def _write_reference(conn, teachers):
+    conn.execute('''
+        INSERT INTO admin_settings (school_name, school_email, school_motto, school_box, school_contacts)
+        VALUES ('Synthetic High School', 'info@synthetic.school', 'Knowledge is power',
+                'P.O. Box 123, Kampala', '0700 000000')
+    ''')
+    conn.executemany('INSERT INTO streams (class_level, stream_name) VALUES (?, ?)',
+                     [(class_level, stream) for class_level in CLASS_TABLES for stream in STREAMS])
+    conn.execute('''
+        INSERT INTO users (user_id, full_name, email, role, password, is_active) VALUES (?, ?, ?, ?, ?, 1)
+        ON CONFLICT(user_id) DO UPDATE SET password = excluded.password, is_active = 1
+    ''', ('admin', 'System Administrator', 'admin@school.com', 'admin', _hash_password(ADMIN_PASSWORD)))
+    password = _hash_password(TEACHER_PASSWORD)
+    conn.executemany('''
+        INSERT INTO users (user_id, full_name, email, role, subjects_taught, classes_taught, password, is_active)
+        VALUES (?, ?, ?, 'teacher', ?, ?, ?, 1)
+        ON CONFLICT(user_id) DO UPDATE SET password = excluded.password, is_active = 1
+    ''', [
+        (f'teacher{n}', f'Teacher {n}', f'teacher{n}@school.com',
+         SUBJECT_CODES[(n - 1) % 12].upper(), CLASS_TABLES[(n - 1) % len(CLASS_TABLES)], password)
+        for n in range(1, teachers + 1)
+    ])
+
+
+def _write_library(conn, rng, books, students, today):
+    conn.executemany('''
+        INSERT INTO books (book_title, author, isbn, category, total_copies, available_copies)
+        VALUES (?, ?, ?, ?, ?, ?)
+    ''', [
+        (f'Book {n}', f'{rng.choice(_FIRST_NAMES)} {rng.choice(_LAST_NAMES)}', f'978{n:010d}',
+         rng.choice(_BOOK_CATEGORIES), copies, copies)
+        for n, copies in ((n, rng.randint(2, 20)) for n in range(1, books + 1))
+    ])
+    loans = []
+    for std_no, class_level in students:
+        for _ in range(rng.choice((0, 0, 1, 1, 2))):
+            borrowed = today - timedelta(days=rng.randint(1, 120))
+            due = borrowed + timedelta(days=14)
+            if due >= today:
+                status, returned = 'borrowed', None
+            elif rng.random() < 0.85:
+                status, returned = 'returned', (due - timedelta(days=rng.randint(0, 10))).isoformat()
+            else:
+                status, returned = 'overdue', None
+            loans.append((rng.randint(1, books), std_no, class_level, borrowed.isoformat(),
+                          due.isoformat(), returned, status))
+    conn.executemany('''
+        INSERT INTO book_borrowing
+            (book_id, std_no, class_level, borrow_date, return_date, actual_return_date, status)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+    ''', loans)
+    # Open loans take copies; books lent out more often than they have copies stay at 0
+    conn.execute('''
+        UPDATE books SET available_copies = MAX(total_copies - (
+            SELECT COUNT(*) FROM book_borrowing
+            WHERE book_id = books.id AND status IN ('borrowed', 'overdue')
+        ), 0)
+    ''')
+    return len(loans)
+
+
+def generate(conn, students=2000, years=5, terms=TERMS, last_year=None, teachers=24,
+             books=500, seed=1, progress=print):
+    """Fill an empty, migrated database and return the row counts written.
+
+    `students` is the number of students per year, spread evenly over
+    S1-S6; `years` years ending with last_year (default this year) are
+    generated for every term in `terms`.
+    """
+    check_empty(conn)
+    rng = random.Random(seed)
+    last_year = last_year or date.today().year
+    first_year = last_year - years + 1
+    per_class = max(students // len(CLASS_TABLES), 1)
+    columns = tuple(code + component for code in SUBJECT_CODES for component in CA_COMPONENTS + EXAM_SETS)
+    counts = {'students': 0, 'payments': 0, 'loans': 0}
+
+    with conn:
+        _write_reference(conn, teachers)
+        conn.execute('''
+            INSERT INTO deadlines (term, year, deadline_date, is_active) VALUES (?, ?, ?, 1)
+        ''', (terms[-1], last_year, (date.today() + timedelta(days=30)).isoformat()))
+        conn.executemany('''
+            INSERT INTO fees_structure (class_level, term, amount, year) VALUES (?, ?, ?, ?)
+        ''', [(class_level, term, TERM_FEES[class_level], year)
+              for year in range(first_year, last_year + 1) for term in terms for class_level in CLASS_TABLES])
+
+    receipt = 0
+    for year in range(first_year, last_year + 1):
+        for index, class_level in enumerate(CLASS_TABLES):
+            cohort = _students(per_class, index, year, first_year)
+            for term in terms:
+                with conn:
+                    counts['students'] += _write_class_term(conn, rng, class_level, year, term, cohort, columns)
+                    receipt, paid = _write_payments(conn, rng, year, term, class_level, cohort, receipt)
+                    counts['payments'] += paid
+        progress(f'{year}: {per_class * len(CLASS_TABLES)} students x {len(terms)} terms')
+
+    latest = [(student[0], class_level) for index, class_level in enumerate(CLASS_TABLES)
+              for student in _students(per_class, index, last_year, first_year)]
+    with conn:
+        counts['loans'] = _write_library(conn, rng, books, latest, date.today())
+        conn.executemany('''
+            INSERT INTO student_contacts (std_no, class_level, mother_contact, father_contact) VALUES (?, ?, ?, ?)
+        ''', [(std_no, class_level, f'07{rng.randint(0, 99999999):08d}', f'07{rng.randint(0, 99999999):08d}')
+              for std_no, class_level in latest])
+        if marks_storage(conn) == LONG:
+            for class_level in CLASS_TABLES:
+                copy_wide_to_long(conn, class_level)
+                clear_wide_marks(conn, class_level)
+        progress('Ranking students...')
+        rebuild_rows(conn)
+        rebuild_balances(conn)
+        recount_stats(conn)
+    return counts
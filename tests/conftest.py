@@ -0,0 +1,55 @@
+import pytest
+
+from database import connect
+from scripts.create_database import create_database
+
+
+@pytest.fixture
+def db_path(tmp_path, monkeypatch):
+    """A freshly created and migrated school database"""
+    # create_database.py writes school_management.db in the working directory
+    monkeypatch.chdir(tmp_path)
+    create_database()
+    return str(tmp_path / 'school_management.db')
+
+
+@pytest.fixture
+def conn(db_path):
+    conn = connect(db_path)
+    yield conn
+    conn.close()
+
+
+@pytest.fixture
+def app(db_path, monkeypatch):
+    """The Flask app serving the test database"""
+    import database
+    import reference_cache
+    monkeypatch.setattr(database, 'DATABASE', db_path)
+    database.clear_pools()
+    reference_cache.clear()
+    # Imported here so its startup migration runs against the test database
+    from app import app
+    app.config['TESTING'] = True
+    yield app
+    database.clear_pools()
+    reference_cache.clear()
+
+
+@pytest.fixture
+def login(app, conn):
+    """Create an account and log a test client in with it"""
+    from app import hash_password
+
+    def login(role='admin', subjects_taught=None, user_id=None):
+        user_id = user_id or f'{role}1'
+        with conn:
+            conn.execute('''
+                INSERT INTO users (user_id, full_name, email, role, subjects_taught, password, is_active)
+                VALUES (?, ?, ?, ?, ?, ?, 1)
+                ON CONFLICT(user_id) DO UPDATE SET role = excluded.role, subjects_taught = excluded.subjects_taught
+            ''', (user_id, user_id.title(), f'{user_id}@school.com', role, subjects_taught, hash_password('secret')))
+        client = app.test_client()
+        assert client.post('/login', data={'user_id': user_id, 'password': 'secret'}).status_code == 302
+        return client
+    return login
@@ -0,0 +1,69 @@
+import analytics
+from marks_store import save_students
+
+
+def student(std_no, stream='A', gender='M', **marks):
+    return {'std_no': std_no, 'sdt_name': f'STUDENT {std_no}', 'stream': stream, 'gender': gender,
+            'year': 2025, 'term': 'I', **marks}
+
+
+def grading(conn):
+    return [dict(band) for band in conn.execute('SELECT min_score, grade FROM grading_system')]
+
+
+def refreshed_at(conn):
+    return conn.execute('''
+        SELECT marks_version, refreshed_at FROM analytics_state
+        WHERE class_level = 'S1' AND year = 2025 AND term = 'I'
+    ''').fetchone()
+
+
+def english(rows, stream=analytics.WHOLE_CLASS):
+    return next(row for row in rows if row['exam_set'] == 'EOT' and row['stream'] == stream
+                and row['subject'] == 'eng')
+
+
+def test_a_save_makes_the_analytics_stale_until_refreshed(conn):
+    save_students(conn, 'S1', [student(1, engEOT=80), student(2, 'B', 'F', engEOT=40)])
+    assert analytics.needs_refresh(conn, 'S1', 2025, 'I')
+
+    with conn:
+        analytics.refresh(conn, 'S1', 2025, 'I', grading(conn))
+    assert not analytics.needs_refresh(conn, 'S1', 2025, 'I')
+    assert english(analytics.subject_analytics(conn, 'S1', 2025, 'I'))['students'] == 2
+
+    save_students(conn, 'S1', [student(3, engEOT=60)])
+    assert analytics.needs_refresh(conn, 'S1', 2025, 'I')
+
+
+def test_aggregates_per_stream_and_gender(conn):
+    save_students(conn, 'S1', [student(1, engEOT=80), student(2, engEOT=60), student(3, 'B', 'F', engEOT=40)])
+    with conn:
+        analytics.refresh(conn, 'S1', 2025, 'I', grading(conn))
+
+    rows = analytics.subject_analytics(conn, 'S1', 2025, 'I')
+    whole, stream_a, stream_b = english(rows), english(rows, 'A'), english(rows, 'B')
+    assert (whole['students'], stream_a['students'], stream_b['students']) == (3, 2, 1)
+    assert stream_b['mean'] < whole['mean'] < stream_a['mean']
+    assert whole['male_students'] == 2
+    assert (whole['male_mean'], whole['female_mean']) == (stream_a['mean'], stream_b['mean'])
+    assert sum(whole['grades'].values()) == 3
+
+
+def test_route_recomputes_a_stale_term_once_and_then_serves_the_cache(login, conn):
+    client = login('admin')
+    query = '/api/analytics?class=S1&year=2025&term=I'
+    save_students(conn, 'S1', [student(1, engEOT=80)])
+
+    first = client.get(query).get_json()
+    state = refreshed_at(conn)
+    assert english(first)['students'] == 1
+
+    conn.execute("UPDATE analytics_state SET refreshed_at = '2000-01-01'")
+    conn.commit()
+    assert client.get(query).get_json() == first
+    assert refreshed_at(conn)[1] == '2000-01-01'
+
+    save_students(conn, 'S1', [student(2, engEOT=40)])
+    assert english(client.get(query).get_json())['students'] == 2
+    assert refreshed_at(conn)[0] > state[0]
@@ -0,0 +1,90 @@
+from marks_store import save_students
+
+
+def enrol(conn):
+    save_students(conn, 'S1', [{'std_no': 101, 'sdt_name': 'OKELLO MOSES', 'stream': 'A', 'year': 2025,
+                                'term': 'I', 'engBOT': 50, 'mtcBOT': 60}])
+
+
+def marks(conn):
+    return tuple(conn.execute("SELECT engBOT, mtcBOT FROM S1 WHERE std_no = 101").fetchone())
+
+
+def test_teacher_save_data_cannot_change_other_subjects(conn, login):
+    enrol(conn)
+    client = login('teacher', 'ENG1')
+
+    result = client.post('/api/save_data', json={'class': 'S1', 'students': [
+        {'std_no': 101, 'sdt_name': 'OKELLO MOSES', 'stream': 'A', 'year': 2025, 'term': 'I',
+         'engBOT': 70, 'mtcBOT': 5},
+    ]}).get_json()
+
+    assert result['success']
+    assert marks(conn) == (70, 60)
+
+
+def test_teacher_with_unknown_subjects_may_edit_none(conn, login):
+    enrol(conn)
+    client = login('teacher', 'English, Physics')
+
+    result = client.post('/api/save_cells', json={'class': 'S1', 'year': 2025, 'term': 'I', 'cells': [
+        {'std_no': 101, 'column': 'mtcBOT', 'value': 5},
+    ]}).get_json()
+    assert not result['success']
+    client.post('/api/save_data', json={'class': 'S1', 'students': [
+        {'std_no': 101, 'year': 2025, 'term': 'I', 'engBOT': 1, 'mtcBOT': 5},
+    ]})
+    assert marks(conn) == (50, 60)
+
+    rows = client.get('/api/load_data', query_string={'class': 'S1', 'stream': 'A', 'year': 2025, 'term': 'I'}).get_json()
+    assert 'engBOT' not in rows[0] and 'mtcBOT' not in rows[0]
+
+
+def test_admin_save_data_writes_every_subject(conn, login):
+    enrol(conn)
+    client = login('admin')
+
+    client.post('/api/save_data', json={'class': 'S1', 'students': [
+        {'std_no': 101, 'year': 2025, 'term': 'I', 'engBOT': 70, 'mtcBOT': 75},
+    ]})
+
+    assert marks(conn) == (70, 75)
+
+
+def test_new_account_with_unknown_subjects_is_refused(conn, login):
+    client = login('admin')
+
+    result = client.post('/add_user', data={'full_name': 'New Teacher', 'email': 'new@school.com', 'phone': '',
+                                            'role': 'teacher', 'subjects_taught': 'MATH, English'}).get_json()
+
+    assert not result['success']
+    assert 'English' in result['error']
+    assert conn.execute("SELECT COUNT(*) FROM users WHERE full_name = 'New Teacher'").fetchone()[0] == 0
+
+
+def settings_version(conn):
+    row = conn.execute("SELECT value FROM app_meta WHERE key = 'version:admin_settings'").fetchone()
+    return int(row[0]) if row else 0
+
+
+def test_settings_are_saved_with_their_cache_version(conn, login):
+    client = login('admin')
+    saved = conn.execute('SELECT COUNT(*) FROM admin_settings').fetchone()[0]
+    version = settings_version(conn)
+    with conn:
+        for event in ('INSERT', 'UPDATE'):
+            conn.execute(f'''
+                CREATE TRIGGER fail_version_{event.lower()} BEFORE {event} ON app_meta
+                BEGIN SELECT RAISE(ABORT, 'app_meta is read-only'); END
+            ''')
+
+    response = client.post('/admin/settings', data={'school_name': 'Mbale High'})
+    assert response.status_code == 500
+    assert conn.execute('SELECT COUNT(*) FROM admin_settings').fetchone()[0] == saved
+
+    with conn:
+        conn.execute('DROP TRIGGER fail_version_insert')
+        conn.execute('DROP TRIGGER fail_version_update')
+    assert client.post('/admin/settings', data={'school_name': 'Mbale High'}).get_json()['success']
+    assert conn.execute('SELECT COUNT(*) FROM admin_settings').fetchone()[0] == saved + 1
+    assert settings_version(conn) == version + 1
@@ -0,0 +1,69 @@
+import os
+import sqlite3
+
+import pytest
+
+from archive import archive_dir, archive_year, is_archived, year_source
+from marks_store import load_stream, save_cells, save_students
+
+
+def enrol(conn, year, mark):
+    save_students(conn, 'S1', [
+        {'std_no': std_no, 'sdt_name': f'STUDENT {std_no}', 'stream': 'A', 'year': year, 'term': 'I',
+         'mtcBOT': mark}
+        for std_no in (101, 102)
+    ])
+
+
+@pytest.fixture
+def archived(conn):
+    enrol(conn, 2024, 40)
+    enrol(conn, 2025, 70)
+    moved = archive_year(conn, 2024)
+    return conn, moved
+
+
+def test_year_moves_to_its_archive_file(archived):
+    conn, moved = archived
+
+    assert moved['S1'] == 2 and moved['S2'] == 0
+    assert os.path.exists(os.path.join(archive_dir(conn), 'school_2024.db'))
+    assert conn.execute('SELECT COUNT(*) FROM S1 WHERE year = 2024').fetchone()[0] == 0
+    assert conn.execute('SELECT COUNT(*) FROM S1 WHERE year = 2025').fetchone()[0] == 2
+    assert is_archived(conn, 2024) and not is_archived(conn, 2025)
+
+
+def test_archived_year_is_read_back_from_the_archive(archived):
+    conn, _ = archived
+
+    assert year_source(conn, 'S1', 2024) == 'archive_2024.S1'
+    assert year_source(conn, 'S1', 2025) == 'S1'
+    students = load_stream(conn, 'S1', 'A', 2024, 'I', ('mtcBOT',))
+    assert [(student['std_no'], student['mtcBOT']) for student in students] == [(101, 40), (102, 40)]
+
+
+def test_writes_to_an_archived_year_are_refused(archived):
+    conn, _ = archived
+
+    with pytest.raises(ValueError):
+        enrol(conn, 2024, 99)
+    with pytest.raises(ValueError):
+        save_cells(conn, 'S1', 2024, 'I', [{'std_no': 101, 'column': 'mtcBOT', 'value': 99}])
+    with pytest.raises(ValueError):
+        archive_year(conn, 2024)
+
+
+def test_open_year_cannot_be_archived(conn):
+    enrol(conn, 2025, 70)
+
+    with pytest.raises(ValueError):
+        archive_year(conn, 2025)
+
+
+def test_unmigrated_database_has_no_archived_years(tmp_path):
+    conn = sqlite3.connect(str(tmp_path / 'empty.db'))
+    try:
+        assert not is_archived(conn, 2024)
+        assert year_source(conn, 'S1', 2024) == 'S1'
+    finally:
+        conn.close()
@@ -0,0 +1,74 @@
+from bursary import rebuild_balances
+from marks_store import save_students
+
+BALANCES = 'SELECT std_no, year, term, class_level, fees_due, paid, balance FROM fee_balances ORDER BY std_no, year, term'
+
+
+def enrol(conn):
+    for class_level, std_nos in (('S1', (101, 102)), ('S2', (201,))):
+        save_students(conn, class_level, [
+            {'std_no': std_no, 'sdt_name': f'STUDENT {std_no}', 'stream': 'A', 'year': 2025, 'term': term}
+            for std_no in std_nos for term in ('I', 'II')
+        ])
+    with conn:
+        conn.executemany('INSERT INTO fees_structure (class_level, term, amount, year) VALUES (?, ?, ?, 2025)',
+                         [('S1', 'I', 900000), ('S1', 'II', 950000), ('S2', 'I', 1000000)])
+        conn.execute('''
+            INSERT INTO fees_payments (std_no, class_level, term, year, amount_paid, receipt_no)
+            VALUES (101, 'S1', 'I', 2025, 400000, 'R1')
+        ''')
+
+
+def balances(conn):
+    return [tuple(row) for row in conn.execute(BALANCES)]
+
+
+def rebuilt(conn):
+    """What rebuild_balances makes of the same data, rolled back afterwards"""
+    conn.execute('SAVEPOINT rebuilt')
+    rebuild_balances(conn)
+    rows = balances(conn)
+    conn.execute('ROLLBACK TO rebuilt')
+    conn.execute('RELEASE rebuilt')
+    return rows
+
+
+def balance(conn, std_no, term='I'):
+    return conn.execute('SELECT fees_due, balance FROM fee_balances WHERE std_no = ? AND term = ?',
+                        (std_no, term)).fetchone()
+
+
+def test_triggers_price_enrolments_and_payments(conn):
+    enrol(conn)
+
+    assert tuple(balance(conn, 101)) == (900000, 500000)
+    assert tuple(balance(conn, 201, 'II')) == (0, 0)
+    assert balances(conn) == rebuilt(conn)
+
+
+def test_deleted_fee_line_reprices_its_class(conn):
+    enrol(conn)
+    with conn:
+        conn.execute("DELETE FROM fees_structure WHERE class_level = 'S1' AND term = 'I'")
+
+    assert tuple(balance(conn, 101)) == (0, -400000)
+    assert balances(conn) == rebuilt(conn)
+
+
+def test_moved_fee_line_reprices_both_classes(conn):
+    enrol(conn)
+    with conn:
+        conn.execute("UPDATE fees_structure SET class_level = 'S2', term = 'II' WHERE class_level = 'S1' AND term = 'I'")
+
+    assert tuple(balance(conn, 102)) == (0, 0)
+    assert tuple(balance(conn, 201, 'II')) == (900000, 900000)
+    assert balances(conn) == rebuilt(conn)
+
+
+def test_changed_amount_reprices_the_class(conn):
+    enrol(conn)
+    with conn:
+        conn.execute("UPDATE fees_structure SET amount = 1000000 WHERE class_level = 'S1' AND term = 'I'")
+
+    assert tuple(balance(conn, 101)) == (1000000, 600000)
+    assert balances(conn) == rebuilt(conn)
@@ -0,0 +1,95 @@
+import math
+
+import numpy as np
+import pytest
+
+from grading import CA_MAX_SCORE, CA_WEIGHT, EXAM_WEIGHT, GradeScale, compute_results
+from marks_schema import CA_COMPONENTS, MARK_COLUMNS
+
+GRADING = [
+    {'min_score': 80, 'max_score': 100, 'grade': 'A'},
+    {'min_score': 70, 'max_score': 79, 'grade': 'B'},
+    {'min_score': 60, 'max_score': 69, 'grade': 'C'},
+    {'min_score': 50, 'max_score': 59, 'grade': 'D'},
+    {'min_score': 0, 'max_score': 49, 'grade': 'E'},
+]
+
+# Every cut-off, either side of it, the ends of the scale and blanks
+SCORES = sorted({
+    value for band in GRADING
+    for value in (band['min_score'] - 0.5, band['min_score'] - 0.01, band['min_score'], band['min_score'] + 0.01)
+} | {49.99, 100, 101, -1}) + [math.nan]
+
+
+def grade_of(score, grading=GRADING):
+    """One mark at a time: the highest band whose minimum the score reaches"""
+    if score is None or math.isnan(score):
+        return None
+    for band in sorted(grading, key=lambda band: band['min_score'], reverse=True):
+        if score >= band['min_score']:
+            return band['grade']
+    return None
+
+
+def subject_of(ca, exam, report_type):
+    """Total and grade of one subject computed mark by mark"""
+    entered = [mark for mark in ca if mark is not None]
+    ca_average = sum(entered) / len(entered) if entered else None
+    if report_type != 'EOT':
+        total = exam
+    elif exam is None:
+        total = None
+    else:
+        total = (ca_average / CA_MAX_SCORE * CA_WEIGHT if ca_average is not None else 0) + exam * EXAM_WEIGHT / 100
+    return (None if total is None else round(total)), grade_of(math.nan if total is None else total)
+
+
+def student(std_no, **marks):
+    return {'std_no': std_no, **dict.fromkeys(MARK_COLUMNS), **marks}
+
+
+def test_lookup_matches_the_per_mark_grade_at_every_boundary():
+    grades = GradeScale(GRADING).lookup(np.array(SCORES, dtype=float))
+    assert list(grades) == [grade_of(score) for score in SCORES]
+
+
+def test_lookup_does_not_depend_on_the_order_of_the_grading_rows():
+    scores = np.array(SCORES, dtype=float)
+    assert list(GradeScale(GRADING[::-1]).lookup(scores)) == list(GradeScale(GRADING).lookup(scores))
+
+
+def test_lookup_keeps_the_shape_of_a_stream():
+    scores = np.array([[79.99, math.nan], [80, 0]])
+    assert GradeScale(GRADING).lookup(scores).tolist() == [['B', None], ['A', 'E']]
+
+
+def test_pass_mark_is_the_bottom_of_the_second_band():
+    assert GradeScale(GRADING).pass_mark == 50
+
+
+@pytest.mark.parametrize('report_type', ['BOT', 'MOT', 'EOT'])
+def test_compute_results_matches_the_per_mark_implementation(report_type):
+    ca_sets = [(None,) * 4, (3, None, None, None), (1, 2, None, 3), (0, 0, 0, 0), (3, 3, 3, 3)]
+    exams = [score for score in SCORES if not math.isnan(score) and 0 <= score <= 100] + [None]
+    students = []
+    for i, (ca, exam) in enumerate((ca, exam) for ca in ca_sets for exam in exams):
+        marks = {f'eng{component}': mark for component, mark in zip(CA_COMPONENTS, ca)}
+        marks[f'eng{report_type}'] = exam
+        students.append(student(i, **marks))
+
+    results = compute_results(students, GRADING, report_type)
+    for result, marks in zip(results, students):
+        ca = [marks[f'eng{component}'] for component in CA_COMPONENTS]
+        exam = marks[f'eng{report_type}']
+        if all(mark is None for mark in ca) and exam is None:
+            assert result['subjects'] == []
+            continue
+        [subject] = result['subjects']
+        assert (subject['total'], subject['grade']) == subject_of(ca, exam, report_type), marks
+
+
+def test_subjects_without_marks_are_left_out():
+    [result] = compute_results([student(1, mtcEOT=65)], GRADING, 'EOT')
+    assert [subject['subject'] for subject in result['subjects']] == ['mtc']
+    assert result['subjects'][0]['grade'] == 'D'
+    assert result['average'] == result['total'] == 52.0
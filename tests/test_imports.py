@@ -0,0 +1,99 @@
+import io
+
+import pytest
+
+from imports import import_students, map_header, read_rows
+
+
+def csv_rows(text):
+    return read_rows(io.BytesIO(text.encode()), 'marks.csv')
+
+
+def stored(conn, std_no):
+    return conn.execute("SELECT * FROM S2 WHERE std_no = ? AND year = 2025 AND term = 'I'", (std_no,)).fetchone()
+
+
+FULL_FILE = (
+    'std_no,Student Name,stream,year,term,Sex,section,MATH BOT,engBOT\n'
+    '201,NAKATO GRACE,A,2025,I,F,Boarding,64,70\n'
+    '202,OPIO PETER,A,2025,I,M,Day,51,48\n'
+)
+
+
+def test_partial_reimport_keeps_gender_and_section(conn):
+    import_students(conn, csv_rows(FULL_FILE), 'S2')
+    report = import_students(conn, csv_rows('std_no,sdt_name,MATH BOT\n201,NAKATO GRACE,80\n'), 'S2',
+                             defaults={'stream': 'A', 'year': 2025, 'term': 'I'})
+
+    assert report['imported'] == 1
+    row = stored(conn, 201)
+    assert (row['gender'], row['section']) == ('F', 'Boarding')
+    assert (row['mtcBOT'], row['engBOT']) == (80, 70)
+
+
+def test_blank_identity_cell_keeps_stored_value(conn):
+    import_students(conn, csv_rows(FULL_FILE), 'S2')
+    import_students(conn, csv_rows(
+        'std_no,sdt_name,stream,year,term,gender,section\n'
+        '202,OPIO PETER,A,2025,I,,Boarding\n'
+    ), 'S2')
+
+    row = stored(conn, 202)
+    assert (row['gender'], row['section']) == ('M', 'Boarding')
+
+
+def test_invalid_rows_are_rejected_and_reported(conn):
+    report = import_students(conn, csv_rows(
+        'std_no,sdt_name,stream,year,term,gender,MATH BOT\n'
+        '203,ATIM RUTH,A,2025,I,F,101\n'
+        ',NO NUMBER,A,2025,I,F,50\n'
+        '204,KATO DAVID,A,2025,I,X,50\n'
+        '205,AUMA JOAN,A,2025,I,F,77\n'
+        '205,AUMA JOAN,A,2025,I,F,78\n'
+    ), 'S2')
+
+    assert report['imported'] == 1
+    assert report['rejected_count'] == 4
+    assert [rejected['line'] for rejected in report['rejected']] == [2, 3, 4, 6]
+    assert stored(conn, 205)['mtcBOT'] == 77
+    assert stored(conn, 203) is None
+
+
+def test_dry_run_writes_nothing(conn):
+    report = import_students(conn, csv_rows(FULL_FILE), 'S2', dry_run=True)
+
+    assert report['imported'] == 2
+    assert stored(conn, 201) is None
+
+
+def test_file_without_student_numbers_is_refused(conn):
+    with pytest.raises(ValueError):
+        import_students(conn, csv_rows('sdt_name,MATH BOT\nNAKATO GRACE,80\n'), 'S2')
+
+
+def test_header_mapping():
+    assert map_header('Student Name') == 'sdt_name'
+    assert map_header('MATH BOT') == 'mtcBOT'
+    assert map_header('ENG1 1') == 'eng1'
+    assert map_header('Favourite colour') is None
+
+
+def test_existing_students_need_only_their_key(conn):
+    import_students(conn, csv_rows(FULL_FILE), 'S2')
+
+    report = import_students(conn, csv_rows('std_no,year,term,MATH BOT\n202,2025,I,66\n203,2025,I,70\n'), 'S2')
+
+    assert report['imported'] == 1
+    assert [rejected['line'] for rejected in report['rejected']] == [3]
+    assert report['rejected'][0]['errors'] == ['sdt_name is required for a new student',
+                                               'stream is required for a new student']
+    row = stored(conn, 202)
+    assert (row['sdt_name'], row['stream'], row['mtcBOT']) == ('OPIO PETER', 'A', 66)
+
+
+def test_term_is_required_on_every_row(conn):
+    import_students(conn, csv_rows(FULL_FILE), 'S2')
+
+    report = import_students(conn, csv_rows('std_no,year,MATH BOT\n202,2025,66\n'), 'S2')
+
+    assert report['rejected'][0]['errors'] == ['term is required']
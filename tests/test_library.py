@@ -0,0 +1,75 @@
+from datetime import date, timedelta
+
+from library import (
+    FINE_PER_DAY, add_book, has_search_index, issue_book, library_stats, list_books, recount_stats,
+    return_book, update_book, update_overdue,
+)
+
+
+def titles(result):
+    return [book['book_title'] for book in result['books']]
+
+
+def test_search_finds_newly_added_books_by_prefix(conn):
+    assert has_search_index(conn)
+    add_book(conn, {'book_title': 'Mathematics Textbook', 'author': 'Ssekandi', 'total_copies': 3})
+    add_book(conn, {'book_title': 'Oral Literature', 'author': 'Akello', 'category': 'English', 'total_copies': 1})
+
+    assert titles(list_books(conn, 'math text')) == ['Mathematics Textbook']
+    assert titles(list_books(conn, 'akel')) == ['Oral Literature']
+    assert titles(list_books(conn, 'engl')) == ['Oral Literature']
+    assert list_books(conn, 'physics')['total'] == 0
+
+
+def test_search_follows_catalog_edits(conn):
+    book_id = add_book(conn, {'book_title': 'Physics Practicals', 'author': 'Mugisha', 'total_copies': 2})
+    update_book(conn, book_id, {'book_title': 'Chemistry Practicals'})
+
+    assert list_books(conn, 'physics')['total'] == 0
+    assert titles(list_books(conn, 'chem pract')) == ['Chemistry Practicals']
+
+
+def stats(conn):
+    return {key: value for key, value in library_stats(conn).items() if key != 'fines_updated_on'}
+
+
+def recounted(conn):
+    with conn:
+        conn.execute('SAVEPOINT recount')
+        recount_stats(conn)
+        counted = stats(conn)
+        conn.execute('ROLLBACK TO recount')
+        conn.execute('RELEASE recount')
+    return counted
+
+
+def test_issue_and_return_update_the_stats(conn):
+    book_id = add_book(conn, {'book_title': 'Mathematics Textbook', 'author': 'Ssekandi', 'total_copies': 3})
+    before = stats(conn)
+    assert (before['titles'], before['copies'], before['available_copies']) == (1, 3, 3)
+
+    borrowing_id = issue_book(conn, book_id, 101, 'S1', (date.today() + timedelta(days=7)).isoformat())
+    issued = stats(conn)
+    assert (issued['available_copies'], issued['open_loans']) == (2, 1)
+    assert issued == recounted(conn)
+
+    return_book(conn, borrowing_id, fine_amount=1000)
+    returned = stats(conn)
+    assert (returned['available_copies'], returned['open_loans'], returned['fines_charged']) == (3, 0, 1000)
+    assert returned == recounted(conn)
+
+
+def test_overdue_fines_move_from_outstanding_to_charged_on_return(conn):
+    book_id = add_book(conn, {'book_title': 'Oral Literature', 'author': 'Akello', 'total_copies': 1})
+    borrowing_id = issue_book(conn, book_id, 101, 'S1', date.today().isoformat())
+
+    assert update_overdue(conn, date.today() + timedelta(days=4)) == (1, 1)
+    overdue = stats(conn)
+    assert (overdue['overdue_loans'], overdue['fines_outstanding']) == (1, 4 * FINE_PER_DAY)
+    assert overdue == recounted(conn)
+
+    return_book(conn, borrowing_id, fine_amount=4 * FINE_PER_DAY)
+    returned = stats(conn)
+    assert (returned['overdue_loans'], returned['fines_outstanding'], returned['fines_charged']) == (
+        0, 0, 4 * FINE_PER_DAY)
+    assert returned == recounted(conn)
@@ -0,0 +1,127 @@
+import pytest
+
+from marks_long import LONG
+from marks_store import save_cells, save_students
+from scripts.convert_marks import convert
+
+
+def student(**fields):
+    row = {'std_no': 101, 'sdt_name': 'OKELLO MOSES', 'stream': 'A', 'year': 2025, 'term': 'I',
+           'gender': 'M', 'section': 'Day', 'mtcBOT': 60}
+    row.update(fields)
+    return row
+
+
+def stored(conn, std_no=101):
+    return conn.execute('SELECT * FROM S1 WHERE std_no = ? AND year = 2025 AND term = ?', (std_no, 'I')).fetchone()
+
+
+def test_partial_row_keeps_identity_columns(conn):
+    save_students(conn, 'S1', [student()])
+    save_students(conn, 'S1', [{'std_no': 101, 'year': 2025, 'term': 'I', 'mtcBOT': 75}])
+
+    row = stored(conn)
+    assert (row['sdt_name'], row['stream'], row['gender'], row['section']) == ('OKELLO MOSES', 'A', 'M', 'Day')
+    assert row['mtcBOT'] == 75
+    assert row['class_level'] == 'S1'
+
+
+def test_posted_identity_columns_are_updated(conn):
+    save_students(conn, 'S1', [student()])
+    save_students(conn, 'S1', [student(sdt_name='OKELLO M. JOHN', gender=None)])
+
+    row = stored(conn)
+    assert row['sdt_name'] == 'OKELLO M. JOHN'
+    assert row['gender'] is None
+    assert row['section'] == 'Day'
+
+
+def test_projected_save_keeps_other_subjects(conn):
+    save_students(conn, 'S1', [student(engBOT=55)])
+    save_students(conn, 'S1', [student(mtcBOT=80)])
+
+    row = stored(conn)
+    assert (row['engBOT'], row['mtcBOT']) == (55, 80)
+
+
+def test_rows_with_different_columns_in_one_save(conn):
+    save_students(conn, 'S1', [student(), student(std_no=102, gender='F', section='Boarding')])
+    saved = save_students(conn, 'S1', [
+        {'std_no': 101, 'year': 2025, 'term': 'I', 'mtcBOT': 70},
+        student(std_no=102, section='Day', mtcBOT=65),
+    ])
+
+    assert saved == 2
+    assert stored(conn, 101)['gender'] == 'M'
+    assert (stored(conn, 102)['section'], stored(conn, 102)['mtcBOT']) == ('Day', 65)
+
+
+def test_blank_rows_are_skipped(conn):
+    assert save_students(conn, 'S1', [student(), {'std_no': '', 'mtcBOT': 50}]) == 1
+
+
+def test_partial_row_on_long_format_store(db_path, conn):
+    save_students(conn, 'S1', [student(engBOT=55)])
+    convert(db_path, LONG)
+    save_students(conn, 'S1', [{'std_no': 101, 'year': 2025, 'term': 'I', 'mtcBOT': 75}])
+
+    row = conn.execute('SELECT * FROM S1_wide WHERE std_no = 101').fetchone()
+    assert (row['gender'], row['section']) == ('M', 'Day')
+    assert (row['engBOT'], row['mtcBOT']) == (55, 75)
+
+
+def cell(column='mtcBOT', value=70, **checks):
+    return {'std_no': 101, 'column': column, 'value': value, **checks}
+
+
+def test_save_cells_applies_edits_and_bumps_version(conn):
+    save_students(conn, 'S1', [student()])
+    version = stored(conn)['row_version']
+
+    applied, conflicts = save_cells(conn, 'S1', 2025, 'I', [cell(old=60, version=version), cell('engBOT', 41)])
+
+    assert conflicts == []
+    assert applied == {101: version + 1}
+    row = stored(conn)
+    assert (row['mtcBOT'], row['engBOT'], row['row_version']) == (70, 41, version + 1)
+
+
+def test_save_cells_reports_stale_version(conn):
+    save_students(conn, 'S1', [student()])
+    version = stored(conn)['row_version']
+    save_cells(conn, 'S1', 2025, 'I', [cell('engBOT', 50)])
+
+    applied, conflicts = save_cells(conn, 'S1', 2025, 'I', [cell(version=version)])
+
+    assert applied == {}
+    assert conflicts == [{'std_no': 101, 'column': 'mtcBOT', 'reason': 'conflict',
+                          'current': 60, 'version': version + 1}]
+    assert stored(conn)['mtcBOT'] == 60
+
+
+def test_save_cells_checks_old_value_per_cell(conn):
+    save_students(conn, 'S1', [student(engBOT=55)])
+
+    applied, conflicts = save_cells(conn, 'S1', 2025, 'I', [cell(old=59), cell('engBOT', 65, old=55)])
+
+    assert [(c['column'], c['current']) for c in conflicts] == [('mtcBOT', 60)]
+    row = stored(conn)
+    assert (row['mtcBOT'], row['engBOT']) == (60, 65)
+    assert 101 in applied
+
+
+def test_save_cells_reports_missing_students(conn):
+    applied, conflicts = save_cells(conn, 'S1', 2025, 'I', [cell()])
+
+    assert applied == {}
+    assert conflicts == [{'std_no': 101, 'column': 'mtcBOT', 'reason': 'missing'}]
+
+
+def test_save_cells_refuses_unpermitted_subjects(conn):
+    save_students(conn, 'S1', [student()])
+
+    with pytest.raises(ValueError):
+        save_cells(conn, 'S1', 2025, 'I', [cell()], permitted={'eng'})
+    with pytest.raises(ValueError):
+        save_cells(conn, 'S1', 2025, 'I', [cell('row_version', 1)])
+    assert stored(conn)['mtcBOT'] == 60
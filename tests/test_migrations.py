@@ -0,0 +1,80 @@
+import sqlite3
+
+import pytest
+
+from marks_schema import CLASS_TABLES, class_table_ddl
+from migrations import current_version, latest_version, run_migrations
+
+
+@pytest.fixture
+def bare(tmp_path):
+    conn = sqlite3.connect(str(tmp_path / 'partial.db'))
+    yield conn
+    conn.close()
+
+
+def create_class_tables(conn, tables):
+    for table in tables:
+        conn.execute(class_table_ddl(table))
+    conn.commit()
+
+
+def trigger_exists(conn, name):
+    return conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'trigger' AND name = ?", (name,)).fetchone()
+
+
+def test_migration_waits_for_missing_class_tables(bare):
+    create_class_tables(bare, CLASS_TABLES[:-1])
+
+    with pytest.raises(sqlite3.OperationalError, match='S6'):
+        run_migrations(bare)
+    assert current_version(bare) == 0
+
+
+def test_waiting_migrations_run_once_tables_exist(bare):
+    create_class_tables(bare, CLASS_TABLES[:-1])
+    with pytest.raises(sqlite3.OperationalError):
+        run_migrations(bare)
+
+    create_class_tables(bare, CLASS_TABLES[-1:])
+    with pytest.raises(sqlite3.OperationalError, match='books'):
+        run_migrations(bare)
+
+    # Everything up to the library migrations ran, for every class table
+    assert current_version(bare) == 6
+    assert trigger_exists(bare, 'trg_s6_version_insert')
+    columns = {row[1] for row in bare.execute('PRAGMA table_info(S6)')}
+    assert 'row_version' in columns
+
+
+def test_migrated_database_is_left_alone(conn):
+    assert current_version(conn) == latest_version()
+    assert run_migrations(conn) == []
+    assert current_version(conn) == latest_version()
+
+
+def test_duplicate_rows_are_backed_up_before_removal(bare, tmp_path, caplog):
+    create_class_tables(bare, CLASS_TABLES)
+    bare.executemany("INSERT INTO S1 (std_no, sdt_name, year, term) VALUES (?, ?, 2024, 'I')",
+                     [(5, 'FIRST SAVE'), (5, 'SECOND SAVE'), (6, 'ONLY SAVE')])
+    bare.commit()
+
+    with caplog.at_level('WARNING', logger='migrations'), pytest.raises(sqlite3.OperationalError):
+        run_migrations(bare)
+
+    assert bare.execute('SELECT sdt_name FROM S1 ORDER BY std_no').fetchall() == [('SECOND SAVE',), ('ONLY SAVE',)]
+    assert 'removed row 1 of student 5, 2024 term I' in caplog.text
+    backups = list((tmp_path / 'backups').glob('before-migration-1-*.db'))
+    assert len(backups) == 1
+    backup = sqlite3.connect(str(backups[0]))
+    assert backup.execute('SELECT COUNT(*) FROM S1 WHERE std_no = 5').fetchone()[0] == 2
+    backup.close()
+
+
+def test_clean_database_is_not_backed_up(bare, tmp_path):
+    create_class_tables(bare, CLASS_TABLES)
+
+    with pytest.raises(sqlite3.OperationalError):
+        run_migrations(bare)
+
+    assert not (tmp_path / 'backups').exists()
@@ -0,0 +1,99 @@
+import sqlite3
+
+import pytest
+
+from marks_store import save_students
+from promotion import leave_student, promote, promotion_plan, restore_snapshot
+
+
+def enrol(conn, class_level, std_nos, terms=('I', 'II', 'III')):
+    save_students(conn, class_level, [
+        {'std_no': std_no, 'sdt_name': f'STUDENT {std_no}', 'stream': 'A', 'year': 2025, 'term': term,
+         'gender': 'F', 'section': 'Day', 'mtcEOT': 50 + std_no % 10}
+        for std_no in std_nos for term in terms
+    ])
+
+
+def rows(conn, table, year=2026):
+    return conn.execute(f'SELECT std_no, term, sdt_name FROM {table} WHERE year = ? ORDER BY std_no',
+                        (year,)).fetchall()
+
+
+def count(conn, table):
+    return conn.execute(f'SELECT COUNT(*) FROM {table}').fetchone()[0]
+
+
+@pytest.fixture
+def school(conn):
+    enrol(conn, 'S1', (101, 102, 103))
+    enrol(conn, 'S6', (601, 602))
+    return conn
+
+
+def test_plan_writes_nothing(school):
+    before = [count(school, table) for table in ('S1', 'S2', 'S6', 'LEFT')]
+
+    plan = {entry['class_level']: entry for entry in promotion_plan(school, 2025, repeating=[103])}
+
+    assert (plan['S1']['promoted'], plan['S1']['repeating']) == (2, 1)
+    assert plan['S6']['graduating'] == 2
+    assert [count(school, table) for table in ('S1', 'S2', 'S6', 'LEFT')] == before
+
+
+def test_every_student_moves_exactly_once(school):
+    promote(school, 2025, repeating=[103])
+    promote(school, 2025, repeating=[103])
+
+    assert [tuple(row) for row in rows(school, 'S2')] == [(101, 'I', 'STUDENT 101'), (102, 'I', 'STUDENT 102')]
+    assert [row['std_no'] for row in rows(school, 'S1')] == [103]
+    # Earlier terms stay where they were
+    assert school.execute('SELECT COUNT(*) FROM S1 WHERE year = 2025').fetchone()[0] == 9
+
+
+def test_leavers_are_archived_with_reason(school):
+    plan, _ = promote(school, 2025, reason='Completed S6')
+
+    assert plan[-1]['archived'] == 6
+    assert count(school, 'S6') == 0
+    left = school.execute('SELECT std_no, term, reason, moved_at, mtcEOT FROM LEFT ORDER BY std_no, term').fetchall()
+    assert [(row['std_no'], row['term']) for row in left] == [
+        (601, 'I'), (601, 'II'), (601, 'III'), (602, 'I'), (602, 'II'), (602, 'III')]
+    assert {row['reason'] for row in left} == {'Completed S6'}
+    assert all(row['moved_at'] for row in left)
+    assert left[0]['mtcEOT'] == 51
+
+
+def test_leave_student_archives_one_student(school):
+    assert leave_student(school, 'S1', 102, 'Transferred') == 3
+    assert school.execute('SELECT COUNT(*) FROM S1 WHERE std_no = 102').fetchone()[0] == 0
+    assert school.execute("SELECT COUNT(*) FROM LEFT WHERE std_no = 102 AND reason = 'Transferred'").fetchone()[0] == 3
+    with pytest.raises(LookupError):
+        leave_student(school, 'S1', 102, 'Transferred')
+
+
+def test_restore_snapshot_undoes_a_promotion(school, tmp_path):
+    _, snapshot = promote(school, 2025, snapshot_dir=str(tmp_path / 'backups'))
+    assert count(school, 'LEFT') == 6
+
+    restore_snapshot(school, snapshot)
+
+    assert rows(school, 'S2') == []
+    assert count(school, 'S6') == 6
+    assert count(school, 'LEFT') == 0
+
+
+def test_failure_leaves_the_class_untouched(school):
+    # The second S1 student cannot be inserted into S2
+    school.execute('''
+        CREATE TRIGGER fail_promotion BEFORE INSERT ON S2 WHEN NEW.std_no = 102
+        BEGIN SELECT RAISE(ABORT, 'disk on fire'); END
+    ''')
+
+    with pytest.raises(sqlite3.DatabaseError):
+        promote(school, 2025)
+
+    assert rows(school, 'S2') == []
+    assert rows(school, 'S1') == []
+    assert school.execute('SELECT COUNT(*) FROM S1 WHERE year = 2025').fetchone()[0] == 9
+    # S6 was promoted before the failure and stays promoted
+    assert count(school, 'LEFT') == 6
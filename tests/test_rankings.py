@@ -0,0 +1,75 @@
+from marks_store import save_cells, save_students
+from rankings import rebuild, student_ranking
+
+RANKED = ('std_no', 'stream', 'total', 'average', 'subjects',
+          'stream_position', 'stream_size', 'class_position', 'class_size')
+
+
+def student(std_no, stream='A', **marks):
+    return {'std_no': std_no, 'sdt_name': f'STUDENT {std_no}', 'stream': stream, 'year': 2025, 'term': 'I', **marks}
+
+
+def positions(conn, exam_set='EOT'):
+    rows = conn.execute('''
+        SELECT std_no, stream_position, class_position FROM student_rankings
+        WHERE class_level = 'S5' AND year = 2025 AND term = 'I' AND exam_set = ?
+        ORDER BY std_no
+    ''', (exam_set,)).fetchall()
+    return {row[0]: (row[1], row[2]) for row in rows}
+
+
+def table(conn):
+    return conn.execute(f'''
+        SELECT exam_set, {', '.join(RANKED)} FROM student_rankings ORDER BY exam_set, std_no
+    ''').fetchall()
+
+
+def test_positions_go_by_average_not_total(conn):
+    save_students(conn, 'S5', [
+        student(1, engEOT=50, mtcEOT=50, bioEOT=50),
+        student(2, engEOT=70, mtcEOT=70),
+    ])
+
+    one = student_ranking(conn, 'S5', 2025, 'I', 'EOT', 1)
+    two = student_ranking(conn, 'S5', 2025, 'I', 'EOT', 2)
+    assert one['total'] > two['total']
+    assert (two['class_position'], one['class_position']) == (1, 2)
+
+
+def test_ties_share_a_position_and_unscored_students_are_unranked(conn):
+    save_students(conn, 'S5', [
+        student(1, engEOT=80), student(2, engEOT=60), student(3, engEOT=60),
+        student(4, engEOT=40), student(5, 'B'),
+    ])
+
+    assert positions(conn) == {1: (1, 1), 2: (2, 2), 3: (2, 2), 4: (4, 4), 5: (None, None)}
+    assert student_ranking(conn, 'S5', 2025, 'I', 'EOT', 1)['class_size'] == 4
+
+
+def test_streams_are_ranked_separately(conn):
+    save_students(conn, 'S5', [student(1, engEOT=80), student(2, 'B', engEOT=70), student(3, 'B', engEOT=90)])
+
+    assert positions(conn) == {1: (1, 2), 2: (2, 3), 3: (1, 1)}
+    assert student_ranking(conn, 'S5', 2025, 'I', 'EOT', 2)['stream_size'] == 2
+
+
+def test_saves_rerank_the_class_like_a_rebuild(conn):
+    save_students(conn, 'S5', [student(n, engEOT=40 + n, mtcBOT=n) for n in range(1, 6)])
+    # One student's save moves them past the others
+    save_students(conn, 'S5', [{'std_no': 2, 'year': 2025, 'term': 'I', 'engEOT': 99}])
+    save_cells(conn, 'S5', 2025, 'I', [{'std_no': 4, 'column': 'mtcEOT', 'value': 100}])
+    refreshed = table(conn)
+
+    assert positions(conn)[2] == (1, 1)
+    rebuild(conn)
+    assert table(conn) == refreshed
+
+
+def test_rebuild_of_one_term_leaves_the_others(conn):
+    save_students(conn, 'S5', [student(1, engEOT=50), {**student(1, engEOT=60), 'term': 'II'}])
+    conn.execute("UPDATE student_rankings SET class_position = 9 WHERE term = 'II'")
+
+    assert rebuild(conn, 'S5', 2025, 'I') == 1
+    assert conn.execute("SELECT class_position FROM student_rankings WHERE term = 'II' AND exam_set = 'EOT'").fetchone()[0] == 9
+    rebuild(conn)
+    assert conn.execute("SELECT class_position FROM student_rankings WHERE term = 'II' AND exam_set = 'EOT'").fetchone()[0] == 1
@@ -0,0 +1,26 @@
+import io
+
+from pypdf import PdfReader
+
+import report_pdf
+
+SHARED = {'report_type': 'BOT', 'school': {'school_name': 'Mbale High'}, 'subjects': [], 'grading': []}
+
+
+def student(std_no):
+    return {'std_no': std_no, 'sdt_name': f'STUDENT {std_no}', 'class_level': 'S1', 'stream': 'A',
+            'results': {'subjects': [{'subject': 'eng', 'total': 60, 'grade': 'C'}]}}
+
+
+def test_large_batches_render_in_spawned_workers(monkeypatch):
+    monkeypatch.setattr(report_pdf, 'WORKERS', 2)
+    students = [student(std_no) for std_no in range(1, report_pdf.INLINE_LIMIT + 2)]
+    try:
+        pdf = report_pdf.render_pdf(SHARED, students)
+        assert report_pdf.executor()._mp_context.get_start_method() == 'spawn'
+    finally:
+        if report_pdf._executor is not None:
+            report_pdf._executor.shutdown()
+            report_pdf._executor = None
+
+    assert len(PdfReader(io.BytesIO(pdf)).pages) == len(students)
@@ -0,0 +1,82 @@
+import statements
+from marks_store import save_students
+from statements import import_statement
+
+HEADER = ['Transaction ID', 'Date', 'Narration', 'Amount']
+
+
+def enrol(conn):
+    save_students(conn, 'S1', [
+        {'std_no': std_no, 'sdt_name': name, 'stream': 'A', 'year': 2025, 'term': 'I'}
+        for std_no, name in ((101, 'OKELLO MOSES'), (102, 'NAKATO GRACE'))
+    ])
+
+
+def statement(*lines):
+    return [HEADER, *lines]
+
+
+def paid(conn, std_no):
+    return conn.execute("SELECT paid FROM fee_balances WHERE std_no = ? AND year = 2025 AND term = 'I'",
+                        (std_no,)).fetchone()[0]
+
+
+def test_receipt_repeated_in_statement_is_counted_once(conn):
+    enrol(conn)
+    report = import_statement(conn, statement(
+        ['TX1', '03/02/2025', 'Fees 101', '500,000'],
+        ['TX1', '03/02/2025', 'Fees 101', '500,000'],
+        ['TX2', '04/02/2025', 'School fees std 102', 'UGX 300,000'],
+    ), 2025, 'I')
+
+    assert (report['imported'], report['amount'], report['duplicates']) == (2, 800000, 1)
+    assert conn.execute('SELECT COUNT(*) FROM fees_payments').fetchone()[0] == 2
+    assert paid(conn, 101) == 500000
+
+
+def test_reimport_records_nothing_twice(conn):
+    enrol(conn)
+    lines = statement(['TX1', '03/02/2025', 'Fees 101', '500000'], ['TX2', '04/02/2025', 'Fees 102', '300000'])
+    import_statement(conn, lines, 2025, 'I')
+
+    report = import_statement(conn, lines + [['TX3', '05/02/2025', 'Fees 102', '100000']], 2025, 'I')
+
+    assert (report['imported'], report['amount'], report['duplicates']) == (1, 100000, 2)
+    assert paid(conn, 102) == 400000
+
+
+def test_receipts_recorded_meanwhile_are_not_counted(conn, monkeypatch):
+    enrol(conn)
+    import_statement(conn, statement(['TX1', '03/02/2025', 'Fees 101', '500000']), 2025, 'I')
+    # As if another import recorded TX1 between the duplicate check and the insert
+    monkeypatch.setattr(statements, '_existing_receipts', lambda conn, receipts: set())
+
+    report = import_statement(conn, statement(
+        ['TX1', '03/02/2025', 'Fees 101', '500000'], ['TX2', '04/02/2025', 'Fees 102', '300000'],
+    ), 2025, 'I')
+
+    assert (report['imported'], report['amount'], report['duplicates']) == (1, 300000, 1)
+    assert paid(conn, 101) == 500000
+
+
+def test_unmatched_and_rejected_lines_are_reported(conn):
+    enrol(conn)
+    report = import_statement(conn, statement(
+        ['TX1', '03/02/2025', 'Fees 999', '500000'],
+        ['TX2', '03/02/2025', 'Fees 101 and 102', '500000'],
+        ['', '03/02/2025', 'Fees 101', '500000'],
+        ['TX3', 'yesterday', 'Fees 101', '500000'],
+        ['TX4', '03/02/2025', 'Reversal 101', '-500000'],
+    ), 2025, 'I')
+
+    assert report['imported'] == 0
+    assert [line['line'] for line in report['unmatched']] == [2, 3]
+    assert [line['line'] for line in report['rejected']] == [4, 5, 6]
+
+
+def test_dry_run_records_nothing(conn):
+    enrol(conn)
+    report = import_statement(conn, statement(['TX1', '03/02/2025', 'Fees 101', '500000']), 2025, 'I', dry_run=True)
+
+    assert (report['imported'], report['amount']) == (1, 500000)
+    assert conn.execute('SELECT COUNT(*) FROM fees_payments').fetchone()[0] == 0
@@ -0,0 +1,67 @@
+import gzip
+
+from marks_store import save_students
+from stream_versions import stream_version
+
+QUERY = {'class': 'S1', 'stream': 'A', 'year': 2025, 'term': 'I'}
+
+
+def enrol(conn, count=1, mark=50):
+    save_students(conn, 'S1', [
+        {'std_no': std_no, 'sdt_name': f'STUDENT {std_no}', 'stream': 'A', 'year': 2025, 'term': 'I', 'engBOT': mark}
+        for std_no in range(1, count + 1)
+    ])
+
+
+def test_matching_if_none_match_answers_304(conn, login):
+    enrol(conn)
+    client = login('admin')
+
+    first = client.get('/api/load_data', query_string=QUERY)
+    assert first.status_code == 200 and first.headers['ETag']
+
+    again = client.get('/api/load_data', query_string=QUERY, headers={'If-None-Match': first.headers['ETag']})
+    assert again.status_code == 304
+    assert again.headers['ETag'] == first.headers['ETag']
+    assert again.data == b''
+
+
+def test_a_save_bumps_the_version_and_changes_the_etag(conn, login):
+    enrol(conn)
+    client = login('admin')
+    before = stream_version(conn, 'S1', 'A', 2025, 'I')
+    etag = client.get('/api/load_data', query_string=QUERY).headers['ETag']
+
+    saved = client.post('/api/save_data', json={'class': 'S1', 'students': [
+        {'std_no': 1, 'sdt_name': 'STUDENT 1', 'stream': 'A', 'year': 2025, 'term': 'I', 'engBOT': 75},
+    ]}).get_json()
+    assert saved['success']
+    assert stream_version(conn, 'S1', 'A', 2025, 'I') > before
+
+    fresh = client.get('/api/load_data', query_string=QUERY, headers={'If-None-Match': etag})
+    assert fresh.status_code == 200
+    assert fresh.headers['ETag'] != etag
+    assert fresh.get_json()[0]['engBOT'] == 75
+
+
+def test_other_streams_keep_their_version(conn):
+    enrol(conn)
+    before = stream_version(conn, 'S1', 'B', 2025, 'I')
+    enrol(conn, mark=60)
+    assert stream_version(conn, 'S1', 'B', 2025, 'I') == before
+
+
+def test_compressed_response_keeps_a_weak_etag_that_still_revalidates(conn, login):
+    enrol(conn, count=50)
+    client = login('admin')
+
+    response = client.get('/api/load_data', query_string=QUERY, headers={'Accept-Encoding': 'gzip'})
+    assert response.headers['Content-Encoding'] == 'gzip'
+    assert response.headers['ETag'].startswith('W/')
+    assert len(gzip.decompress(response.data)) > len(response.data)
+
+    again = client.get('/api/load_data', query_string=QUERY, headers={
+        'Accept-Encoding': 'gzip', 'If-None-Match': response.headers['ETag'],
+    })
+    assert again.status_code == 304
+    assert 'Content-Encoding' not in again.headers